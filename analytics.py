@@ -0,0 +1,180 @@
+"""
+تحلیل داده‌های فروش روی یک snapshot ستونی از سفارشات و کاربران
+
+داده‌ها به صورت دسته‌ای از SQLite خوانده و در آرایه‌های NumPy نگه داشته می‌شوند،
+بنابراین کوئری‌های تجمیعی به جای حلقه روی تک‌تک ردیف‌ها برداری اجرا می‌شوند.
+
+مثال:
+    snapshot = OrdersSnapshot.load("shop_bot.db")
+    snapshot.top_customers(10)
+    snapshot.repeat_purchase_rate()
+    snapshot.average_basket_by_shop()
+"""
+from pathlib import Path
+import sqlite3
+
+import numpy as np
+
+from config import DATABASE_NAME
+
+
+# وضعیت‌هایی که خرید واقعی حساب می‌شوند
+PURCHASE_STATUSES = ('payment_confirmed', 'confirmed')
+
+# اندازه دسته در خواندن از دیتابیس
+LOAD_BATCH_SIZE = 50_000
+
+
+def _stream(conn, sql, columns, batch_size, params=()):
+    """خواندن دسته‌ای نتیجه کوئری به آرایه‌های ستونی"""
+    dtype = np.dtype([(f"c{index}", column) for index, column in enumerate(columns)])
+    cursor = conn.execute(sql, params)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        chunks.append(np.fromiter(rows, dtype=dtype, count=len(rows)))
+    
+    table = np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+    return [np.ascontiguousarray(table[name]) for name in dtype.names]
+
+
+class OrdersSnapshot:
+    """snapshot ستونی فقط‌خواندنی از سفارشات و کاربران"""
+    
+    def __init__(self, order_ids, user_ids, totals, status_codes, statuses, packs,
+                 shop_user_ids, shop_codes, shop_names):
+        # ستون‌های سفارش - همه به ترتیب order_id
+        self.order_ids = order_ids
+        self.user_ids = user_ids
+        self.totals = totals
+        self.status_codes = status_codes
+        self.statuses = statuses
+        self.packs = packs
+        
+        # ستون‌های کاربر - به ترتیب user_id
+        self.shop_user_ids = shop_user_ids
+        self.shop_codes = shop_codes
+        self.shop_names = shop_names
+    
+    @classmethod
+    def load(cls, path=DATABASE_NAME, batch_size=LOAD_BATCH_SIZE):
+        """ساخت snapshot با خواندن دسته‌ای جداول (اتصال فقط‌خواندنی)"""
+        uri = Path(path).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            statuses = [row[0] for row in conn.execute(
+                "SELECT DISTINCT status FROM orders WHERE status IS NOT NULL ORDER BY status"
+            )]
+            # وضعیت به صورت کد عددی (اندیس در statuses) خوانده می‌شود
+            status_case = " ".join(f"WHEN ? THEN {code}" for code in range(len(statuses)))
+            status_expr = f"CASE status {status_case} ELSE -1 END" if statuses else "-1"
+            
+            order_ids, user_ids, totals, status_codes = _stream(
+                conn,
+                f"SELECT id, IFNULL(user_id, 0), IFNULL(total_price, 0), {status_expr} FROM orders ORDER BY id",
+                (np.int64, np.int64, np.float64, np.int16),
+                batch_size,
+                statuses,
+            )
+            
+            # تعداد پک هر سفارش - با ایندکس order_items به ترتیب order_id خوانده می‌شود
+            item_order_ids, item_packs = _stream(
+                conn,
+                "SELECT order_id, SUM(quantity) FROM order_items GROUP BY order_id ORDER BY order_id",
+                (np.int64, np.int64),
+                batch_size,
+            )
+            packs = np.zeros(len(order_ids), dtype=np.int64)
+            if len(item_order_ids):
+                positions = np.searchsorted(order_ids, item_order_ids)
+                found = positions < len(order_ids)
+                found[found] = order_ids[positions[found]] == item_order_ids[found]
+                packs[positions[found]] = item_packs[found]
+            
+            shop_names = [""]
+            shop_index = {"": 0}
+            shop_user_ids, shop_codes = [], []
+            cursor = conn.execute("SELECT user_id, IFNULL(shop_name, '') FROM users ORDER BY user_id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for user_id, shop_name in rows:
+                    code = shop_index.get(shop_name)
+                    if code is None:
+                        code = shop_index[shop_name] = len(shop_names)
+                        shop_names.append(shop_name)
+                    shop_user_ids.append(user_id)
+                    shop_codes.append(code)
+        finally:
+            conn.close()
+        
+        return cls(
+            order_ids, user_ids, totals, status_codes, statuses, packs,
+            np.asarray(shop_user_ids, dtype=np.int64),
+            np.asarray(shop_codes, dtype=np.int32),
+            shop_names,
+        )
+    
+    def __len__(self):
+        return len(self.order_ids)
+    
+    def _purchase_mask(self, statuses=PURCHASE_STATUSES):
+        codes = [self.statuses.index(status) for status in statuses if status in self.statuses]
+        return np.isin(self.status_codes, codes)
+    
+    def top_customers(self, limit=10, statuses=PURCHASE_STATUSES):
+        """
+        مشتریان برتر بر اساس مبلغ خرید
+        
+        خروجی: لیست (user_id, تعداد سفارش, مبلغ کل)
+        """
+        mask = self._purchase_mask(statuses)
+        customers, inverse = np.unique(self.user_ids[mask], return_inverse=True)
+        if not len(customers):
+            return []
+        spent = np.bincount(inverse, weights=self.totals[mask])
+        counts = np.bincount(inverse)
+        
+        limit = min(limit, len(customers))
+        top = np.argpartition(-spent, limit - 1)[:limit]
+        top = top[np.argsort(-spent[top], kind='stable')]
+        return [(int(customers[i]), int(counts[i]), float(spent[i])) for i in top]
+    
+    def repeat_purchase_rate(self, statuses=PURCHASE_STATUSES):
+        """نسبت مشتریانی که بیش از یک خرید داشته‌اند"""
+        mask = self._purchase_mask(statuses)
+        _, counts = np.unique(self.user_ids[mask], return_counts=True)
+        if not len(counts):
+            return 0.0
+        return float(np.count_nonzero(counts > 1) / len(counts))
+    
+    def average_basket_by_shop(self, statuses=PURCHASE_STATUSES):
+        """
+        میانگین سبد خرید هر فروشگاه
+        
+        خروجی: دیکشنری {نام فروشگاه: (تعداد سفارش, میانگین تعداد پک, میانگین مبلغ)}
+        """
+        mask = self._purchase_mask(statuses)
+        user_ids = self.user_ids[mask]
+        
+        # کد فروشگاه هر سفارش - کاربر ناشناخته = فروشگاه بی‌نام (کد 0)
+        shops = np.zeros(len(user_ids), dtype=np.int32)
+        if len(self.shop_user_ids):
+            positions = np.searchsorted(self.shop_user_ids, user_ids)
+            positions[positions >= len(self.shop_user_ids)] = 0
+            found = self.shop_user_ids[positions] == user_ids
+            shops[found] = self.shop_codes[positions[found]]
+        
+        size = len(self.shop_names)
+        counts = np.bincount(shops, minlength=size)
+        packs = np.bincount(shops, weights=self.packs[mask], minlength=size)
+        totals = np.bincount(shops, weights=self.totals[mask], minlength=size)
+        
+        return {
+            self.shop_names[code]: (int(counts[code]), float(packs[code] / counts[code]), float(totals[code] / counts[code]))
+            for code in np.flatnonzero(counts)
+        }
+
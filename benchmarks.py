@@ -0,0 +1,576 @@
+"""
+بنچمارک‌های عملکرد ربات
+
+اجرا:
+    python benchmarks.py analytics --orders 1000000
+    python benchmarks.py cart --clients 200 --taps 20
+    python benchmarks.py webhook --updates 500 --rate 100 --rtt 50
+    python benchmarks.py updates --updates 2000 --workers 1 4 16 64
+    python benchmarks.py lanes --surge 3000 --admin 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+from config import ADMIN_ID
+from database import Database, AsyncDatabase
+from update_processor import KeyedUpdateProcessor
+
+
+STATUSES = ('pending', 'waiting_payment', 'receipt_sent', 'payment_confirmed', 'confirmed', 'rejected')
+
+
+def timed(label, func, *args, **kwargs):
+    """اجرای تابع و چاپ زمان آن"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<40} {elapsed * 1000:>10.1f} ms")
+    return result, elapsed
+
+
+def make_synthetic_db(path, orders, users, products=200, batch_size=50_000, seed=1):
+    """ساخت دیتابیس مصنوعی با تعداد مشخص سفارش و کاربر"""
+    rng = random.Random(seed)
+    db = Database(path)
+    db.close()
+    
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    with conn:
+        conn.executemany(
+            "INSERT INTO products (id, name, description) VALUES (?, ?, '')",
+            [(product_id, f"محصول {product_id}") for product_id in range(1, products + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO packs (id, product_id, name, quantity, price) VALUES (?, ?, ?, ?, ?)",
+            [
+                (product_id * 3 + size, product_id, f"پک {size * 3 + 3} تایی", size * 3 + 3, (size + 1) * 250_000)
+                for product_id in range(1, products + 1) for size in range(3)
+            ]
+        )
+        shops = [f"فروشگاه {shop}" for shop in range(users // 20 + 1)]
+        conn.executemany(
+            "INSERT INTO users (user_id, username, first_name, shop_name) VALUES (?, ?, ?, ?)",
+            [(100_000 + user, f"user{user}", "کاربر", rng.choice(shops)) for user in range(users)]
+        )
+    
+    order_id = 0
+    while order_id < orders:
+        order_rows, item_rows = [], []
+        for order_id in range(order_id + 1, min(order_id + batch_size, orders) + 1):
+            total = 0
+            for _ in range(rng.randint(1, 4)):
+                product_id = rng.randint(1, products)
+                size = rng.randint(0, 2)
+                quantity = rng.randint(1, 5)
+                price = (size + 1) * 250_000
+                total += quantity * price
+                item_rows.append((order_id, product_id, product_id * 3 + size,
+                                  f"محصول {product_id}", f"پک {size * 3 + 3} تایی", quantity, price))
+            order_rows.append((order_id, 100_000 + rng.randrange(users), total, rng.choice(STATUSES)))
+        with conn:
+            conn.executemany(
+                "INSERT INTO orders (id, user_id, total_price, status) VALUES (?, ?, ?, ?)", order_rows
+            )
+            conn.executemany("""
+                INSERT INTO order_items
+                    (order_id, product_id, pack_id, product_name, pack_name, quantity, unit_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, item_rows)
+    conn.close()
+
+
+def naive_analytics(path, statuses=('payment_confirmed', 'confirmed'), limit=10):
+    """همان کوئری‌های analytics با SQL و حلقه‌های پایتون روی تک‌تک ردیف‌ها"""
+    conn = sqlite3.connect(path)
+    placeholders = ", ".join("?" * len(statuses))
+    packs = dict(conn.execute("SELECT order_id, SUM(quantity) FROM order_items GROUP BY order_id"))
+    shops = dict(conn.execute("SELECT user_id, IFNULL(shop_name, '') FROM users"))
+    
+    spent = defaultdict(float)
+    counts = defaultdict(int)
+    shop_stats = defaultdict(lambda: [0, 0, 0.0])
+    for order_id, user_id, total in conn.execute(
+        f"SELECT id, user_id, total_price FROM orders WHERE status IN ({placeholders})", statuses
+    ):
+        spent[user_id] += total
+        counts[user_id] += 1
+        stats = shop_stats[shops.get(user_id, "")]
+        stats[0] += 1
+        stats[1] += packs.get(order_id, 0)
+        stats[2] += total
+    conn.close()
+    
+    top = sorted(spent.items(), key=lambda item: -item[1])[:limit]
+    repeat = sum(1 for count in counts.values() if count > 1) / len(counts) if counts else 0.0
+    baskets = {shop: (n, p / n, t / n) for shop, (n, p, t) in shop_stats.items()}
+    return [(user_id, counts[user_id], total) for user_id, total in top], repeat, baskets
+
+
+def bench_analytics(args):
+    from analytics import OrdersSnapshot
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        print(f"ساخت دیتابیس مصنوعی: {args.orders:,} سفارش، {args.users:,} کاربر")
+        timed("make_synthetic_db", make_synthetic_db, path, args.orders, args.users)
+        
+        print("\nSQL + حلقه پایتون:")
+        (naive_top, naive_repeat, naive_baskets), naive_time = timed("all queries", naive_analytics, path)
+        
+        print("\nsnapshot ستونی:")
+        snapshot, load_time = timed("OrdersSnapshot.load", OrdersSnapshot.load, path)
+        top, t1 = timed("top_customers", snapshot.top_customers)
+        repeat, t2 = timed("repeat_purchase_rate", snapshot.repeat_purchase_rate)
+        baskets, t3 = timed("average_basket_by_shop", snapshot.average_basket_by_shop)
+        query_time = t1 + t2 + t3
+        
+        # با مبلغ برابر ترتیب مشتریان می‌تواند فرق کند - مبالغ مقایسه می‌شوند
+        assert [round(row[2]) for row in top] == [round(row[2]) for row in naive_top]
+        assert abs(repeat - naive_repeat) < 1e-9
+        assert baskets.keys() == naive_baskets.keys()
+        
+        print(f"\nکوئری‌ها روی snapshot {naive_time / query_time:.0f} برابر سریع‌تر "
+              f"(با احتساب load: {naive_time / (load_time + query_time):.1f} برابر)")
+
+
+async def tap_cart(db, clients, taps, products, seed=1):
+    """کلیک هم‌زمان clients کاربر، هر کدام taps بار، روی دکمه‌های پک"""
+    rng = random.Random(seed)
+    
+    async def client(user_id):
+        for _ in range(taps):
+            product_id = rng.randint(1, products)
+            await db.add_to_cart(user_id, product_id, product_id * 3 + rng.randint(0, 2))
+    
+    await asyncio.gather(*(client(100_000 + user) for user in range(clients)))
+
+
+def bench_cart(args):
+    products = 50
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        make_synthetic_db(path, 0, args.clients, products=products)
+        writes = args.clients * args.taps
+        print(f"{args.clients} کاربر هم‌زمان × {args.taps} کلیک = {writes:,} افزودن به سبد "
+              f"(synchronous = {args.synchronous})\n")
+        
+        rates = {}
+        for label, group_commit in (("commit برای هر کلیک", False), ("group commit", True)):
+            db = AsyncDatabase(Database(path), group_commit=group_commit)
+            # با FULL هر commit یک fsync دارد - مثل دیسک کند یا WAL بدون NORMAL
+            db.db.conn.execute(f"PRAGMA synchronous = {args.synchronous}")
+            _, elapsed = timed(label, asyncio.run, tap_cart(db, args.clients, args.taps, products))
+            rates[group_commit] = writes / elapsed
+            
+            total = db.db.conn.execute("SELECT SUM(quantity) FROM cart").fetchone()[0]
+            assert total == writes, total
+            db.db.conn.execute("DELETE FROM cart")
+            db.db.conn.commit()
+            db.close()
+        
+        print(f"\n{rates[False]:,.0f} → {rates[True]:,.0f} نوشتن در ثانیه "
+              f"({rates[True] / rates[False]:.1f} برابر)")
+
+
+# ==================== webhook در برابر polling ====================
+
+class FakeBotApi(BaseRequest):
+    """
+    Bot API محلی برای بنچمارک - به جای HTTPXRequest به Application داده می‌شود
+    
+    هر درخواست rtt ثانیه رفت و برگشت شبکه می‌گیرد. getUpdates مثل long-poll واقعی
+    تا رسیدن آپدیت در صف updates یا تمام شدن timeout منتظر می‌ماند.
+    """
+    
+    def __init__(self, rtt, updates):
+        self.rtt = rtt
+        self.updates = updates
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        endpoint = url.rsplit("/", 1)[-1]
+        await asyncio.sleep(self.rtt / 2)
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif endpoint == "getUpdates":
+            timeout = request_data.parameters.get("timeout", 0) if request_data else 0
+            try:
+                result = [await asyncio.wait_for(self.updates.get(), timeout)]
+            except asyncio.TimeoutError:
+                result = []
+            while not self.updates.empty():
+                result.append(self.updates.get_nowait())
+        else:
+            result = True
+        await asyncio.sleep(self.rtt / 2)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def recorded_updates(count, seed=1):
+    """آپدیت‌های JSON به شکل همان چیزی که تلگرام می‌فرستد - پیام متنی و کلیک دکمه پک"""
+    rng = random.Random(seed)
+    updates = []
+    for update_id in range(1, count + 1):
+        user = {"id": 100_000 + rng.randint(0, 999), "is_bot": False, "first_name": "user"}
+        chat = {"id": user["id"], "type": "private", "first_name": "user"}
+        message = {"message_id": update_id, "date": 1_700_000_000, "chat": chat, "from": user, "text": "🛒 سبد خرید"}
+        product_id = rng.randint(1, 50)
+        if rng.random() < 0.7:
+            updates.append({"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": "1", "message": message,
+                "data": f"select_pack:{product_id}:{product_id * 3 + rng.randint(0, 2)}",
+            }})
+        else:
+            updates.append({"update_id": update_id, "message": message})
+    return updates
+
+
+def bench_application(rtt, updates_queue, latencies, sent_at, done, total):
+    """Application با Bot API محلی و یک هندلر که تاخیر رسیدن هر آپدیت را ثبت می‌کند"""
+    async def record(update, context):
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+        if len(latencies) == total:
+            done.set()
+    
+    application = (
+        Application.builder()
+        .token("1:bench")
+        .request(FakeBotApi(rtt, updates_queue))
+        .get_updates_request(FakeBotApi(rtt, updates_queue))
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, record))
+    return application
+
+
+async def run_polling_bench(updates, rate, rtt):
+    queue, latencies, sent_at, done = asyncio.Queue(), [], {}, asyncio.Event()
+    application = bench_application(rtt, queue, latencies, sent_at, done, len(updates))
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        for update in updates:
+            sent_at[update["update_id"]] = time.perf_counter()
+            # آپدیت همان لحظه به سرور تلگرام رسیده است
+            queue.put_nowait(update)
+            await asyncio.sleep(1 / rate)
+        await done.wait()
+        await application.updater.stop()
+        await application.stop()
+    return latencies
+
+
+async def run_webhook_bench(updates, rate, rtt):
+    import aiohttp
+    from webhook import serve_webhook, SECRET_HEADER
+    
+    queue, latencies, sent_at, done = asyncio.Queue(), [], {}, asyncio.Event()
+    application = bench_application(rtt, queue, latencies, sent_at, done, len(updates))
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    
+    stop = asyncio.Event()
+    secret = "bench-secret"
+    server = asyncio.create_task(serve_webhook(application, "127.0.0.1", port, "", "/telegram", stop, secret))
+    headers = {SECRET_HEADER: secret}
+    url = f"http://127.0.0.1:{port}/telegram"
+    
+    async with aiohttp.ClientSession() as session:
+        # صبر تا بالا آمدن سرور
+        while True:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/health") as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+        
+        async def deliver(update):
+            # تلگرام آپدیت را با نصف rtt به سرور ما می‌رساند
+            await asyncio.sleep(rtt / 2)
+            async with session.post(url, data=json.dumps(update), headers=headers) as response:
+                assert response.status == 200, response.status
+        
+        tasks = []
+        for update in updates:
+            sent_at[update["update_id"]] = time.perf_counter()
+            tasks.append(asyncio.create_task(deliver(update)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*tasks)
+        await done.wait()
+        
+        async with session.post(url, data="{}", headers={SECRET_HEADER: "wrong"}) as response:
+            assert response.status == 403, response.status
+    
+    stop.set()
+    await server
+    return latencies
+
+
+def bench_webhook(args):
+    updates = recorded_updates(args.updates)
+    rtt = args.rtt / 1000
+    print(f"{args.updates} آپدیت با نرخ {args.rate}/ثانیه، رفت و برگشت شبکه {args.rtt} ms\n")
+    print(f"  {'':<10} {'p50':>10} {'p95':>10} {'max':>10}")
+    
+    results = {}
+    for label, bench in (("polling", run_polling_bench), ("webhook", run_webhook_bench)):
+        latencies = sorted(asyncio.run(bench(updates, args.rate, rtt)))
+        p50 = statistics.median(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        results[label] = p50
+        print(f"  {label:<10} {p50 * 1000:>8.1f}ms {p95 * 1000:>8.1f}ms {latencies[-1] * 1000:>8.1f}ms")
+    
+    print(f"\nمیانه تاخیر تا اجرای هندلر: {results['polling'] * 1000:.1f} → {results['webhook'] * 1000:.1f} ms")
+
+
+# ==================== پردازش هم‌زمان آپدیت‌ها ====================
+
+async def process_stream(db, updates, workers, api_latency, slow_latency):
+    """
+    پردازش جریان آپدیت‌ها با KeyedUpdateProcessor
+    
+    کلیک پک واقعاً به سبد اضافه می‌کند و یک پاسخ API می‌فرستد؛ از هر ده پیام یکی
+    هندلر کند است (مثل لیست محصولات با عکس). خروجی: (زمان کل, تاخیرها, ترتیب هر کاربر)
+    """
+    received, latencies, order = {}, [], defaultdict(list)
+    done = asyncio.Event()
+    
+    async def handle(update, context):
+        user_id = update.effective_user.id
+        order[user_id].append(update.update_id)
+        if update.callback_query:
+            _, product_id, pack_id = update.callback_query.data.split(":")
+            await db.add_to_cart(user_id, int(product_id), int(pack_id))
+            await asyncio.sleep(api_latency)
+        elif update.update_id % 10 == 0:
+            await asyncio.sleep(slow_latency)
+        else:
+            await asyncio.sleep(api_latency)
+        latencies.append(time.perf_counter() - received[update.update_id])
+        if len(latencies) == len(updates):
+            done.set()
+    
+    queue = asyncio.Queue()
+    application = (
+        Application.builder()
+        .token("1:bench")
+        .request(FakeBotApi(0, queue))
+        .get_updates_request(FakeBotApi(0, queue))
+        .concurrent_updates(KeyedUpdateProcessor(workers))
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handle))
+    
+    async with application:
+        await application.start()
+        start = time.perf_counter()
+        for data in updates:
+            received[data["update_id"]] = time.perf_counter()
+            application.update_queue.put_nowait(Update.de_json(data, application.bot))
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        await application.stop()
+    return elapsed, sorted(latencies), order
+
+
+def bench_updates(args):
+    updates = recorded_updates(args.updates)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        make_synthetic_db(path, 0, 1000, products=50)
+        print(f"{args.updates:,} آپدیت (۷۰٪ کلیک پک، ۳۰٪ پیام که یک دهم آن‌ها {args.slow:.0f} ms طول می‌کشد)، "
+              f"تاخیر API {args.api:.0f} ms\n")
+        print(f"  {'workers':<10} {'آپدیت/ثانیه':>12} {'p50':>10} {'p95':>10}")
+        
+        rates = {}
+        for workers in args.workers:
+            db = AsyncDatabase(Database(path), group_commit=True)
+            elapsed, latencies, order = asyncio.run(
+                process_stream(db, updates, workers, args.api / 1000, args.slow / 1000)
+            )
+            db.close()
+            
+            # آپدیت‌های هر کاربر باید به ترتیب رسیدن پردازش شده باشند
+            assert all(ids == sorted(ids) for ids in order.values())
+            rates[workers] = len(updates) / elapsed
+            p50 = statistics.median(latencies)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"  {workers:<10} {rates[workers]:>12,.0f} {p50 * 1000:>8.0f}ms {p95 * 1000:>8.0f}ms")
+        
+        first, last = args.workers[0], args.workers[-1]
+        print(f"\n{first} → {last} worker: {rates[last] / rates[first]:.1f} برابر، ترتیب آپدیت‌های هر کاربر حفظ شد")
+
+
+# ==================== lane های اولویت ====================
+
+def surge_updates(count, admin_taps, seed=1):
+    """
+    هجوم کلیک پک بعد از انتشار محصول و کلیک‌های ادمین در میان آن
+    
+    خروجی: (کلیک‌های مشتری, کلیک‌های ادمین) - JSON به شکل آپدیت تلگرام
+    """
+    rng = random.Random(seed)
+    
+    def callback(update_id, user_id, data):
+        user = {"id": user_id, "is_bot": False, "first_name": "user"}
+        chat = {"id": user_id, "type": "private", "first_name": "user"}
+        message = {"message_id": update_id, "date": 1_700_000_000, "chat": chat, "from": user, "text": "-"}
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": "1", "message": message, "data": data,
+        }}
+    
+    customers = []
+    for update_id in range(1, count + 1):
+        product_id = rng.randint(1, 50)
+        customers.append(callback(update_id, 100_000 + rng.randint(0, 999),
+                                  f"select_pack:{product_id}:{product_id * 3 + rng.randint(0, 2)}"))
+    admin = [callback(count + index + 1, ADMIN_ID, f"confirm_payment:{index + 1}") for index in range(admin_taps)]
+    return customers, admin
+
+
+async def run_surge(db, customers, admin, processor, api_latency, interval):
+    """
+    ارسال همه کلیک‌های مشتری با هم و کلیک‌های ادمین با فاصله interval
+    
+    خروجی: (تاخیر کلیک‌های ادمین تا پایان هندلر, آمار پردازشگر)
+    """
+    received, admin_latencies = {}, []
+    total = len(customers) + len(admin)
+    processed = 0
+    done = asyncio.Event()
+    
+    async def handle(update, context):
+        nonlocal processed
+        query = update.callback_query
+        if query.data.startswith("select_pack:"):
+            _, product_id, pack_id = query.data.split(":")
+            await db.add_to_cart(update.effective_user.id, int(product_id), int(pack_id))
+        await asyncio.sleep(api_latency)
+        if update.effective_user.id == ADMIN_ID:
+            admin_latencies.append(time.perf_counter() - received[update.update_id])
+        processed += 1
+        if processed == total:
+            done.set()
+    
+    queue = asyncio.Queue()
+    application = (
+        Application.builder()
+        .token("1:bench")
+        .request(FakeBotApi(0, queue))
+        .get_updates_request(FakeBotApi(0, queue))
+        .concurrent_updates(processor)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handle))
+    
+    async with application:
+        await application.start()
+        for data in customers:
+            received[data["update_id"]] = time.perf_counter()
+            application.update_queue.put_nowait(Update.de_json(data, application.bot))
+        for data in admin:
+            await asyncio.sleep(interval)
+            received[data["update_id"]] = time.perf_counter()
+            application.update_queue.put_nowait(Update.de_json(data, application.bot))
+        await done.wait()
+        await application.stop()
+    return sorted(admin_latencies), processor.stats()
+
+
+def bench_lanes(args):
+    customers, admin = surge_updates(args.surge, args.admin)
+    # کلیک‌های ادمین در طول هجوم پخش می‌شوند
+    interval = args.surge * args.api / 1000 / args.workers / args.admin
+    
+    runs = (
+        ("بدون هجوم", [], {}),
+        ("هجوم، یک صف", customers, {'lane_of': lambda update: 'info', 'reserved': 0}),
+        ("هجوم، lane ها", customers, {}),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        make_synthetic_db(path, 0, 1000, products=50)
+        print(f"{args.surge:,} کلیک پک هم‌زمان، {args.admin} کلیک ادمین هر {interval * 1000:.0f} ms، "
+              f"{args.workers} worker، تاخیر API {args.api:.0f} ms\n")
+        print(f"  {'':<16} {'ادمین p50':>10} {'p95':>10} {'max':>10} {'بیشترین صف cart':>16}")
+        
+        results = {}
+        for label, surge, options in runs:
+            db = AsyncDatabase(Database(path), group_commit=True)
+            processor = KeyedUpdateProcessor(args.workers, **options)
+            latencies, stats = asyncio.run(run_surge(db, surge, admin, processor, args.api / 1000, interval))
+            db.close()
+            
+            p50 = statistics.median(latencies)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            results[label] = p95
+            queued = stats['lanes']['cart']['peak_waiting'] or stats['lanes']['info']['peak_waiting']
+            print(f"  {label:<16} {p50 * 1000:>8.0f}ms {p95 * 1000:>8.0f}ms {latencies[-1] * 1000:>8.0f}ms {queued:>16,}")
+        
+        print(f"\np95 تاخیر ادمین در هجوم: {results['هجوم، یک صف'] * 1000:.0f} → "
+              f"{results['هجوم، lane ها'] * 1000:.0f} ms (بدون هجوم {results['بدون هجوم'] * 1000:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک‌های ربات فروشگاه")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    analytics = commands.add_parser("analytics", help="snapshot ستونی در برابر SQL + پایتون")
+    analytics.add_argument("--orders", type=int, default=1_000_000)
+    analytics.add_argument("--users", type=int, default=50_000)
+    analytics.set_defaults(func=bench_analytics)
+    
+    cart = commands.add_parser("cart", help="group commit در برابر commit جدا برای هر افزودن به سبد")
+    cart.add_argument("--clients", type=int, default=200)
+    cart.add_argument("--taps", type=int, default=20)
+    cart.add_argument("--synchronous", choices=("NORMAL", "FULL"), default="NORMAL")
+    cart.set_defaults(func=bench_cart)
+    
+    webhook = commands.add_parser("webhook", help="تاخیر رسیدن آپدیت به هندلر: webhook در برابر polling")
+    webhook.add_argument("--updates", type=int, default=500)
+    webhook.add_argument("--rate", type=float, default=100, help="آپدیت در ثانیه")
+    webhook.add_argument("--rtt", type=float, default=50, help="رفت و برگشت شبکه تا تلگرام (ms)")
+    webhook.set_defaults(func=bench_webhook)
+    
+    updates = commands.add_parser("updates", help="مقیاس‌پذیری پردازش هم‌زمان آپدیت‌ها با تعداد worker")
+    updates.add_argument("--updates", type=int, default=2000)
+    updates.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 64])
+    updates.add_argument("--api", type=float, default=20, help="تاخیر هر درخواست API (ms)")
+    updates.add_argument("--slow", type=float, default=500, help="مدت هندلرهای کند (ms)")
+    updates.set_defaults(func=bench_updates)
+    
+    lanes = commands.add_parser("lanes", help="تاخیر کلیک‌های ادمین در هجوم کلیک پک: lane ها در برابر یک صف")
+    lanes.add_argument("--surge", type=int, default=3000)
+    lanes.add_argument("--admin", type=int, default=40)
+    lanes.add_argument("--workers", type=int, default=16)
+    lanes.add_argument("--api", type=float, default=20, help="تاخیر هر درخواست API (ms)")
+    lanes.set_defaults(func=bench_lanes)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+ارسال همگانی پیام ادمین به همه کاربران
+
+گیرنده‌ها به ترتیب user_id و در دسته‌های keyset از دیتابیس خوانده می‌شوند، پس در
+هر لحظه فقط یک دسته در حافظه است. نتیجه هر گیرنده همان لحظه در broadcast_deliveries
+ثبت می‌شود و بعد از هر دسته مکان‌نمای ارسال جلو می‌رود؛ ارسالی که با ری‌استارت ربات
+قطع شده در post_init از همان‌جا ادامه پیدا می‌کند و به کسی دو بار فرستاده نمی‌شود.
+
+پیام با copy_message فرستاده می‌شود (متن، عکس یا هر نوع پیام دیگر) و ارسال‌ها با
+اولویت پایین از زمان‌بند خروجی رد می‌شوند؛ یعنی با بیشترین سرعت مجاز پیش می‌روند
+ولی پاسخ ربات به کاربرها را عقب نمی‌اندازند.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from keyboards import broadcast_progress_keyboard
+from outbox import PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+# تعداد گیرنده در هر دسته keyset - همه ارسال‌های یک دسته هم‌زمان در صف outbox می‌روند
+BROADCAST_BATCH_SIZE = 100
+
+# فاصله بروزرسانی پیام پیشرفت
+PROGRESS_INTERVAL = 5  # ثانیه
+
+# تعداد تلاش برای هر گیرنده وقتی تلگرام RetryAfter می‌دهد - بعد از آن failed ثبت می‌شود
+DELIVERY_ATTEMPTS = 3
+
+BROADCAST_STATUS_LABELS = {
+    'running': "⏳ در حال ارسال",
+    'done': "✅ تمام شد",
+    'cancelled': "⏹ متوقف شد",
+}
+
+
+def format_duration(seconds):
+    """نمایش مدت به صورت ساعت:دقیقه:ثانیه"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def progress_text(broadcast, rate=None):
+    """متن پیام پیشرفت - rate تعداد گیرنده در ثانیه در اجرای فعلی است"""
+    processed = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+    # کاربرانی که وسط ارسال عضو شده‌اند هم گیرنده هستند
+    total = max(broadcast['total'], processed)
+    percent = processed * 100 // total if total else 100
+    
+    text = f"📣 ارسال همگانی #{broadcast['id']}\n"
+    text += f"{BROADCAST_STATUS_LABELS.get(broadcast['status'], broadcast['status'])}\n\n"
+    text += f"📊 {processed:,} از {total:,} ({percent}%)\n"
+    text += f"✅ ارسال شده: {broadcast['sent']:,}\n"
+    text += f"🚫 بلاک کرده: {broadcast['blocked']:,}\n"
+    text += f"⚠️ ناموفق: {broadcast['failed']:,}\n"
+    
+    if broadcast['status'] == 'running' and rate:
+        text += f"\n⚡️ {rate:.1f} پیام در ثانیه - زمان باقی‌مانده: {format_duration((total - processed) / rate)}"
+    return text
+
+
+async def deliver(bot, broadcast, user_id, cancelled=None):
+    """
+    ارسال پیام به یک گیرنده - خروجی: وضعیت تحویل (sent، blocked یا failed)
+    
+    cancelled تابع async ای است که بین تلاش‌ها بررسی می‌شود؛ اگر ارسال متوقف شده
+    باشد None برمی‌گردد و چیزی برای این گیرنده ثبت نمی‌شود.
+    """
+    # rate_limit_args بدون rate limiter خطا می‌دهد
+    extra = {'rate_limit_args': {'priority': PRIORITY_LOW}} if bot.rate_limiter else {}
+    for attempt in range(1, DELIVERY_ATTEMPTS + 1):
+        try:
+            await bot.copy_message(user_id, broadcast['from_chat_id'], broadcast['message_id'], **extra)
+            return 'sent'
+        except RetryAfter as exc:
+            if attempt == DELIVERY_ATTEMPTS:
+                logger.warning(f"ارسال همگانی #{broadcast['id']} به {user_id}: بعد از {attempt} RetryAfter رها شد")
+                return 'failed'
+            await asyncio.sleep(exc.retry_after)
+            if cancelled is not None and await cancelled():
+                return None
+        except Forbidden:
+            return 'blocked'
+        except BadRequest as exc:
+            if "chat not found" in str(exc).lower():
+                return 'blocked'
+            logger.warning(f"ارسال همگانی #{broadcast['id']} به {user_id}: {exc}")
+            return 'failed'
+        except TelegramError as exc:
+            logger.warning(f"ارسال همگانی #{broadcast['id']} به {user_id}: {exc}")
+            return 'failed'
+
+
+async def show_progress(bot, broadcast, rate=None):
+    """ویرایش پیام پیشرفت - خطای ویرایش ارسال را متوقف نمی‌کند"""
+    if not broadcast['progress_message_id']:
+        return
+    keyboard = broadcast_progress_keyboard(broadcast['id']) if broadcast['status'] == 'running' else None
+    try:
+        await bot.edit_message_text(
+            progress_text(broadcast, rate),
+            chat_id=broadcast['progress_chat_id'],
+            message_id=broadcast['progress_message_id'],
+            reply_markup=keyboard
+        )
+    except TelegramError as exc:
+        if "not modified" not in str(exc).lower():
+            logger.warning(f"بروزرسانی پیشرفت ارسال همگانی #{broadcast['id']}: {exc}")
+
+
+async def run_broadcast(application, broadcast_id):
+    """اجرای یک ارسال همگانی تا پایان گیرنده‌ها یا توقف توسط ادمین"""
+    db = application.bot_data['db']
+    bot = application.bot
+    broadcast = await db.get_broadcast(broadcast_id)
+    after_user_id = broadcast['last_user_id']
+    
+    started = time.monotonic()
+    last_progress = started
+    processed = 0
+    
+    async def cancelled():
+        # دکمه توقف وضعیت را در دیتابیس عوض می‌کند
+        return (await db.get_broadcast(broadcast_id))['status'] != 'running'
+    
+    async def send(user_id):
+        status = await deliver(bot, broadcast, user_id, cancelled)
+        if status:
+            await db.record_delivery(broadcast_id, user_id, status)
+    
+    while broadcast['status'] == 'running':
+        recipients = await db.get_broadcast_recipients(broadcast_id, after_user_id, BROADCAST_BATCH_SIZE)
+        if not recipients:
+            await db.finish_broadcast(broadcast_id, 'done')
+            broadcast = await db.get_broadcast(broadcast_id)
+            break
+        
+        await asyncio.gather(*(send(user_id) for user_id in recipients))
+        after_user_id = recipients[-1]
+        await db.advance_broadcast(broadcast_id, after_user_id)
+        processed += len(recipients)
+        
+        # وضعیت از دیتابیس خوانده می‌شود تا دکمه توقف در دسته بعد اثر کند
+        broadcast = await db.get_broadcast(broadcast_id)
+        now = time.monotonic()
+        if now - last_progress >= PROGRESS_INTERVAL:
+            last_progress = now
+            await show_progress(bot, broadcast, processed / (now - started))
+    
+    logger.info(f"ارسال همگانی #{broadcast_id}: {broadcast['status']} - "
+                f"{broadcast['sent']} ارسال، {broadcast['blocked']} بلاک، {broadcast['failed']} ناموفق")
+    await show_progress(bot, broadcast)
+
+
+def start_broadcast(application, broadcast_id):
+    """اجرای ارسال همگانی در پس‌زمینه - تسک در bot_data['broadcasts'] نگه داشته می‌شود"""
+    tasks = application.bot_data.setdefault('broadcasts', {})
+    
+    # تسک در context خالی ساخته می‌شود تا به واحد کار آپدیتی که آن را شروع کرده وصل نماند
+    task = contextvars.Context().run(
+        asyncio.create_task, run_broadcast(application, broadcast_id), name=f"broadcast_{broadcast_id}"
+    )
+    tasks[broadcast_id] = task
+    
+    def finished(task):
+        tasks.pop(broadcast_id, None)
+        if not task.cancelled() and task.exception():
+            logger.error(f"ارسال همگانی #{broadcast_id} با خطا متوقف شد: {task.exception()}")
+    
+    task.add_done_callback(finished)
+    return task
+
+
+# ==================== چرخه عمر اپلیکیشن ====================
+
+async def resume_broadcasts(application):
+    """post_init: ادامه ارسال‌هایی که با توقف ربات نیمه‌تمام ماندند"""
+    for broadcast in await application.bot_data['db'].get_running_broadcasts():
+        logger.info(f"ادامه ارسال همگانی #{broadcast['id']} از کاربر {broadcast['last_user_id']}")
+        start_broadcast(application, broadcast['id'])
+
+
+async def stop_broadcasts(application):
+    """post_stop: متوقف کردن تسک‌ها - وضعیت running می‌ماند تا اجرای بعدی ادامه دهد"""
+    tasks = list(application.bot_data.get('broadcasts', {}).values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,184 @@
+"""
+کش کاتالوگ محصولات و پک‌ها در حافظه
+
+کاتالوگ فقط با add_product، add_pack، delete_product و delete_pack تغییر می‌کند و
+همین متدها کش را بروز می‌کنند، پس خواندن‌های پرتکرار به دیتابیس نمی‌رسند.
+شناسه‌هایی که در دیتابیس نیستند (مثل دکمه‌های کانال برای محصول حذف شده) هم کش
+می‌شوند.
+"""
+import threading
+from collections import OrderedDict
+
+# سقف شناسه‌های ناموجود کش شده از هر نوع - callback_data ساختگی حافظه را پر نمی‌کند
+MISSING_LIMIT = 1000
+
+
+class Product:
+    """رکورد محصول"""
+    __slots__ = ('id', 'name', 'description', 'photo_id', 'created_at')
+    
+    def __init__(self, id, name, description, photo_id, created_at=None):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.photo_id = photo_id
+        self.created_at = created_at
+    
+    def __repr__(self):
+        return f"Product(id={self.id}, name={self.name!r})"
+
+
+class Pack:
+    """رکورد پک"""
+    __slots__ = ('id', 'product_id', 'name', 'quantity', 'price')
+    
+    def __init__(self, id, product_id, name, quantity, price):
+        self.id = id
+        self.product_id = product_id
+        self.name = name
+        self.quantity = quantity
+        self.price = price
+    
+    def __repr__(self):
+        return f"Pack(id={self.id}, product_id={self.product_id}, name={self.name!r})"
+
+
+class CatalogCache:
+    """
+    کش read-through کاتالوگ با شمارنده hit/miss
+    
+    خواندن‌ها از ترد‌های مختلف انجام می‌شوند؛ version جلوی ذخیره نتیجه کهنه‌ای را
+    می‌گیرد که قبل از یک تغییر از دیتابیس خوانده شده ولی بعد از آن می‌رسد.
+    """
+    
+    def __init__(self):
+        self._products = {}
+        self._packs = {}
+        self._product_packs = {}
+        # شناسه‌های ناموجود - LRU محدود
+        self._missing_products = OrderedDict()
+        self._missing_packs = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+    
+    # ==================== خواندن ====================
+    
+    def lookup_product(self, product_id):
+        """
+        محصول از کش
+        
+        خروجی: (found, product) - found=False یعنی miss؛ product=None با found=True یعنی
+        محصول در دیتابیس نیست
+        """
+        product = self._products.get(product_id)
+        found = product is not None or product_id in self._missing_products
+        self._count(found)
+        return found, product
+    
+    def lookup_pack(self, pack_id):
+        """پک از کش - خروجی مثل lookup_product"""
+        pack = self._packs.get(pack_id)
+        found = pack is not None or pack_id in self._missing_packs
+        self._count(found)
+        return found, pack
+    
+    def get_packs(self, product_id):
+        """لیست پک‌های محصول از کش - None یعنی miss"""
+        packs = self._product_packs.get(product_id)
+        self._count(packs is not None)
+        return None if packs is None else list(packs)
+    
+    def stats(self):
+        """آمار کش"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'products': len(self._products),
+            'packs': len(self._packs),
+            'missing': len(self._missing_products) + len(self._missing_packs),
+        }
+    
+    # ==================== پر کردن بعد از miss ====================
+    
+    def store_product(self, product, version):
+        with self._lock:
+            if version == self.version:
+                self._products[product.id] = product
+    
+    def store_pack(self, pack, version):
+        with self._lock:
+            if version == self.version:
+                self._packs[pack.id] = pack
+    
+    @staticmethod
+    def _add_missing(missing, key):
+        missing[key] = True
+        missing.move_to_end(key)
+        if len(missing) > MISSING_LIMIT:
+            missing.popitem(last=False)
+    
+    def store_missing_product(self, product_id, version):
+        with self._lock:
+            if version == self.version:
+                self._add_missing(self._missing_products, product_id)
+    
+    def store_missing_pack(self, pack_id, version):
+        with self._lock:
+            if version == self.version:
+                self._add_missing(self._missing_packs, pack_id)
+    
+    def store_packs(self, product_id, packs, version):
+        with self._lock:
+            if version == self.version:
+                self._product_packs[product_id] = tuple(packs)
+                for pack in packs:
+                    self._packs[pack.id] = pack
+    
+    # ==================== بروزرسانی توسط تغییر دهنده‌ها ====================
+    
+    def product_added(self, product):
+        with self._lock:
+            self.version += 1
+            self._products[product.id] = product
+            self._product_packs[product.id] = ()
+            self._missing_products.pop(product.id, None)
+    
+    def product_deleted(self, product_id):
+        with self._lock:
+            self.version += 1
+            self._products.pop(product_id, None)
+            self._product_packs.pop(product_id, None)
+            self._add_missing(self._missing_products, product_id)
+            for pack_id in [pack_id for pack_id, pack in self._packs.items() if pack.product_id == product_id]:
+                del self._packs[pack_id]
+                self._add_missing(self._missing_packs, pack_id)
+    
+    def pack_added(self, pack):
+        with self._lock:
+            self.version += 1
+            self._packs[pack.id] = pack
+            self._missing_packs.pop(pack.id, None)
+            packs = self._product_packs.get(pack.product_id)
+            if packs is not None:
+                # خواننده‌ای که بین commit و این callback از دیتابیس خوانده، پک را دارد
+                self._product_packs[pack.product_id] = tuple(p for p in packs if p.id != pack.id) + (pack,)
+    
+    def pack_deleted(self, pack_id):
+        with self._lock:
+            self.version += 1
+            self._add_missing(self._missing_packs, pack_id)
+            # هر پکی که در لیست پک‌های یک محصول است در _packs هم هست
+            pack = self._packs.pop(pack_id, None)
+            if pack is None:
+                return
+            packs = self._product_packs.get(pack.product_id)
+            if packs is not None:
+                self._product_packs[pack.product_id] = tuple(p for p in packs if p.id != pack_id)
@@ -14,6 +14,23 @@ CHANNEL_USERNAME = "mantomantoerfan"  # بدون @
 # تنظیمات دیتابیس
 DATABASE_NAME = "shop_bot.db"
 
+# تعداد آپدیت‌هایی که هم‌زمان پردازش می‌شوند - آپدیت‌های یک کاربر همیشه به ترتیب اجرا می‌شوند
+CONCURRENT_UPDATES = 16
+
+# نوشتن دسته‌ای افزودن به سبد (group commit) - با پردازش هم‌زمان آپدیت‌ها سود دارد
+CART_GROUP_COMMIT = True
+
+# نحوه دریافت آپدیت‌ها: "polling" یا "webhook"
+UPDATE_MODE = "polling"
+
+# تنظیمات webhook - آدرس عمومی https که تلگرام آپدیت‌ها را به آن می‌فرستد
+# فقط یک نمونه ربات پشت این آدرس اجرا شود (وضعیت ربات داخل پروسه و فایل SQLite محلی است)
+WEBHOOK_URL = ""  # مثال: https://bot.example.com - خالی یعنی set_webhook صدا زده نمی‌شود
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = ""  # در حالت webhook الزامی - فقط A-Z، a-z، 0-9، _ و -
+
 # شماره کارت برای پرداخت
 CARD_NUMBER = "6037991780379511"
 CARD_HOLDER = "عرفان صحراکار"
@@ -0,0 +1 @@
+# ریشه مخزن در sys.path قرار می‌گیرد تا تست‌ها ماژول‌های ربات را import کنند
@@ -3,309 +3,1629 @@
 """
 import sqlite3
 import json
+import asyncio
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from config import DATABASE_NAME
+from catalog import CatalogCache, Product, Pack
+from known_users import KnownUsers
+import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+# تنظیمات اتصال‌ها - WAL اجازه می‌دهد خواندن‌ها موازی با نوشتن انجام شوند
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",      # حدود 16 مگابایت
+    "PRAGMA mmap_size = 67108864",     # 64 مگابایت
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# تعداد ترد‌های دیتابیس = حداکثر تعداد اتصال‌های خواندنی
+DB_WORKERS = 4
+
+# ایندکس‌های جداول پرکاربرد (مایگریشن نسخه 1)
+INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_user_product_pack ON cart (user_id, product_id, pack_id)",
+    "CREATE INDEX IF NOT EXISTS idx_packs_product ON packs (product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_products_created ON products (created_at)",
+)
+
+# اندازه دسته در انتقال آیتم‌های JSON قدیمی به order_items
+BACKFILL_BATCH_SIZE = 500
+
+# حداکثر تعداد شناسه در هر کوئری IN (...) خواندن‌های دسته‌ای
+IN_BATCH_SIZE = 500
+
+# خواندن‌هایی که در identity map واحد کار آپدیت نگه داشته می‌شوند: متد -> نوع ردیف
+IDENTITY_READS = {
+    'get_order': 'order',
+    'get_order_items': 'order_items',
+    'get_user': 'user',
+}
+
+# نوشتن‌هایی که ردیف‌های identity map را کهنه می‌کنند: متد -> انواع ردیف
+IDENTITY_WRITES = {
+    'update_order_status': ('order',),
+    'add_receipt': ('order',),
+    'update_shipping_method': ('order',),
+    'remove_order_item': ('order', 'order_items'),
+    'update_user_info': ('user',),
+    'record_delivery': ('user',),
+    'delete_pack': ('pack',),
+    'delete_product': ('pack',),
+}
+
+# اندازه دسته در پیمایش جریانی جداول با iter_* (keyset)
+ITER_BATCH_SIZE = 500
+
+# group commit افزودن به سبد: حداکثر انتظار و اندازه دسته قبل از نوشتن
+CART_BATCH_DELAY = 0.005  # ثانیه
+CART_BATCH_SIZE = 64
+
+# کاربران شناخته شده در حافظه - تغییر نام‌ها دسته‌ای نوشته می‌شوند
+KNOWN_USERS_LIMIT = 50_000
+USER_FLUSH_SIZE = 100
+USER_FLUSH_INTERVAL = 30  # ثانیه
+
+# وضعیت‌های تحویل ارسال همگانی - هر کدام ستون شمارنده هم‌نام در جدول broadcasts دارد
+DELIVERY_STATUSES = ('sent', 'failed', 'blocked')
+
+# شمارنده‌های آمار - در همان تراکنشی که سفارش/کاربر/محصول را تغییر می‌دهد بروز می‌شوند
+STATS_COUNTERS = ('total_orders', 'pending_orders', 'total_income', 'total_users', 'total_products')
+
+STATS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_order_insert AFTER INSERT ON orders
+    BEGIN
+        UPDATE stats_counters SET value = value + 1 WHERE name = 'total_orders';
+        UPDATE stats_counters SET value = value + (NEW.status = 'pending') WHERE name = 'pending_orders';
+        UPDATE stats_counters SET value = value + (NEW.status = 'confirmed') * IFNULL(NEW.total_price, 0)
+            WHERE name = 'total_income';
+        INSERT INTO stats_daily (day, orders, income)
+            VALUES (DATE(NEW.created_at), 1, (NEW.status = 'confirmed') * IFNULL(NEW.total_price, 0))
+            ON CONFLICT (day) DO UPDATE SET orders = orders + 1, income = income + excluded.income;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_order_update AFTER UPDATE OF status, total_price ON orders
+    BEGIN
+        UPDATE stats_counters SET value = value + (NEW.status = 'pending') - (OLD.status = 'pending')
+            WHERE name = 'pending_orders';
+        UPDATE stats_counters
+            SET value = value + (NEW.status = 'confirmed') * IFNULL(NEW.total_price, 0)
+                              - (OLD.status = 'confirmed') * IFNULL(OLD.total_price, 0)
+            WHERE name = 'total_income';
+        UPDATE stats_daily
+            SET income = income + (NEW.status = 'confirmed') * IFNULL(NEW.total_price, 0)
+                                - (OLD.status = 'confirmed') * IFNULL(OLD.total_price, 0)
+            WHERE day = DATE(NEW.created_at);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_order_delete AFTER DELETE ON orders
+    BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'total_orders';
+        UPDATE stats_counters SET value = value - (OLD.status = 'pending') WHERE name = 'pending_orders';
+        UPDATE stats_counters SET value = value - (OLD.status = 'confirmed') * IFNULL(OLD.total_price, 0)
+            WHERE name = 'total_income';
+        UPDATE stats_daily
+            SET orders = orders - 1, income = income - (OLD.status = 'confirmed') * IFNULL(OLD.total_price, 0)
+            WHERE day = DATE(OLD.created_at);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_user_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_user_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_product_insert AFTER INSERT ON products
+    BEGIN
+        UPDATE stats_counters SET value = value + 1 WHERE name = 'total_products';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stats_product_delete AFTER DELETE ON products
+    BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'total_products';
+    END
+    """,
+)
+
+# جداول rollup فروش - فقط وقتی سفارش به وضعیت confirmed می‌رسد (یا از آن خارج می‌شود) تغییر می‌کنند
+SALES_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS sales_order_confirmed AFTER UPDATE OF status ON orders
+    WHEN (NEW.status = 'confirmed') != (OLD.status = 'confirmed')
+    BEGIN
+        INSERT INTO sales_daily (day, orders, revenue, packs)
+            SELECT DATE(NEW.created_at),
+                   CASE WHEN NEW.status = 'confirmed' THEN 1 ELSE -1 END,
+                   CASE WHEN NEW.status = 'confirmed' THEN 1 ELSE -1 END * TOTAL(quantity * unit_price),
+                   CASE WHEN NEW.status = 'confirmed' THEN 1 ELSE -1 END * TOTAL(quantity)
+            FROM order_items WHERE order_id = NEW.id
+            ON CONFLICT (day) DO UPDATE SET
+                orders = orders + excluded.orders,
+                revenue = revenue + excluded.revenue,
+                packs = packs + excluded.packs;
+        INSERT INTO sales_by_pack (product_name, pack_name, product_id, pack_id, packs_sold, revenue)
+            SELECT IFNULL(product_name, ''), IFNULL(pack_name, ''), product_id, pack_id,
+                   CASE WHEN NEW.status = 'confirmed' THEN 1 ELSE -1 END * quantity,
+                   CASE WHEN NEW.status = 'confirmed' THEN 1 ELSE -1 END * quantity * unit_price
+            FROM order_items WHERE order_id = NEW.id
+            ON CONFLICT (product_name, pack_name) DO UPDATE SET
+                product_id = IFNULL(excluded.product_id, product_id),
+                pack_id = IFNULL(excluded.pack_id, pack_id),
+                packs_sold = packs_sold + excluded.packs_sold,
+                revenue = revenue + excluded.revenue;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sales_item_delete AFTER DELETE ON order_items
+    WHEN (SELECT status FROM orders WHERE id = OLD.order_id) = 'confirmed'
+    BEGIN
+        UPDATE sales_daily
+            SET revenue = revenue - OLD.quantity * OLD.unit_price, packs = packs - OLD.quantity
+            WHERE day = (SELECT DATE(created_at) FROM orders WHERE id = OLD.order_id);
+        UPDATE sales_by_pack
+            SET packs_sold = packs_sold - OLD.quantity, revenue = revenue - OLD.quantity * OLD.unit_price
+            WHERE product_name = IFNULL(OLD.product_name, '') AND pack_name = IFNULL(OLD.pack_name, '');
+    END
+    """,
+)
+
+# خلاصه سبد کاربر در یک کوئری تجمیعی روی ایندکس سبد - پارامترها: pack_id, pack_id, user_id
+CART_SUMMARY_SQL = """
+    SELECT
+        TOTAL(CASE WHEN c.pack_id = ? THEN c.quantity END),
+        TOTAL(CASE WHEN c.pack_id = ? THEN c.quantity * pk.price END),
+        TOTAL(c.quantity * pk.quantity),
+        TOTAL(c.quantity * pk.price)
+    FROM cart c
+    JOIN packs pk ON c.pack_id = pk.id
+    WHERE c.user_id = ?
+"""
+
+
+def page_cursor(row):
+    """شناسه یک ردیف برای after_id صفحه بعد - رکورد کاتالوگ یا tuple ای که id اولش است"""
+    return row.id if isinstance(row, (Product, Pack)) else row[0]
+
+
+async def fetch_page(fetch, size, page=1, after_id=None, before_id=None):
+    """
+    یک صفحه keyset برای صفحه‌های دکمه‌دار قبلی/بعدی
+    
+    fetch متد صفحه‌ای AsyncDatabase است که after_id، before_id و limit می‌گیرد. صفحه
+    خالی بعد از صفحه اول (ردیف مکان‌نما حذف شده یا صفحه با تغییر وضعیت‌ها خالی شده)
+    با صفحه اول جایگزین می‌شود.
+    خروجی: (ردیف‌ها, شماره صفحه, صفحه قبل دارد, صفحه بعد دارد)
+    """
+    if page <= 1:
+        page, after_id, before_id = 1, None, None
+    
+    if before_id is not None:
+        rows = await fetch(before_id=before_id, limit=size)
+        has_next = True
+    else:
+        # یک ردیف اضافه فقط برای دانستن وجود صفحه بعد
+        rows = await fetch(after_id=after_id, limit=size + 1)
+        has_next = len(rows) > size
+        rows = rows[:size]
+    
+    if not rows and page > 1:
+        return await fetch_page(fetch, size)
+    return rows, page, page > 1, has_next
+
+
+def page_count(page, total, size):
+    """تعداد صفحه‌ها برای نمایش «صفحه x از y» - شمارنده‌ها ممکن است کمی عقب باشند"""
+    return max(page, -(-total // size))
 
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect(DATABASE_NAME, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    def __init__(self, path=DATABASE_NAME):
+        self.path = path
+        
+        # اتصال نویسنده - تمام نوشتن‌ها فقط از این اتصال و با قفل انجام می‌شوند
+        self.conn = self._connect()
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self._write_lock = threading.RLock()
+        
+        # وضعیت تراکنش جاری روی اتصال نویسنده - فقط با قفل نوشتن خوانده و تغییر می‌کند
+        self._depth = 0
+        self._on_commit = []
+        
+        # اتصال‌های خواندنی - یکی برای هر ترد
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        
+        # کش محصولات و پک‌ها - فقط متدهای تغییر کاتالوگ همین کلاس آن را بروز می‌کنند
+        self.catalog = CatalogCache()
+        
+        # کاربران ثبت شده - add_user برای آن‌ها به دیتابیس نمی‌رود
+        self.known_users = KnownUsers(KNOWN_USERS_LIMIT, USER_FLUSH_SIZE, USER_FLUSH_INTERVAL)
+        
         self.create_tables()
+        self.known_users.warm(self._read("""
+            SELECT user_id, username, first_name FROM (
+                SELECT user_id, username, first_name, created_at FROM users
+                ORDER BY created_at DESC, user_id DESC LIMIT ?
+            ) ORDER BY created_at, user_id
+        """, (KNOWN_USERS_LIMIT,)))
+    
+    def _connect(self, readonly=False):
+        """ساخت اتصال جدید با pragma های تنظیم شده"""
+        if readonly:
+            uri = Path(self.path).absolute().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def _reader(self):
+        """اتصال خواندنی مخصوص ترد فعلی"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect(readonly=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+    
+    def _read(self, sql, params=()):
+        """اجرای کوئری خواندنی روی اتصال ترد فعلی"""
+        return self._reader().execute(sql, params)
+    
+    def _read_in(self, sql, ids):
+        """
+        اجرای کوئری با شرط IN روی لیست شناسه‌ها - در دسته‌های IN_BATCH_SIZE تایی
+        
+        sql باید یک {ids} برای جای placeholder ها داشته باشد.
+        """
+        ids = list(dict.fromkeys(ids))
+        for start in range(0, len(ids), IN_BATCH_SIZE):
+            batch = ids[start:start + IN_BATCH_SIZE]
+            yield from self._read(sql.format(ids=", ".join("?" * len(batch))), batch)
+    
+    def _page(self, table, columns, where, params, after_id, limit, before_id=None):
+        """
+        خواندن یک صفحه به ترتیب جدیدترین اول با keyset pagination
+        
+        after_id شناسه آخرین ردیف صفحه قبل است؛ صفحه بعد با ایندکس created_at از
+        همان نقطه ادامه پیدا می‌کند و برخلاف OFFSET ردیف‌های قبلی خوانده نمی‌شوند.
+        before_id برعکس، صفحه جدیدتر از آن ردیف را می‌دهد (برای دکمه «قبلی»).
+        limit=None یعنی همه ردیف‌های باقی‌مانده.
+        """
+        conditions = [where] if where else []
+        params = list(params)
+        if after_id is not None:
+            conditions.append(f"(created_at, id) < (SELECT created_at, id FROM {table} WHERE id = ?)")
+            params.append(after_id)
+        if before_id is not None:
+            conditions.append(f"(created_at, id) > (SELECT created_at, id FROM {table} WHERE id = ?)")
+            params.append(before_id)
+        
+        # صفحه قبلی از نزدیک‌ترین ردیف به before_id خوانده و بعد برعکس می‌شود
+        direction = "ASC" if before_id is not None and after_id is None else "DESC"
+        sql = f"SELECT {columns} FROM {table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY created_at {direction}, id {direction}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._read(sql, params).fetchall()
+        if direction == "ASC":
+            rows.reverse()
+        return rows
+    
+    def _iterate(self, method, *args, batch_size=ITER_BATCH_SIZE):
+        """پیمایش جریانی یک متد صفحه‌بندی شده - در هر لحظه فقط یک دسته در حافظه است"""
+        after_id = None
+        while True:
+            page = method(*args, after_id=after_id, limit=batch_size)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after_id = page_cursor(page[-1])
+    
+    @contextmanager
+    def transaction(self):
+        """
+        تراکنش روی اتصال نویسنده - همه نوشتن‌های داخل آن با یک commit ثبت می‌شوند
+        
+        تراکنش‌های تو در تو به SAVEPOINT تبدیل می‌شوند: خطای داخلی فقط کار همان
+        بخش را برمی‌گرداند و commit فقط در خروج از بیرونی‌ترین تراکنش انجام می‌شود.
+        
+        مثال:
+            with db.transaction():
+                order_id = db.create_order(user_id)
+                db.update_shipping_method(order_id, method)
+        """
+        with self._write_lock:
+            if self._depth:
+                savepoint = f"sp_{self._depth}"
+                self.conn.execute(f"SAVEPOINT {savepoint}")
+                # callback های ثبت شده در همین SAVEPOINT با ROLLBACK TO آن دور ریخته می‌شوند
+                callbacks_mark = len(self._on_commit)
+                self._depth += 1
+                try:
+                    yield
+                    self.conn.execute(f"RELEASE {savepoint}")
+                except BaseException:
+                    self.conn.execute(f"ROLLBACK TO {savepoint}")
+                    self.conn.execute(f"RELEASE {savepoint}")
+                    del self._on_commit[callbacks_mark:]
+                    raise
+                finally:
+                    self._depth -= 1
+                return
+            
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            try:
+                yield
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                self._on_commit.clear()
+                raise
+            finally:
+                self._depth = 0
+            
+            callbacks, self._on_commit = self._on_commit, []
+            for callback in callbacks:
+                callback()
+    
+    def _after_commit(self, callback):
+        """اجرای callback بعد از commit تراکنش جاری (بیرون از تراکنش: همین حالا)"""
+        with self._write_lock:
+            if self._depth:
+                self._on_commit.append(callback)
+                return
+        callback()
+    
+    @contextmanager
+    def _write(self):
+        """نوشتن روی اتصال نویسنده در یک تراکنش - در پایان commit و در خطا rollback"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
     
     def create_tables(self):
         """ایجاد جداول دیتابیس"""
-        
-        # جدول محصولات
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                photo_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        with self._write() as cursor:
+            # جدول محصولات
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    photo_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # جدول پک‌ها
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS packs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id INTEGER,
+                    name TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    FOREIGN KEY (product_id) REFERENCES products(id)
+                )
+            """)
+            
+            # جدول کاربران
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    full_name TEXT,
+                    phone TEXT,
+                    landline_phone TEXT,
+                    address TEXT,
+                    shop_name TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # جدول سبد خرید
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cart (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    product_id INTEGER,
+                    pack_id INTEGER,
+                    quantity INTEGER DEFAULT 1,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id),
+                    FOREIGN KEY (product_id) REFERENCES products(id),
+                    FOREIGN KEY (pack_id) REFERENCES packs(id)
+                )
+            """)
+            
+            # جدول سفارشات
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS orders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    items TEXT,
+                    total_price REAL,
+                    status TEXT DEFAULT 'pending',
+                    receipt_photo TEXT,
+                    shipping_method TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+            
+            # جدول آیتم‌های سفارش - نام محصول و پک هم ذخیره می‌شود چون ممکن است بعداً حذف شوند
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS order_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER NOT NULL,
+                    product_id INTEGER,
+                    pack_id INTEGER,
+                    product_name TEXT,
+                    pack_name TEXT,
+                    quantity INTEGER NOT NULL,
+                    unit_price REAL NOT NULL,
+                    FOREIGN KEY (order_id) REFERENCES orders(id),
+                    FOREIGN KEY (product_id) REFERENCES products(id),
+                    FOREIGN KEY (pack_id) REFERENCES packs(id)
+                )
+            """)
+            
+            # شمارنده‌های آمار
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_counters (
+                    name TEXT PRIMARY KEY,
+                    value REAL NOT NULL DEFAULT 0
+                )
+            """)
+            
+            # آمار روزانه (بر اساس تاریخ ثبت سفارش)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stats_daily (
+                    day TEXT PRIMARY KEY,
+                    orders INTEGER NOT NULL DEFAULT 0,
+                    income REAL NOT NULL DEFAULT 0
+                )
+            """)
+            
+            # rollup فروش روزانه (سفارشات تایید شده بر اساس تاریخ ثبت)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sales_daily (
+                    day TEXT PRIMARY KEY,
+                    orders INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    packs INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            
+            # rollup فروش هر پک - کلید نام‌ها هستند چون آیتم‌های قدیمی ممکن است شناسه نداشته باشند
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sales_by_pack (
+                    product_name TEXT NOT NULL,
+                    pack_name TEXT NOT NULL,
+                    product_id INTEGER,
+                    pack_id INTEGER,
+                    packs_sold INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (product_name, pack_name)
+                )
+            """)
+            
+            # ارسال‌های همگانی - last_user_id مکان‌نمای keyset روی users است
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    from_chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    last_user_id INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    progress_chat_id INTEGER,
+                    progress_message_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            
+            # نتیجه ارسال به هر گیرنده - ادامه بعد از ری‌استارت این کاربرها را رد می‌کند
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                    broadcast_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    PRIMARY KEY (broadcast_id, user_id),
+                    FOREIGN KEY (broadcast_id) REFERENCES broadcasts(id)
+                ) WITHOUT ROWID
+            """)
+            
+            self._migrate(cursor)
+    
+    def _migrate(self, cursor):
+        """اجرای مایگریشن‌های نسخه‌دار - نسخه در PRAGMA user_version ذخیره می‌شود"""
+        migrations = [
+            self._migration_indexes,
+            self._migration_order_items,
+            self._migration_stats_counters,
+            self._migration_sales_rollups,
+            self._migration_payable_orders,
+            self._migration_blocked_users,
+        ]
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+    
+    def _migration_indexes(self, cursor):
+        """نسخه 1: ادغام ردیف‌های تکراری سبد و ساخت ایندکس‌ها"""
+        # ردیف‌های تکراری سبد خرید قبل از ایندکس UNIQUE ادغام می‌شوند
+        cursor.execute("""
+            UPDATE cart SET quantity = (
+                SELECT SUM(c2.quantity) FROM cart c2
+                WHERE c2.user_id = cart.user_id
+                  AND c2.product_id = cart.product_id
+                  AND c2.pack_id = cart.pack_id
             )
-        """)
-        
-        # جدول پک‌ها
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS packs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id INTEGER,
-                name TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                FOREIGN KEY (product_id) REFERENCES products(id)
+            WHERE id IN (
+                SELECT MIN(id) FROM cart
+                GROUP BY user_id, product_id, pack_id
+                HAVING COUNT(*) > 1
             )
         """)
-        
-        # جدول کاربران
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                full_name TEXT,
-                phone TEXT,
-                landline_phone TEXT,
-                address TEXT,
-                shop_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        cursor.execute("""
+            DELETE FROM cart WHERE id NOT IN (
+                SELECT MIN(id) FROM cart GROUP BY user_id, product_id, pack_id
             )
         """)
+        for statement in INDEXES:
+            cursor.execute(statement)
+    
+    def _migration_order_items(self, cursor):
+        """نسخه 2: انتقال آیتم‌های JSON سفارشات قدیمی به جدول order_items"""
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_id, pack_id)")
         
-        # جدول سبد خرید
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cart (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                product_id INTEGER,
-                pack_id INTEGER,
-                quantity INTEGER DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (product_id) REFERENCES products(id),
-                FOREIGN KEY (pack_id) REFERENCES packs(id)
-            )
-        """)
+        # JSON قدیمی فقط نام‌ها را داشت - شناسه‌ها تا جای ممکن از روی نام پیدا می‌شوند
+        product_ids = {name: product_id for product_id, name in cursor.execute("SELECT id, name FROM products")}
+        pack_ids = {
+            (product_id, name): pack_id
+            for pack_id, product_id, name in cursor.execute("SELECT id, product_id, name FROM packs")
+        }
         
-        # جدول سفارشات
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                items TEXT,
-                total_price REAL,
-                status TEXT DEFAULT 'pending',
-                receipt_photo TEXT,
-                shipping_method TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
+        last_id = 0
+        while True:
+            orders = cursor.execute(
+                "SELECT id, items FROM orders WHERE id > ? AND items IS NOT NULL ORDER BY id LIMIT ?",
+                (last_id, BACKFILL_BATCH_SIZE)
+            ).fetchall()
+            if not orders:
+                break
+            
+            rows = []
+            for order_id, items_json in orders:
+                try:
+                    items = json.loads(items_json)
+                except ValueError:
+                    items = None
+                if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                    # ستون items دست نمی‌خورد تا بعداً دستی بررسی شود
+                    logger.warning("Order %s has unreadable items JSON, skipped in order_items migration", order_id)
+                    continue
+                for item in items:
+                    product_id = product_ids.get(item.get('product'))
+                    quantity = item.get('quantity') or 1
+                    rows.append((
+                        order_id,
+                        product_id,
+                        pack_ids.get((product_id, item.get('pack'))),
+                        item.get('product'),
+                        item.get('pack'),
+                        quantity,
+                        (item.get('price') or 0) / quantity,
+                    ))
+            cursor.executemany("""
+                INSERT INTO order_items
+                    (order_id, product_id, pack_id, product_name, pack_name, quantity, unit_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            # ستون items برای سفارشات قدیمی نگه داشته می‌شود - کد دیگر آن را نمی‌خواند
+            last_id = orders[-1][0]
+    
+    def _migration_stats_counters(self, cursor):
+        """نسخه 3: تریگرهای شمارنده آمار و مقداردهی اولیه از داده‌های موجود"""
+        for statement in STATS_TRIGGERS:
+            cursor.execute(statement)
+        self._rebuild_statistics(cursor)
+    
+    def _migration_sales_rollups(self, cursor):
+        """نسخه 4: تریگرهای rollup فروش و مقداردهی اولیه از سفارشات تایید شده"""
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_by_pack_sold ON sales_by_pack (packs_sold)")
+        for statement in SALES_TRIGGERS:
+            cursor.execute(statement)
+        self._rebuild_sales_rollups(cursor)
+    
+    def _migration_payable_orders(self, cursor):
+        """نسخه 5: ایندکس سفارش‌های یک کاربر بر اساس وضعیت - برای یافتن سفارش قابل پرداخت"""
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_status ON orders (user_id, status, created_at)")
+    
+    def _migration_blocked_users(self, cursor):
+        """نسخه 6: ستون blocked برای کاربرانی که ربات را بلاک کرده‌اند"""
+        cursor.execute("ALTER TABLE users ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_blocked ON users (blocked)")
+    
+    def check_query_plans(self):
+        """
+        اجرای متدهای پرکاربرد و بررسی EXPLAIN QUERY PLAN کوئری‌هایشان
         
-        self.conn.commit()
+        خروجی: دیکشنری {نام متد: خطوط پلن بدون ایندکس} - خالی یعنی همه از ایندکس استفاده می‌کنند
+        """
+        calls = {
+            'get_cart': (1,),
+            'get_cart_summary': (1, 1),
+            '_load_packs': (1,),
+            '_load_pack': (1,),
+            '_load_product': (1,),
+            '_load_packs_for_products': ([1, 2],),
+            'get_user': (1,),
+            'get_users': ([1, 2],),
+            'get_order': (1,),
+            'get_order_items': (1,),
+            'get_items_for_orders': ([1, 2],),
+            'get_user_orders': (1,),
+            'get_pending_orders': (),
+            'get_orders_by_status': ('pending', 1, 10),
+            'count_orders_by_status': ('pending',),
+            'get_all_products': (1, 10),
+            'count_products': (),
+            'get_waiting_payment_orders': (),
+            'get_payable_orders': (1,),
+            'get_receipt_sent_orders': (),
+            'count_broadcast_recipients': (),
+            'get_broadcast_recipients': (1, 1, 10),
+        }
+        problems = {}
+        reader = self._reader()
+        for name, args in calls.items():
+            statements = []
+            reader.set_trace_callback(statements.append)
+            try:
+                getattr(self, name)(*args)
+            finally:
+                reader.set_trace_callback(None)
+            
+            bad = []
+            for sql in statements:
+                params = (1,) * sql.count('?')
+                for row in reader.execute("EXPLAIN QUERY PLAN " + sql, params):
+                    detail = row[-1]
+                    if (detail.startswith('SCAN') and 'USING' not in detail) or 'TEMP B-TREE' in detail:
+                        bad.append(detail)
+            if bad:
+                problems[name] = bad
+        return problems
     
     # ==================== محصولات ====================
     
     def add_product(self, name, description, photo_id):
         """افزودن محصول جدید"""
-        self.cursor.execute(
-            "INSERT INTO products (name, description, photo_id) VALUES (?, ?, ?)",
-            (name, description, photo_id)
-        )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        with self._write() as cursor:
+            row = cursor.execute(
+                "INSERT INTO products (name, description, photo_id) VALUES (?, ?, ?) "
+                "RETURNING id, name, description, photo_id, created_at",
+                (name, description, photo_id)
+            ).fetchone()
+        product = Product(*row)
+        self._after_commit(lambda: self.catalog.product_added(product))
+        return product.id
     
     def get_product(self, product_id):
-        """دریافت اطلاعات یک محصول"""
-        self.cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-        return self.cursor.fetchone()
+        """دریافت اطلاعات یک محصول (از کش کاتالوگ)"""
+        found, product = self.catalog.lookup_product(product_id)
+        return product if found else self._load_product(product_id)
+    
+    def _load_product(self, product_id):
+        version = self.catalog.version
+        row = self._read(
+            "SELECT id, name, description, photo_id, created_at FROM products WHERE id = ?", (product_id,)
+        ).fetchone()
+        if row is None:
+            self.catalog.store_missing_product(product_id, version)
+            return None
+        product = Product(*row)
+        self.catalog.store_product(product, version)
+        return product
+    
+    def get_all_products(self, after_id=None, limit=None, before_id=None):
+        """دریافت محصولات - جدیدترین اول، با after_id/before_id و limit صفحه به صفحه"""
+        version = self.catalog.version
+        rows = self._page(
+            "products", "id, name, description, photo_id, created_at", None, (), after_id, limit, before_id
+        )
+        products = [Product(*row) for row in rows]
+        for product in products:
+            self.catalog.store_product(product, version)
+        return products
+    
+    def count_products(self):
+        """تعداد محصولات - از شمارنده آمار"""
+        row = self._read("SELECT value FROM stats_counters WHERE name = 'total_products'").fetchone()
+        return int(row[0]) if row else 0
     
-    def get_all_products(self):
-        """دریافت تمام محصولات"""
-        self.cursor.execute("SELECT * FROM products ORDER BY created_at DESC")
-        return self.cursor.fetchall()
+    def iter_products(self, batch_size=ITER_BATCH_SIZE):
+        """پیمایش جریانی همه محصولات"""
+        return self._iterate(self.get_all_products, batch_size=batch_size)
     
     def delete_product(self, product_id):
         """حذف محصول"""
-        self.cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-        self.cursor.execute("DELETE FROM packs WHERE product_id = ?", (product_id,))
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            cursor.execute("DELETE FROM packs WHERE product_id = ?", (product_id,))
+        self._after_commit(lambda: self.catalog.product_deleted(product_id))
     
     # ==================== پک‌ها ====================
     
     def add_pack(self, product_id, name, quantity, price):
         """افزودن پک به محصول"""
-        self.cursor.execute(
-            "INSERT INTO packs (product_id, name, quantity, price) VALUES (?, ?, ?, ?)",
-            (product_id, name, quantity, price)
-        )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        with self._write() as cursor:
+            row = cursor.execute(
+                "INSERT INTO packs (product_id, name, quantity, price) VALUES (?, ?, ?, ?) "
+                "RETURNING id, product_id, name, quantity, price",
+                (product_id, name, quantity, price)
+            ).fetchone()
+        pack = Pack(*row)
+        self._after_commit(lambda: self.catalog.pack_added(pack))
+        return pack.id
     
     def get_packs(self, product_id):
-        """دریافت پک‌های یک محصول"""
-        self.cursor.execute("SELECT * FROM packs WHERE product_id = ?", (product_id,))
-        return self.cursor.fetchall()
+        """دریافت پک‌های یک محصول (از کش کاتالوگ)"""
+        packs = self.catalog.get_packs(product_id)
+        if packs is None:
+            packs = self._load_packs(product_id)
+        return packs
+    
+    def _load_packs(self, product_id):
+        version = self.catalog.version
+        rows = self._read(
+            "SELECT id, product_id, name, quantity, price FROM packs WHERE product_id = ? ORDER BY id", (product_id,)
+        ).fetchall()
+        packs = [Pack(*row) for row in rows]
+        self.catalog.store_packs(product_id, packs, version)
+        return packs
+    
+    def get_packs_for_products(self, product_ids):
+        """پک‌های چند محصول با یک کوئری: دیکشنری {product_id: لیست پک‌ها}"""
+        result = {}
+        missing = []
+        for product_id in product_ids:
+            packs = self.catalog.get_packs(product_id)
+            if packs is None:
+                missing.append(product_id)
+            else:
+                result[product_id] = packs
+        if missing:
+            result.update(self._load_packs_for_products(missing))
+        return result
+    
+    def _load_packs_for_products(self, product_ids):
+        version = self.catalog.version
+        grouped = {product_id: [] for product_id in product_ids}
+        for row in self._read_in(
+            "SELECT id, product_id, name, quantity, price FROM packs WHERE product_id IN ({ids}) ORDER BY product_id, id",
+            product_ids
+        ):
+            grouped[row[1]].append(Pack(*row))
+        for product_id, packs in grouped.items():
+            self.catalog.store_packs(product_id, packs, version)
+        return grouped
     
     def get_pack(self, pack_id):
-        """دریافت اطلاعات یک پک"""
-        self.cursor.execute("SELECT * FROM packs WHERE id = ?", (pack_id,))
-        return self.cursor.fetchone()
+        """دریافت اطلاعات یک پک (از کش کاتالوگ)"""
+        found, pack = self.catalog.lookup_pack(pack_id)
+        return pack if found else self._load_pack(pack_id)
+    
+    def _load_pack(self, pack_id):
+        version = self.catalog.version
+        row = self._read(
+            "SELECT id, product_id, name, quantity, price FROM packs WHERE id = ?", (pack_id,)
+        ).fetchone()
+        if row is None:
+            self.catalog.store_missing_pack(pack_id, version)
+            return None
+        pack = Pack(*row)
+        self.catalog.store_pack(pack, version)
+        return pack
     
     def delete_pack(self, pack_id):
         """حذف پک"""
-        self.cursor.execute("DELETE FROM packs WHERE id = ?", (pack_id,))
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute("DELETE FROM packs WHERE id = ?", (pack_id,))
+        self._after_commit(lambda: self.catalog.pack_deleted(pack_id))
     
     # ==================== کاربران ====================
     
     def add_user(self, user_id, username, first_name):
-        """افزودن کاربر جدید"""
-        self.cursor.execute(
-            "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
-            (user_id, username, first_name)
-        )
-        self.conn.commit()
+        """افزودن کاربر جدید - برای کاربر شناخته شده فقط تغییر نام در صف می‌رود"""
+        if self.known_users.seen(user_id, username, first_name):
+            if self.known_users.flush_due():
+                self.flush_user_updates()
+            return
+        self._insert_user(user_id, username, first_name)
+    
+    def _insert_user(self, user_id, username, first_name):
+        """ثبت کاربری که در known_users نیست (جدید یا از LRU خارج شده)"""
+        with self._write() as cursor:
+            cursor.execute("""
+                INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username, first_name = excluded.first_name, blocked = 0
+                WHERE username IS NOT excluded.username OR first_name IS NOT excluded.first_name
+                   OR blocked
+            """, (user_id, username, first_name))
+        self._after_commit(lambda: self.known_users.remember(user_id, username, first_name))
+    
+    def flush_user_updates(self):
+        """نوشتن تغییرات username و first_name در صف با یک تراکنش"""
+        rows = self.known_users.take_pending()
+        if not rows:
+            return 0
+        try:
+            with self._write() as cursor:
+                cursor.executemany("UPDATE users SET username = ?, first_name = ? WHERE user_id = ?", rows)
+        except Exception:
+            self.known_users.restore(rows)
+            raise
+        return len(rows)
     
     def update_user_info(self, user_id, phone=None, landline_phone=None, address=None, full_name=None, shop_name=None):
-        """بروزرسانی اطلاعات کاربر"""
-        if phone:
-            self.cursor.execute("UPDATE users SET phone = ? WHERE user_id = ?", (phone, user_id))
-        if landline_phone:
-            self.cursor.execute("UPDATE users SET landline_phone = ? WHERE user_id = ?", (landline_phone, user_id))
-        if address:
-            self.cursor.execute("UPDATE users SET address = ? WHERE user_id = ?", (address, user_id))
-        if full_name:
-            self.cursor.execute("UPDATE users SET full_name = ? WHERE user_id = ?", (full_name, user_id))
-        if shop_name:
-            self.cursor.execute("UPDATE users SET shop_name = ? WHERE user_id = ?", (shop_name, user_id))
-        self.conn.commit()
+        """بروزرسانی اطلاعات کاربر - فقط فیلدهای داده شده، با یک UPDATE"""
+        fields = {
+            'phone': phone,
+            'landline_phone': landline_phone,
+            'address': address,
+            'full_name': full_name,
+            'shop_name': shop_name,
+        }
+        fields = {column: value for column, value in fields.items() if value}
+        if not fields:
+            return
+        
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._write() as cursor:
+            cursor.execute(f"UPDATE users SET {assignments} WHERE user_id = ?", (*fields.values(), user_id))
     
     def get_user(self, user_id):
         """دریافت اطلاعات کاربر"""
-        self.cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return self.cursor.fetchone()
+        return self._read("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    
+    def get_users(self, user_ids):
+        """اطلاعات چند کاربر با یک کوئری: دیکشنری {user_id: ردیف}"""
+        return {row[0]: row for row in self._read_in("SELECT * FROM users WHERE user_id IN ({ids})", user_ids)}
     
     # ==================== سبد خرید ====================
     
     def add_to_cart(self, user_id, product_id, pack_id, quantity=1):
-        """افزودن به سبد خرید"""
-        # بررسی اگر قبلاً اضافه شده بود
-        self.cursor.execute(
-            "SELECT id, quantity FROM cart WHERE user_id = ? AND product_id = ? AND pack_id = ?",
-            (user_id, product_id, pack_id)
-        )
-        existing = self.cursor.fetchone()
+        """
+        افزودن به سبد خرید با یک دستور UPSERT
         
-        if existing:
-            new_quantity = existing[1] + quantity
-            self.cursor.execute(
-                "UPDATE cart SET quantity = ? WHERE id = ?",
-                (new_quantity, existing[0])
-            )
-        else:
-            self.cursor.execute(
-                "INSERT INTO cart (user_id, product_id, pack_id, quantity) VALUES (?, ?, ?, ?)",
-                (user_id, product_id, pack_id, quantity)
-            )
-        self.conn.commit()
+        خروجی: خلاصه سبد بعد از افزودن - مثل get_cart_summary
+        """
+        with self._write() as cursor:
+            cursor.execute("""
+                INSERT INTO cart (user_id, product_id, pack_id, quantity) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, product_id, pack_id)
+                DO UPDATE SET quantity = quantity + excluded.quantity
+            """, (user_id, product_id, pack_id, quantity))
+            # خلاصه در همان تراکنش خوانده می‌شود
+            row = cursor.execute(CART_SUMMARY_SQL, (pack_id, pack_id, user_id)).fetchone()
+        return self._cart_summary(row)
+    
+    def add_to_cart_many(self, requests):
+        """
+        چند add_to_cart با یک commit (group commit)
+        
+        requests: لیست (user_id, product_id, pack_id, quantity)
+        خروجی: نتیجه هر درخواست به همان ترتیب - برای درخواست ناموفق خود خطا
+        """
+        results = []
+        with self.transaction():
+            for request in requests:
+                # هر درخواست یک SAVEPOINT است و خطای آن بقیه را برنمی‌گرداند
+                try:
+                    results.append(self.add_to_cart(*request))
+                except sqlite3.Error as error:
+                    results.append(error)
+        return results
+    
+    def get_cart_summary(self, user_id, pack_id):
+        """
+        خلاصه سبد خرید کاربر
+        
+        خروجی: تعداد و مبلغ یک پک در سبد، تعداد کل کالاها و جمع کل
+        """
+        row = self._read(CART_SUMMARY_SQL, (pack_id, pack_id, user_id)).fetchone()
+        return self._cart_summary(row)
+    
+    @staticmethod
+    def _cart_summary(row):
+        pack_count, pack_price, total_items, total_price = row
+        return {
+            'pack_count': int(pack_count),
+            'pack_price': pack_price,
+            'total_items': int(total_items),
+            'total_price': total_price,
+        }
     
     def get_cart(self, user_id):
         """دریافت سبد خرید کاربر"""
-        self.cursor.execute("""
+        return self._read("""
             SELECT c.id, p.name, pk.name, pk.quantity, pk.price, c.quantity
             FROM cart c
             JOIN products p ON c.product_id = p.id
             JOIN packs pk ON c.pack_id = pk.id
             WHERE c.user_id = ?
-        """, (user_id,))
-        return self.cursor.fetchall()
+        """, (user_id,)).fetchall()
     
     def clear_cart(self, user_id):
         """خالی کردن سبد خرید"""
-        self.cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
     
     def remove_from_cart(self, cart_id):
         """حذف آیتم از سبد"""
-        self.cursor.execute("DELETE FROM cart WHERE id = ?", (cart_id,))
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute("DELETE FROM cart WHERE id = ?", (cart_id,))
     
     # ==================== سفارشات ====================
     
-    def create_order(self, user_id, items, total_price):
-        """ایجاد سفارش جدید"""
-        items_json = json.dumps(items, ensure_ascii=False)
-        self.cursor.execute(
-            "INSERT INTO orders (user_id, items, total_price) VALUES (?, ?, ?)",
-            (user_id, items_json, total_price)
-        )
-        self.conn.commit()
-        return self.cursor.lastrowid
+    def create_order(self, user_id):
+        """
+        ایجاد سفارش جدید از سبد خرید کاربر و خالی کردن سبد - در یک تراکنش
+        
+        خروجی: شناسه سفارش - یا None اگر سبد خالی باشد
+        """
+        with self._write() as cursor:
+            total_price = cursor.execute("""
+                SELECT SUM(c.quantity * pk.price)
+                FROM cart c
+                JOIN products p ON c.product_id = p.id
+                JOIN packs pk ON c.pack_id = pk.id
+                WHERE c.user_id = ?
+            """, (user_id,)).fetchone()[0]
+            if total_price is None:
+                return None
+            
+            cursor.execute(
+                "INSERT INTO orders (user_id, total_price) VALUES (?, ?)",
+                (user_id, total_price)
+            )
+            order_id = cursor.lastrowid
+            cursor.execute("""
+                INSERT INTO order_items
+                    (order_id, product_id, pack_id, product_name, pack_name, quantity, unit_price)
+                SELECT ?, c.product_id, c.pack_id, p.name, pk.name, c.quantity, pk.price
+                FROM cart c
+                JOIN products p ON c.product_id = p.id
+                JOIN packs pk ON c.pack_id = pk.id
+                WHERE c.user_id = ?
+                ORDER BY c.id
+            """, (order_id, user_id))
+            self.clear_cart(user_id)
+            return order_id
     
     def get_order(self, order_id):
         """دریافت اطلاعات سفارش"""
-        self.cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
-        return self.cursor.fetchone()
+        return self._read("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
     
     def update_order_status(self, order_id, status):
         """بروزرسانی وضعیت سفارش"""
-        self.cursor.execute(
-            "UPDATE orders SET status = ? WHERE id = ?",
-            (status, order_id)
-        )
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute(
+                "UPDATE orders SET status = ? WHERE id = ?",
+                (status, order_id)
+            )
     
     def add_receipt(self, order_id, photo_id):
         """افزودن رسید به سفارش"""
-        self.cursor.execute(
-            "UPDATE orders SET receipt_photo = ?, status = 'receipt_sent' WHERE id = ?",
-            (photo_id, order_id)
-        )
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute(
+                "UPDATE orders SET receipt_photo = ?, status = 'receipt_sent' WHERE id = ?",
+                (photo_id, order_id)
+            )
     
     def update_shipping_method(self, order_id, method):
         """بروزرسانی نحوه ارسال"""
-        self.cursor.execute(
-            "UPDATE orders SET shipping_method = ? WHERE id = ?",
-            (method, order_id)
-        )
-        self.conn.commit()
+        with self._write() as cursor:
+            cursor.execute(
+                "UPDATE orders SET shipping_method = ? WHERE id = ?",
+                (method, order_id)
+            )
+    
+    def get_orders_by_status(self, status, after_id=None, limit=None, before_id=None):
+        """دریافت سفارشات یک وضعیت - جدیدترین اول، با after_id/before_id و limit صفحه به صفحه"""
+        return self._page("orders", "*", "status = ?", (status,), after_id, limit, before_id)
+    
+    def iter_orders_by_status(self, status, batch_size=ITER_BATCH_SIZE):
+        """پیمایش جریانی سفارشات یک وضعیت"""
+        return self._iterate(self.get_orders_by_status, status, batch_size=batch_size)
     
-    def get_pending_orders(self):
+    def count_orders_by_status(self, status):
+        """تعداد سفارشات یک وضعیت - فقط از ایندکس وضعیت خوانده می‌شود"""
+        return self._read("SELECT COUNT(*) FROM orders WHERE status = ?", (status,)).fetchone()[0]
+    
+    def get_pending_orders(self, after_id=None, limit=None):
         """دریافت سفارشات در انتظار تایید"""
-        self.cursor.execute("SELECT * FROM orders WHERE status = 'pending' ORDER BY created_at DESC")
-        return self.cursor.fetchall()
+        return self.get_orders_by_status('pending', after_id, limit)
     
-    def get_waiting_payment_orders(self):
+    def get_waiting_payment_orders(self, after_id=None, limit=None):
         """دریافت سفارشات در انتظار پرداخت"""
-        self.cursor.execute("SELECT * FROM orders WHERE status = 'waiting_payment' ORDER BY created_at DESC")
-        return self.cursor.fetchall()
+        return self.get_orders_by_status('waiting_payment', after_id, limit)
+    
+    def get_payable_orders(self, user_id):
+        """سفارشات در انتظار پرداخت یک کاربر - جدیدترین اول"""
+        return self._read(
+            "SELECT * FROM orders WHERE user_id = ? AND status = 'waiting_payment' ORDER BY created_at DESC",
+            (user_id,)
+        ).fetchall()
+    
+    def get_receipt_sent_orders(self, after_id=None, limit=None):
+        """دریافت سفارشات با رسید ارسال شده"""
+        return self.get_orders_by_status('receipt_sent', after_id, limit)
+    
+    def get_order_items(self, order_id):
+        """
+        دریافت آیتم‌های یک سفارش
+        
+        price مبلغ کل ردیف است (قیمت واحد × تعداد)، مثل آیتم‌های JSON قدیمی
+        """
+        rows = self._read("""
+            SELECT id, product_id, pack_id, product_name, pack_name, quantity, unit_price
+            FROM order_items WHERE order_id = ? ORDER BY id
+        """, (order_id,)).fetchall()
+        return [self._order_item(row) for row in rows]
+    
+    def get_items_for_orders(self, order_ids):
+        """آیتم‌های چند سفارش با یک کوئری: دیکشنری {order_id: لیست آیتم‌ها}"""
+        grouped = {order_id: [] for order_id in order_ids}
+        for row in self._read_in("""
+            SELECT id, product_id, pack_id, product_name, pack_name, quantity, unit_price, order_id
+            FROM order_items WHERE order_id IN ({ids}) ORDER BY order_id, id
+        """, order_ids):
+            grouped[row[7]].append(self._order_item(row))
+        return grouped
+    
+    @staticmethod
+    def _order_item(row):
+        item_id, product_id, pack_id, product_name, pack_name, quantity, unit_price = row[:7]
+        return {
+            'id': item_id,
+            'product_id': product_id,
+            'pack_id': pack_id,
+            'product': product_name,
+            'pack': pack_name,
+            'quantity': quantity,
+            'price': unit_price * quantity,
+        }
     
-    def get_user_orders(self, user_id):
-        """دریافت سفارشات یک کاربر"""
-        self.cursor.execute("SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
-        return self.cursor.fetchall()
+    def remove_order_item(self, order_id, item_id):
+        """
+        حذف یک آیتم از سفارش و محاسبه مجدد مبلغ کل
+        
+        خروجی: مبلغ کل جدید - یا None اگر آیتم متعلق به این سفارش نباشد
+        """
+        with self._write() as cursor:
+            cursor.execute("DELETE FROM order_items WHERE id = ? AND order_id = ?", (item_id, order_id))
+            if cursor.rowcount == 0:
+                return None
+            cursor.execute("""
+                UPDATE orders SET total_price = (
+                    SELECT TOTAL(quantity * unit_price) FROM order_items WHERE order_id = ?
+                ) WHERE id = ?
+            """, (order_id, order_id))
+            return cursor.execute("SELECT total_price FROM orders WHERE id = ?", (order_id,)).fetchone()[0]
+    
+    def get_user_orders(self, user_id, after_id=None, limit=None, before_id=None):
+        """دریافت سفارشات یک کاربر - جدیدترین اول، با after_id/before_id و limit صفحه به صفحه"""
+        return self._page("orders", "*", "user_id = ?", (user_id,), after_id, limit, before_id)
+    
+    def iter_user_orders(self, user_id, batch_size=ITER_BATCH_SIZE):
+        """پیمایش جریانی سفارشات یک کاربر"""
+        return self._iterate(self.get_user_orders, user_id, batch_size=batch_size)
+    
+    # ==================== ارسال همگانی ====================
+    
+    def count_broadcast_recipients(self):
+        """تعداد کاربرانی که ربات را بلاک نکرده‌اند"""
+        return self._read("SELECT COUNT(*) FROM users WHERE blocked = 0").fetchone()[0]
+    
+    def create_broadcast(self, from_chat_id, message_id):
+        """ثبت ارسال همگانی جدید برای پیام from_chat_id/message_id - خروجی: شناسه"""
+        total = self.count_broadcast_recipients()
+        with self._write() as cursor:
+            cursor.execute(
+                "INSERT INTO broadcasts (from_chat_id, message_id, total) VALUES (?, ?, ?)",
+                (from_chat_id, message_id, total)
+            )
+            return cursor.lastrowid
+    
+    def get_broadcast(self, broadcast_id):
+        """دریافت ارسال همگانی به صورت دیکشنری"""
+        row = self._read("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        return self._broadcast(row) if row else None
+    
+    def get_running_broadcasts(self):
+        """ارسال‌های همگانی نیمه‌تمام - برای ادامه بعد از ری‌استارت"""
+        rows = self._read("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+        return [self._broadcast(row) for row in rows]
+    
+    @staticmethod
+    def _broadcast(row):
+        (broadcast_id, from_chat_id, message_id, status, last_user_id, total, sent, failed, blocked,
+         progress_chat_id, progress_message_id, created_at, finished_at) = row
+        return {
+            'id': broadcast_id,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'status': status,
+            'last_user_id': last_user_id,
+            'total': total,
+            'sent': sent,
+            'failed': failed,
+            'blocked': blocked,
+            'progress_chat_id': progress_chat_id,
+            'progress_message_id': progress_message_id,
+            'created_at': created_at,
+            'finished_at': finished_at,
+        }
+    
+    def set_broadcast_progress_message(self, broadcast_id, chat_id, message_id):
+        """ثبت پیامی که پیشرفت ارسال در آن نمایش داده می‌شود"""
+        with self._write() as cursor:
+            cursor.execute(
+                "UPDATE broadcasts SET progress_chat_id = ?, progress_message_id = ? WHERE id = ?",
+                (chat_id, message_id, broadcast_id)
+            )
+    
+    def get_broadcast_recipients(self, broadcast_id, after_user_id=0, limit=ITER_BATCH_SIZE):
+        """
+        دسته بعدی گیرنده‌ها به ترتیب user_id (keyset)
+        
+        کاربران بلاک کرده و کسانی که نتیجه‌شان برای این ارسال ثبت شده رد می‌شوند.
+        """
+        rows = self._read("""
+            SELECT user_id FROM users u
+            WHERE blocked = 0 AND user_id > ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM broadcast_deliveries d
+                  WHERE d.broadcast_id = ? AND d.user_id = u.user_id
+              )
+            ORDER BY user_id
+            LIMIT ?
+        """, (after_user_id, broadcast_id, limit))
+        return [row[0] for row in rows]
+    
+    def record_delivery(self, broadcast_id, user_id, status):
+        """ثبت نتیجه ارسال به یک گیرنده و بروزرسانی شمارنده‌ها - کاربر blocked علامت می‌خورد"""
+        if status not in DELIVERY_STATUSES:
+            raise ValueError(f"وضعیت تحویل نامعتبر: {status}")
+        with self._write() as cursor:
+            cursor.execute(
+                "INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, user_id, status) VALUES (?, ?, ?)",
+                (broadcast_id, user_id, status)
+            )
+            if cursor.rowcount:
+                cursor.execute(f"UPDATE broadcasts SET {status} = {status} + 1 WHERE id = ?", (broadcast_id,))
+            if status == 'blocked':
+                cursor.execute("UPDATE users SET blocked = 1 WHERE user_id = ?", (user_id,))
+                # پیام بعدی این کاربر از مسیر _insert_user رد می‌شود و blocked را صفر می‌کند
+                self._after_commit(lambda: self.known_users.forget(user_id))
+    
+    def advance_broadcast(self, broadcast_id, last_user_id):
+        """جلو بردن مکان‌نما بعد از تمام شدن یک دسته"""
+        with self._write() as cursor:
+            cursor.execute("UPDATE broadcasts SET last_user_id = ? WHERE id = ?", (last_user_id, broadcast_id))
+    
+    def finish_broadcast(self, broadcast_id, status='done'):
+        """پایان ارسال همگانی (done یا cancelled) - ارسالی که قبلاً تمام شده تغییر نمی‌کند"""
+        with self._write() as cursor:
+            cursor.execute(
+                "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+                (status, broadcast_id)
+            )
+            return cursor.rowcount > 0
     
     # ==================== آمار ====================
     
     def get_statistics(self):
-        """دریافت آمار کلی"""
-        stats = {}
+        """دریافت آمار کلی از شمارنده‌ها"""
+        counters = dict(self._read("SELECT name, value FROM stats_counters").fetchall())
+        today = self._read(
+            "SELECT orders, income FROM stats_daily WHERE day = DATE('now')"
+        ).fetchone() or (0, 0)
         
-        # تعداد کل سفارشات
-        self.cursor.execute("SELECT COUNT(*) FROM orders")
-        stats['total_orders'] = self.cursor.fetchone()[0]
+        return {
+            'total_orders': int(counters.get('total_orders', 0)),
+            'today_orders': today[0],
+            'total_income': counters.get('total_income', 0),
+            'today_income': today[1],
+            'total_users': int(counters.get('total_users', 0)),
+            'total_products': int(counters.get('total_products', 0)),
+            'pending_orders': int(counters.get('pending_orders', 0)),
+        }
+    
+    def _compute_statistics(self, cursor):
+        """محاسبه آمار از روی جداول اصلی (اسکن کامل)"""
+        counters = {
+            'total_orders': cursor.execute("SELECT COUNT(*) FROM orders").fetchone()[0],
+            'pending_orders': cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'pending'").fetchone()[0],
+            'total_income': cursor.execute(
+                "SELECT TOTAL(total_price) FROM orders WHERE status = 'confirmed'"
+            ).fetchone()[0],
+            'total_users': cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+            'total_products': cursor.execute("SELECT COUNT(*) FROM products").fetchone()[0],
+        }
+        daily = cursor.execute("""
+            SELECT DATE(created_at), COUNT(*), TOTAL(CASE WHEN status = 'confirmed' THEN total_price END)
+            FROM orders GROUP BY DATE(created_at)
+        """).fetchall()
+        return counters, daily
+    
+    def _rebuild_statistics(self, cursor):
+        counters, daily = self._compute_statistics(cursor)
+        cursor.execute("DELETE FROM stats_counters")
+        cursor.executemany(
+            "INSERT INTO stats_counters (name, value) VALUES (?, ?)",
+            [(name, counters[name]) for name in STATS_COUNTERS]
+        )
+        cursor.execute("DELETE FROM stats_daily")
+        cursor.executemany("INSERT INTO stats_daily (day, orders, income) VALUES (?, ?, ?)", daily)
+    
+    def _rebuild_sales_rollups(self, cursor):
+        cursor.execute("DELETE FROM sales_daily")
+        cursor.execute("""
+            INSERT INTO sales_daily (day, orders, revenue, packs)
+            SELECT DATE(o.created_at), COUNT(DISTINCT o.id), TOTAL(i.quantity * i.unit_price), TOTAL(i.quantity)
+            FROM orders o
+            JOIN order_items i ON i.order_id = o.id
+            WHERE o.status = 'confirmed'
+            GROUP BY DATE(o.created_at)
+        """)
+        cursor.execute("DELETE FROM sales_by_pack")
+        cursor.execute("""
+            INSERT INTO sales_by_pack (product_name, pack_name, product_id, pack_id, packs_sold, revenue)
+            SELECT IFNULL(i.product_name, ''), IFNULL(i.pack_name, ''), MAX(i.product_id), MAX(i.pack_id),
+                   SUM(i.quantity), TOTAL(i.quantity * i.unit_price)
+            FROM orders o
+            JOIN order_items i ON i.order_id = o.id
+            WHERE o.status = 'confirmed'
+            GROUP BY IFNULL(i.product_name, ''), IFNULL(i.pack_name, '')
+        """)
+    
+    def rebuild_statistics(self):
+        """ساخت دوباره شمارنده‌های آمار و rollup های فروش از روی جداول اصلی"""
+        with self._write() as cursor:
+            self._rebuild_statistics(cursor)
+            self._rebuild_sales_rollups(cursor)
+    
+    def _statistics_mismatches(self, cursor):
+        """مقایسه شمارنده‌های ذخیره شده با شمارش از روی جداول اصلی"""
+        counters, daily = self._compute_statistics(cursor)
+        stored = dict(cursor.execute("SELECT name, value FROM stats_counters").fetchall())
+        stored_daily = {
+            day: (orders, income)
+            for day, orders, income in cursor.execute("SELECT day, orders, income FROM stats_daily")
+            if orders or income
+        }
         
-        # تعداد سفارشات امروز
-        self.cursor.execute("SELECT COUNT(*) FROM orders WHERE DATE(created_at) = DATE('now')")
-        stats['today_orders'] = self.cursor.fetchone()[0]
+        mismatches = {}
+        for name in STATS_COUNTERS:
+            if abs(stored.get(name, 0) - counters[name]) > 0.005:
+                mismatches[name] = (stored.get(name), counters[name])
+        for day, orders, income in daily:
+            stored_orders, stored_income = stored_daily.pop(day, (0, 0))
+            if stored_orders != orders or abs(stored_income - income) > 0.005:
+                mismatches[f'day:{day}'] = ((stored_orders, stored_income), (orders, income))
+        for day, values in stored_daily.items():
+            mismatches[f'day:{day}'] = (values, (0, 0))
+        return mismatches
+    
+    def check_statistics(self, repair=False):
+        """
+        بررسی سازگاری شمارنده‌ها با جداول اصلی
         
-        # درآمد کل (فقط سفارشات تایید شده)
-        self.cursor.execute("SELECT SUM(total_price) FROM orders WHERE status = 'confirmed'")
-        total_income = self.cursor.fetchone()[0]
-        stats['total_income'] = total_income if total_income else 0
+        شمارش روی اتصال خواندنی انجام می‌شود و جلوی نوشتن‌ها را نمی‌گیرد؛ قفل نوشتن
+        فقط وقتی گرفته می‌شود که repair خواسته شده و ناسازگاری پیدا شده باشد.
+        خروجی: دیکشنری {نام: (مقدار ذخیره شده, مقدار واقعی)} برای موارد ناسازگار
+        """
+        reader = self._reader()
+        # یک snapshot - شمارنده‌ها و جداول اصلی از یک لحظه خوانده می‌شوند
+        reader.execute("BEGIN")
+        try:
+            mismatches = self._statistics_mismatches(reader.cursor())
+        finally:
+            reader.rollback()
         
-        # درآمد امروز
-        self.cursor.execute("SELECT SUM(total_price) FROM orders WHERE status = 'confirmed' AND DATE(created_at) = DATE('now')")
-        today_income = self.cursor.fetchone()[0]
-        stats['today_income'] = today_income if today_income else 0
+        if mismatches and repair:
+            with self._write() as cursor:
+                # شمارش دوباره زیر قفل نوشتن - نوشتن‌های بعد از snapshot هم حساب می‌شوند
+                mismatches = self._statistics_mismatches(cursor)
+                if mismatches:
+                    self._rebuild_statistics(cursor)
+                    self._rebuild_sales_rollups(cursor)
+        return mismatches
+    
+    def get_sales_report(self, days=7, top=5):
+        """
+        گزارش فروش از روی rollup ها
         
-        # تعداد کاربران
-        self.cursor.execute("SELECT COUNT(*) FROM users")
-        stats['total_users'] = self.cursor.fetchone()[0]
+        خروجی: فروش روزانه دو دوره آخر، جمع هفته جاری و قبلی، پرفروش‌ترین پک‌ها و محصولات
+        """
+        daily = self._read("""
+            SELECT day, orders, revenue, packs FROM sales_daily
+            WHERE day > DATE('now', ?) ORDER BY day
+        """, (f'-{days * 2} days',)).fetchall()
         
-        # تعداد محصولات
-        self.cursor.execute("SELECT COUNT(*) FROM products")
-        stats['total_products'] = self.cursor.fetchone()[0]
+        boundary = self._read("SELECT DATE('now', ?)", (f'-{days} days',)).fetchone()[0]
+        current = [row for row in daily if row[0] > boundary]
+        previous = [row for row in daily if row[0] <= boundary]
         
-        # تعداد سفارشات در انتظار
-        self.cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'pending'")
-        stats['pending_orders'] = self.cursor.fetchone()[0]
+        top_packs = self._read("""
+            SELECT product_name, pack_name, packs_sold, revenue FROM sales_by_pack
+            WHERE packs_sold > 0 ORDER BY packs_sold DESC LIMIT ?
+        """, (top,)).fetchall()
+        top_products = self._read("""
+            SELECT product_name, SUM(packs_sold), TOTAL(revenue) FROM sales_by_pack
+            GROUP BY product_name HAVING SUM(packs_sold) > 0
+            ORDER BY TOTAL(revenue) DESC LIMIT ?
+        """, (top,)).fetchall()
         
-        return stats
+        return {
+            'daily': current,
+            'current_revenue': sum(row[2] for row in current),
+            'current_orders': sum(row[1] for row in current),
+            'previous_revenue': sum(row[2] for row in previous),
+            'previous_orders': sum(row[1] for row in previous),
+            'top_packs': top_packs,
+            'top_products': top_products,
+        }
     
     def close(self):
-        """بستن اتصال"""
+        """بستن اتصال‌ها"""
+        self.flush_user_updates()
+        with self._write_lock:
+            self.conn.execute("PRAGMA optimize")
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
         self.conn.close()
+
+class AsyncDatabase:
+    """
+    نسخه async از Database برای هندلرها
+    
+    تمام متدهای Database روی یک ترد جداگانه اجرا می‌شوند تا کوئری‌ها و
+    commit های SQLite حلقه رویداد asyncio را متوقف نکنند. داخل یک آپدیت
+    خواندن‌های IDENTITY_READS از identity map واحد کار جواب داده می‌شوند.
+    """
+    
+    def __init__(self, db, max_workers=DB_WORKERS, group_commit=False):
+        self.db = db
+        # هر ترد اتصال خواندنی خودش را دارد و نوشتن‌ها با قفل سریالی می‌شوند
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        
+        # group commit سبد خرید - درخواست‌ها جمع و با یک تراکنش نوشته می‌شوند
+        self.group_commit = group_commit
+        self._cart_queue = []
+        self._cart_timer = None
+        self._cart_flushes = set()
+    
+    async def run(self, func, *args, **kwargs):
+        """اجرای یک تابع همگام روی ترد دیتابیس"""
+        unit = unit_of_work.current()
+        if unit is not None:
+            unit.queries += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+        
+        kind = IDENTITY_READS.get(name)
+        stale = IDENTITY_WRITES.get(name, ())
+        
+        async def method(*args, **kwargs):
+            unit = unit_of_work.current()
+            if unit is None:
+                return await self.run(attr, *args, **kwargs)
+            
+            if kind is not None and not kwargs:
+                found, row = unit.get(kind, args)
+                if found:
+                    return row
+                row = await self.run(attr, *args)
+                unit.put(kind, args, row)
+                return row
+            
+            for stale_kind in stale:
+                unit.forget(stale_kind)
+            return await self.run(attr, *args, **kwargs)
+        
+        method.__name__ = name
+        return method
+    
+    async def iterate(self, name, *args, batch_size=ITER_BATCH_SIZE):
+        """
+        نسخه async پیمایش جریانی: هر دسته با یک کوئری روی ترد دیتابیس خوانده می‌شود
+        
+        مثال:
+            async for order in db.iterate('get_orders_by_status', 'pending'):
+                ...
+        """
+        method = getattr(self.db, name)
+        after_id = None
+        while True:
+            page = await self.run(method, *args, after_id=after_id, limit=batch_size)
+            for row in page:
+                yield row
+            if len(page) < batch_size:
+                return
+            after_id = page_cursor(page[-1])
+    
+    # ==================== کاتالوگ ====================
+    # در hit کش، بدون رفتن به ترد دیتابیس جواب داده می‌شود
+    
+    async def get_product(self, product_id):
+        found, product = self.db.catalog.lookup_product(product_id)
+        if not found:
+            product = await self.run(self.db._load_product, product_id)
+        return product
+    
+    async def get_pack(self, pack_id):
+        found, pack = self.db.catalog.lookup_pack(pack_id)
+        if found:
+            return pack
+        
+        # پکی که در کش نیست (خواندن هم‌زمان با تغییر یا بیرون رفته از کش) - در واحد کار نگه داشته می‌شود
+        unit = unit_of_work.current()
+        if unit is not None:
+            found, pack = unit.get('pack', (pack_id,))
+            if found:
+                return pack
+        pack = await self.run(self.db._load_pack, pack_id)
+        if unit is not None:
+            unit.put('pack', (pack_id,), pack)
+        return pack
+    
+    async def get_packs(self, product_id):
+        packs = self.db.catalog.get_packs(product_id)
+        if packs is None:
+            packs = await self.run(self.db._load_packs, product_id)
+        return packs
+    
+    async def get_packs_for_products(self, product_ids):
+        result = {}
+        missing = []
+        for product_id in product_ids:
+            packs = self.db.catalog.get_packs(product_id)
+            if packs is None:
+                missing.append(product_id)
+            else:
+                result[product_id] = packs
+        if missing:
+            result.update(await self.run(self.db._load_packs_for_products, missing))
+        return result
+    
+    # ==================== سبد خرید ====================
+    
+    async def add_to_cart(self, user_id, product_id, pack_id, quantity=1):
+        """
+        افزودن به سبد خرید
+        
+        در حالت group commit درخواست در صف می‌ماند تا همراه بقیه درخواست‌های
+        CART_BATCH_DELAY ثانیه اخیر (حداکثر CART_BATCH_SIZE تا) با یک commit نوشته
+        شود؛ فراخوان تا commit شدن منتظر می‌ماند.
+        """
+        if not self.group_commit:
+            return await self.run(self.db.add_to_cart, user_id, product_id, pack_id, quantity)
+        
+        unit = unit_of_work.current()
+        if unit is not None:
+            unit.queries += 1
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cart_queue.append(((user_id, product_id, pack_id, quantity), future))
+        if len(self._cart_queue) >= CART_BATCH_SIZE:
+            self._flush_cart()
+        elif self._cart_timer is None:
+            self._cart_timer = loop.call_later(CART_BATCH_DELAY, self._flush_cart)
+        
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def _flush_cart(self):
+        """ارسال صف سبد خرید به ترد دیتابیس به صورت یک دسته"""
+        if self._cart_timer is not None:
+            self._cart_timer.cancel()
+            self._cart_timer = None
+        batch, self._cart_queue = self._cart_queue, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._write_cart_batch(batch))
+            self._cart_flushes.add(task)
+            task.add_done_callback(self._cart_flushes.discard)
+    
+    async def _write_cart_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        requests = [request for request, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, self.db.add_to_cart_many, requests)
+        except Exception as error:
+            results = [error] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    # ==================== کاربران ====================
+    
+    async def get_users(self, user_ids):
+        # کاربرهای خوانده شده در identity map هم قرار می‌گیرند
+        users = await self.run(self.db.get_users, user_ids)
+        unit = unit_of_work.current()
+        if unit is not None:
+            for user_id in user_ids:
+                unit.put('user', (user_id,), users.get(user_id))
+        return users
+    
+    async def add_user(self, user_id, username, first_name):
+        unit = unit_of_work.current()
+        if unit is not None:
+            unit.forget('user')
+        
+        # کاربر شناخته شده بدون رفتن به ترد دیتابیس رد می‌شود
+        if self.db.known_users.seen(user_id, username, first_name):
+            if self.db.known_users.flush_due():
+                await self.run(self.db.flush_user_updates)
+            return
+        await self.run(self.db._insert_user, user_id, username, first_name)
+    
+    def close(self):
+        """بستن ترد و اتصال دیتابیس"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
@@ -3,15 +3,25 @@
 """
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
+from telegram.helpers import escape_markdown
 from config import ADMIN_ID, MESSAGES
-from states import PRODUCT_NAME, PRODUCT_DESC, PRODUCT_PHOTO, PACK_NAME, PACK_QUANTITY, PACK_PRICE
+from database import fetch_page, page_count
+import unit_of_work
+from broadcast import progress_text, start_broadcast
+from states import PRODUCT_NAME, PRODUCT_DESC, PRODUCT_PHOTO, PACK_NAME, PACK_QUANTITY, PACK_PRICE, BROADCAST_MESSAGE
 from keyboards import (
     admin_main_keyboard, 
     product_management_keyboard,
+    product_browser_keyboard,
     back_to_products_keyboard,
+    broadcast_confirm_keyboard,
+    broadcast_progress_keyboard,
     cancel_keyboard
 )
 
+# تعداد محصول در هر صفحه مرورگر محصولات
+PRODUCTS_PAGE_SIZE = 5
+
 
 async def is_admin(user_id):
     """بررسی ادمین بودن کاربر"""
@@ -74,7 +84,7 @@ async def product_photo_received(update: Update, context: ContextTypes.DEFAULT_T
     
     # ذخیره در دیتابیس
     db = context.bot_data['db']
-    product_id = db.add_product(
+    product_id = await db.add_product(
         context.user_data['product_name'],
         context.user_data['product_desc'],
         context.user_data['product_photo']
@@ -96,42 +106,248 @@ async def product_photo_received(update: Update, context: ContextTypes.DEFAULT_T
     return ConversationHandler.END
 
 
+async def product_browser_page(db, page=1, after_id=None, before_id=None):
+    """
+    متن و کیبورد یک صفحه از مرورگر محصولات
+    
+    فقط محصولات همین صفحه و پک‌هایشان خوانده می‌شوند. خروجی: (متن, کیبورد)
+    """
+    products, page, _has_prev, has_next = await fetch_page(
+        db.get_all_products, PRODUCTS_PAGE_SIZE, page, after_id, before_id
+    )
+    if not products:
+        return "هیچ محصولی ثبت نشده است.", None
+    
+    pages = page_count(page, await db.count_products(), PRODUCTS_PAGE_SIZE)
+    product_packs = await db.get_packs_for_products([product.id for product in products])
+    
+    text = f"📦 لیست محصولات - صفحه {page} از {pages}\n"
+    text += "═" * 25 + "\n\n"
+    for product in products:
+        text += f"🏷 #{product.id} {product.name}\n"
+        packs = product_packs[product.id]
+        if packs:
+            for pack in packs:
+                text += f"   • {pack.name}: {pack.quantity} تایی - {pack.price:,.0f} تومان\n"
+        else:
+            text += "   ⚠️ هنوز پکی تعریف نشده است.\n"
+        text += "\n"
+    text += "🔎 رفتن به یک محصول: /product شناسه"
+    
+    return text, product_browser_keyboard(products, page, pages, has_next)
+
+
+async def product_detail(db, product_id):
+    """متن و کیبورد مدیریت یک محصول - خروجی: (متن, کیبورد) یا None اگر محصول نباشد"""
+    product = await db.get_product(product_id)
+    if not product:
+        return None
+    packs = await db.get_packs(product_id)
+    
+    text = f"🏷 #{product.id} {product.name}\n\n{product.description}\n\n"
+    if packs:
+        text += "📦 پک‌های موجود:\n"
+        for pack in packs:
+            text += f"• {pack.name}: {pack.quantity} تایی - {pack.price:,.0f} تومان\n"
+    else:
+        text += "⚠️ هنوز پکی تعریف نشده است."
+    
+    return text, product_management_keyboard(product_id, has_photo=bool(product.photo_id))
+
+
 async def list_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش لیست محصولات"""
+    """نمایش لیست محصولات - یک پیام صفحه‌بندی شده که در جا ویرایش می‌شود"""
     if not await is_admin(update.effective_user.id):
         return
     
     db = context.bot_data['db']
-    products = db.get_all_products()
+    text, keyboard = await product_browser_page(db)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def browse_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """رفتن به صفحه قبلی یا بعدی مرورگر محصولات"""
+    query = update.callback_query
+    await query.answer()
     
-    if not products:
-        await update.message.reply_text("هیچ محصولی ثبت نشده است.")
+    if not await is_admin(update.effective_user.id):
         return
     
-    for product in products:
-        product_id, name, desc, photo_id, *_ = product
-        packs = db.get_packs(product_id)
-        
-        text = f"🏷 {name}\n\n{desc}\n\n"
-        if packs:
-            text += "📦 پک‌های موجود:\n"
-            for pack in packs:
-                _, _, pack_name, quantity, price = pack
-                text += f"• {pack_name}: {quantity} تایی - {price:,.0f} تومان\n"
-        else:
-            text += "⚠️ هنوز پکی تعریف نشده است."
-        
-        if photo_id:
-            await update.message.reply_photo(
-                photo_id,
-                caption=text,
-                reply_markup=product_management_keyboard(product_id)
-            )
-        else:
-            await update.message.reply_text(
-                text,
-                reply_markup=product_management_keyboard(product_id)
-            )
+    _, direction, row_id, page = query.data.split(":")
+    row_id, page = int(row_id), int(page)
+    db = context.bot_data['db']
+    
+    if direction == "next":
+        text, keyboard = await product_browser_page(db, page + 1, after_id=row_id)
+    else:
+        text, keyboard = await product_browser_page(db, page - 1, before_id=row_id)
+    await query.edit_message_text(text, reply_markup=keyboard)
+
+
+async def back_to_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """بازگشت به صفحه اول مرورگر محصولات"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    db = context.bot_data['db']
+    text, keyboard = await product_browser_page(db)
+    
+    # پیام‌های عکس‌دار قدیمی را نمی‌شود به متن تبدیل کرد
+    if query.message.photo:
+        await query.message.reply_text(text, reply_markup=keyboard)
+    else:
+        await query.edit_message_text(text, reply_markup=keyboard)
+
+
+async def manage_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش مدیریت یک محصول در همان پیام مرورگر"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    product_id = int(query.data.split(":")[1])
+    db = context.bot_data['db']
+    detail = await product_detail(db, product_id)
+    
+    if not detail:
+        text, keyboard = await product_browser_page(db)
+        await query.edit_message_text("❌ محصول یافت نشد.\n\n" + text, reply_markup=keyboard)
+        return
+    
+    text, keyboard = detail
+    await query.edit_message_text(text, reply_markup=keyboard)
+
+
+async def jump_to_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دستور /product شناسه - باز کردن مستقیم مدیریت یک محصول"""
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("❌ استفاده: /product شناسه")
+        return
+    
+    db = context.bot_data['db']
+    detail = await product_detail(db, int(context.args[0]))
+    
+    if not detail:
+        await update.message.reply_text("❌ محصول یافت نشد.")
+        return
+    
+    text, keyboard = detail
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def show_product_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ارسال عکس محصول - فقط وقتی ادمین بخواهد"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    product_id = int(query.data.split(":")[1])
+    db = context.bot_data['db']
+    product = await db.get_product(product_id)
+    
+    if product and product.photo_id:
+        await query.message.reply_photo(product.photo_id, caption=f"🏷 {product.name}")
+
+
+async def noop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دکمه‌های نمایشی مثل شماره صفحه"""
+    await update.callback_query.answer()
+
+
+# ==================== ارسال همگانی ====================
+
+async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """شروع ارسال همگانی"""
+    if not await is_admin(update.effective_user.id):
+        return ConversationHandler.END
+    
+    await update.message.reply_text(
+        "📣 پیامی که باید برای همه کاربران ارسال شود را بفرستید\n"
+        "(متن، عکس با کپشن یا هر نوع پیام دیگر):",
+        reply_markup=cancel_keyboard()
+    )
+    return BROADCAST_MESSAGE
+
+
+async def broadcast_message_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت پیام ارسال همگانی و نمایش تایید"""
+    if update.message.text == "❌ لغو":
+        await update.message.reply_text("لغو شد.", reply_markup=admin_main_keyboard())
+        return ConversationHandler.END
+    
+    # خود پیام با copy_message برای کاربران کپی می‌شود
+    context.user_data['broadcast_draft'] = (update.message.chat_id, update.message.message_id)
+    
+    db = context.bot_data['db']
+    recipients = await db.count_broadcast_recipients()
+    
+    await update.message.reply_text("📝 پیام دریافت شد.", reply_markup=admin_main_keyboard())
+    await update.message.reply_text(
+        f"📣 پیام بالا برای {recipients:,} کاربر ارسال شود؟",
+        reply_markup=broadcast_confirm_keyboard()
+    )
+    return ConversationHandler.END
+
+
+async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """شروع ارسال همگانی در پس‌زمینه - همین پیام به پیام پیشرفت تبدیل می‌شود"""
+    query = update.callback_query
+    await query.answer()
+    
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    draft = context.user_data.pop('broadcast_draft', None)
+    if draft is None:
+        await query.edit_message_text("❌ پیام ارسال همگانی پیدا نشد. دوباره شروع کنید.")
+        return
+    
+    db = context.bot_data['db']
+    broadcast_id = await db.create_broadcast(*draft)
+    await db.set_broadcast_progress_message(broadcast_id, query.message.chat_id, query.message.message_id)
+    broadcast = await db.get_broadcast(broadcast_id)
+    
+    await query.edit_message_text(
+        progress_text(broadcast),
+        reply_markup=broadcast_progress_keyboard(broadcast_id)
+    )
+    start_broadcast(context.application, broadcast_id)
+
+
+async def discard_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """لغو پیش‌نویس ارسال همگانی"""
+    query = update.callback_query
+    await query.answer()
+    
+    context.user_data.pop('broadcast_draft', None)
+    await query.edit_message_text("❌ ارسال همگانی لغو شد.")
+
+
+async def stop_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """توقف ارسال همگانی در حال اجرا - در پایان دسته فعلی اثر می‌کند"""
+    query = update.callback_query
+    
+    if not await is_admin(update.effective_user.id):
+        await query.answer()
+        return
+    
+    broadcast_id = int(query.data.split(":")[1])
+    db = context.bot_data['db']
+    
+    if await db.finish_broadcast(broadcast_id, 'cancelled'):
+        await query.answer("⏹ ارسال بعد از دسته فعلی متوقف می‌شود.")
+    else:
+        await query.answer("این ارسال قبلاً تمام شده است.", show_alert=True)
 
 
 async def add_pack_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -190,7 +406,7 @@ async def pack_price_received(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         # ذخیره در دیتابیس
         db = context.bot_data['db']
-        db.add_pack(
+        await db.add_pack(
             context.user_data['adding_pack_to'],
             context.user_data['pack_name'],
             context.user_data['pack_quantity'],
@@ -218,7 +434,7 @@ async def view_packs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     product_id = int(query.data.split(":")[1])
     db = context.bot_data['db']
-    packs = db.get_packs(product_id)
+    packs = await db.get_packs(product_id)
     
     if not packs:
         await query.message.reply_text("هیچ پکی برای این محصول تعریف نشده است.")
@@ -226,11 +442,10 @@ async def view_packs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     text = "📦 پک‌های موجود:\n\n"
     for pack in packs:
-        pack_id, _, name, quantity, price = pack
-        text += f"🆔 {pack_id}\n"
-        text += f"📦 {name}\n"
-        text += f"🔢 تعداد: {quantity}\n"
-        text += f"💰 قیمت: {price:,.0f} تومان\n\n"
+        text += f"🆔 {pack.id}\n"
+        text += f"📦 {pack.name}\n"
+        text += f"🔢 تعداد: {pack.quantity}\n"
+        text += f"💰 قیمت: {pack.price:,.0f} تومان\n\n"
     
     await query.message.reply_text(text, reply_markup=back_to_products_keyboard())
 
@@ -251,8 +466,8 @@ async def get_channel_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     product_id = int(query.data.split(":")[1])
     db = context.bot_data['db']
-    product = db.get_product(product_id)
-    packs = db.get_packs(product_id)
+    product = await db.get_product(product_id)
+    packs = await db.get_packs(product_id)
     
     if not product:
         await query.message.reply_text("❌ محصول یافت نشد.")
@@ -262,7 +477,7 @@ async def get_channel_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("⚠️ ابتدا حداقل یک پک برای این محصول تعریف کنید.")
         return
     
-    _, name, desc, photo_id, *_ = product
+    name, desc, photo_id = product.name, product.description, product.photo_id
     
     # ساخت متن پست با لیست پک‌ها
     caption = f"🏷 **{name}**\n\n"
@@ -272,9 +487,8 @@ async def get_channel_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pack_names = ["اول", "دوم", "سوم", "چهارم", "پنجم", "ششم", "هفتم", "هشتم", "نهم", "دهم"]
     
     for idx, pack in enumerate(packs):
-        _, _, pack_name, quantity, price = pack
         pack_num = pack_names[idx] if idx < len(pack_names) else f"{idx + 1}"
-        caption += f"📦 پک {pack_num}: {pack_name} - {price:,.0f} تومان\n"
+        caption += f"📦 پک {pack_num}: {pack.name} - {pack.price:,.0f} تومان\n"
     
     caption += "\n💎 برای سفارش روی دکمه پک مورد نظر کلیک کنید 👇"
     
@@ -285,12 +499,11 @@ async def get_channel_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # دکمه‌های پک‌ها
     for idx, pack in enumerate(packs):
-        pack_id, prod_id, pack_name, quantity, price = pack
         pack_num = pack_names[idx] if idx < len(pack_names) else f"{idx + 1}"
         button_text = f"انتخاب پک {pack_num}"
         keyboard.append([InlineKeyboardButton(
             button_text, 
-            callback_data=f"select_pack:{product_id}:{pack_id}"
+            callback_data=f"select_pack:{product_id}:{pack.id}"
         )])
     
     # دکمه ثابت سبد خرید
@@ -352,10 +565,16 @@ async def delete_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     product_id = int(query.data.split(":")[1])
     db = context.bot_data['db']
-    db.delete_product(product_id)
+    await db.delete_product(product_id)
     
-    await query.message.reply_text("✅ محصول حذف شد.")
-    await query.message.delete()
+    # پیام‌های عکس‌دار قدیمی مثل قبل حذف می‌شوند، مرورگر به صفحه اول برمی‌گردد
+    if query.message.photo:
+        await query.message.reply_text("✅ محصول حذف شد.")
+        await query.message.delete()
+        return
+    
+    text, keyboard = await product_browser_page(db)
+    await query.edit_message_text("✅ محصول حذف شد.\n\n" + text, reply_markup=keyboard)
 
 
 async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -364,7 +583,7 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     db = context.bot_data['db']
-    stats = db.get_statistics()
+    stats = await db.get_statistics()
     
     text = "📊 **آمار فروشگاه**\n"
     text += "═" * 25 + "\n\n"
@@ -377,6 +596,95 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += f"📈 درآمد امروز: {stats['today_income']:,.0f} تومان\n\n"
     
     text += f"👥 تعداد کاربران: {stats['total_users']}\n"
-    text += f"🏷 تعداد محصولات: {stats['total_products']}\n"
+    text += f"🏷 تعداد محصولات: {stats['total_products']}\n\n"
+    
+    cache = db.catalog.stats()
+    text += f"🗂 کش کاتالوگ: {cache['hits']} hit / {cache['misses']} miss\n"
+    text += f"👤 `add_user` بدون نوشتن: {db.known_users.skipped}\n"
+    
+    outbox = context.bot.rate_limiter
+    if outbox is not None:
+        sent = outbox.stats()
+        text += f"📤 ارسال‌ها: {sum(sent['sent'].values())} ({sent['delayed']} با تاخیر، "
+        text += f"میانگین {sent['average_wait']:.2f} ثانیه)، RetryAfter: {sent['retries']}، "
+        text += f"بیشترین صف: {sent['peak_waiting']}\n"
+    
+    processor = context.application.update_processor
+    if hasattr(processor, 'stats'):
+        updates = processor.stats()
+        text += f"⚙️ آپدیت‌ها: {updates['processed']} (بیشترین هم‌زمان {updates['peak_running']} از "
+        text += f"{updates['workers']}، {updates['serialized']} منتظر آپدیت قبلی همان کاربر)\n"
+        for name, lane in updates['lanes'].items():
+            text += f"▫️ {name}: {lane['processed']}، صف {lane['waiting']} (بیشترین {lane['peak_waiting']})، "
+            text += f"انتظار میانگین {lane['average_wait'] * 1000:.0f}ms / بیشترین {lane['max_wait'] * 1000:.0f}ms\n"
+    
+    # پرکوئری‌ترین آپدیت‌ها - برای دیدن N+1 و کوئری‌های تکراری
+    heaviest = unit_of_work.query_stats()[:3]
+    if heaviest:
+        text += "\n🔎 **کوئری در هر آپدیت:**\n"
+        for name, count, average, peak in heaviest:
+            text += f"▫️ {escape_markdown(name)}: میانگین {average:.1f}، بیشترین {peak} ({count} بار)\n"
+    
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+
+async def check_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """بررسی و بازسازی شمارنده‌های آمار"""
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    db = context.bot_data['db']
+    mismatches = await db.check_statistics(repair=True)
+    
+    if not mismatches:
+        await update.message.reply_text("✅ شمارنده‌های آمار سالم هستند.")
+        return
+    
+    text = "⚠️ شمارنده‌های ناسازگار پیدا و بازسازی شدند:\n\n"
+    for name, (stored, actual) in mismatches.items():
+        text += f"• {name}: {stored} ← {actual}\n"
+    
+    await update.message.reply_text(text)
+
+
+async def sales_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """گزارش فروش: روند روزانه، مقایسه هفتگی و پرفروش‌ترین‌ها"""
+    if not await is_admin(update.effective_user.id):
+        return
+    
+    db = context.bot_data['db']
+    report = await db.get_sales_report()
+    
+    text = "📈 **گزارش فروش**\n"
+    text += "═" * 25 + "\n\n"
+    
+    text += "📅 **۷ روز اخیر:**\n"
+    if report['daily']:
+        for day, orders, revenue, packs in report['daily']:
+            text += f"▫️ {day}: {orders} سفارش - {packs} پک - {revenue:,.0f} تومان\n"
+    else:
+        text += "▫️ فروشی ثبت نشده است.\n"
+    
+    current = report['current_revenue']
+    previous = report['previous_revenue']
+    text += "\n📊 **مقایسه هفتگی:**\n"
+    text += f"▫️ این هفته: {current:,.0f} تومان ({report['current_orders']} سفارش)\n"
+    text += f"▫️ هفته قبل: {previous:,.0f} تومان ({report['previous_orders']} سفارش)\n"
+    if previous:
+        change = (current - previous) / previous * 100
+        arrow = "🔺" if change >= 0 else "🔻"
+        text += f"▫️ تغییر: {arrow} {change:+.0f}%\n"
+    
+    if report['top_packs']:
+        text += "\n🏆 **پرفروش‌ترین پک‌ها:**\n"
+        for idx, (product_name, pack_name, packs_sold, revenue) in enumerate(report['top_packs'], start=1):
+            # نام‌ها را ادمین تایپ کرده و ممکن است _ یا * داشته باشند
+            text += f"{idx}. {escape_markdown(product_name)} - {escape_markdown(pack_name)}: "
+            text += f"{packs_sold} پک ({revenue:,.0f} تومان)\n"
+    
+    if report['top_products']:
+        text += "\n🏷 **پرفروش‌ترین محصولات:**\n"
+        for idx, (product_name, packs_sold, revenue) in enumerate(report['top_products'], start=1):
+            text += f"{idx}. {escape_markdown(product_name)}: {packs_sold} پک ({revenue:,.0f} تومان)\n"
     
     await update.message.reply_text(text, parse_mode='Markdown')
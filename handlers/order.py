@@ -1,25 +1,43 @@
 """
 مدیریت سفارشات و پرداخت‌ها
 """
-import json
+import functools
+
 from telegram import Update
 from telegram.ext import ContextTypes
 from config import ADMIN_ID, MESSAGES, CARD_NUMBER, CARD_HOLDER
-from keyboards import order_confirmation_keyboard, payment_confirmation_keyboard, user_main_keyboard
+from database import fetch_page, page_count
+from keyboards import (
+    order_confirmation_keyboard,
+    payment_confirmation_keyboard,
+    receipt_order_keyboard,
+    order_queue_keyboard,
+    back_to_queue_keyboard,
+    user_main_keyboard
+)
+
+# تعداد سفارش در هر صفحه صف‌های کاری ادمین
+QUEUE_PAGE_SIZE = 5
+
+# صف‌های کاری ادمین: نام صف -> (وضعیت سفارش, عنوان, پیام خالی بودن صف)
+ADMIN_QUEUES = {
+    'pending': ('pending', "📋 سفارشات در انتظار تایید", "هیچ سفارش جدیدی وجود ندارد."),
+    'receipts': ('receipt_sent', "💳 رسیدهای در انتظار تایید", "هیچ رسیدی در انتظار تایید نیست."),
+}
 
 
 async def send_order_to_admin(context: ContextTypes.DEFAULT_TYPE, order_id: int):
     """ارسال سفارش به ادمین برای تایید"""
     db = context.bot_data['db']
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     
     if not order:
         return
     
     # تغییر: 8 فیلد به جای 7
-    order_id_val, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-    items = json.loads(items_json)
-    user = db.get_user(user_id)
+    order_id_val, user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+    items = await db.get_order_items(order_id_val)
+    user = await db.get_user(user_id)
     
     # دریافت امن اطلاعات کاربر
     first_name = user[2] if len(user) > 2 else "کاربر"
@@ -50,43 +68,127 @@ async def send_order_to_admin(context: ContextTypes.DEFAULT_TYPE, order_id: int)
     )
 
 
-async def view_pending_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش سفارشات در انتظار تایید"""
-    db = context.bot_data['db']
-    orders = db.get_pending_orders()
-    
+async def order_queue_page(db, queue, page=1, after_id=None, before_id=None):
+    """
+    متن و کیبورد یک صفحه از صف کاری ادمین
+    
+    فقط سفارش‌های همین صفحه، کاربرها و آیتم‌هایشان خوانده می‌شوند.
+    خروجی: (متن, کیبورد) - کیبورد None یعنی صف خالی است
+    """
+    status, title, empty = ADMIN_QUEUES[queue]
+    orders, page, _has_prev, has_next = await fetch_page(
+        functools.partial(db.get_orders_by_status, status), QUEUE_PAGE_SIZE, page, after_id, before_id
+    )
     if not orders:
-        await update.message.reply_text("هیچ سفارش جدیدی وجود ندارد.")
-        return
+        return empty, None
+    
+    total = await db.count_orders_by_status(status)
+    pages = page_count(page, total, QUEUE_PAGE_SIZE)
+    users = await db.get_users([order[1] for order in orders])
+    order_items = await db.get_items_for_orders([order[0] for order in orders])
     
+    text = f"{title}\n"
+    text += f"⏳ {total} مورد باقی‌مانده - صفحه {page} از {pages}\n"
+    text += "═" * 25 + "\n\n"
     for order in orders:
-        # تغییر: 8 فیلد به جای 7
-        order_id, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-        items = json.loads(items_json)
-        user = db.get_user(user_id)
+        order_id, user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+        user = users.get(user_id) or ()
+        items = order_items[order_id]
         
-        # دریافت امن اطلاعات کاربر
         first_name = user[2] if len(user) > 2 else "کاربر"
         username = user[1] if len(user) > 1 and user[1] else "ندارد"
-        phone = user[4] if len(user) > 4 and user[4] else "ندارد"
-        full_name = user[3] if len(user) > 3 and user[3] else "ندارد"
-        address = user[6] if len(user) > 6 and user[6] else "ندارد"
+        packs = sum(item['quantity'] for item in items)
         
-        text = f"📋 سفارش #{order_id}\n\n"
-        text += f"👤 {first_name} (@{username})\n"
-        text += f"📝 نام: {full_name}\n"
-        text += f"📞 {phone}\n"
-        text += f"📍 {address}\n\n"
-        
-        for item in items:
-            text += f"• {item['product']} ({item['pack']}) x{item['quantity']}\n"
-        
-        text += f"\n💰 {total_price:,.0f} تومان"
-        
-        await update.message.reply_text(
-            text,
-            reply_markup=order_confirmation_keyboard(order_id)
-        )
+        text += f"#{order_id} - {first_name} (@{username})\n"
+        text += f"   📦 {len(items)} مدل، {packs} پک - 💰 {total_price:,.0f} تومان\n"
+        text += f"   📅 {created_at}\n\n"
+    text += "برای بررسی روی سفارش مورد نظر بزنید 👇"
+    
+    return text, order_queue_keyboard(queue, orders, page, pages, has_next)
+
+
+def order_card_text(order, items, user):
+    """متن کامل یک سفارش برای بررسی ادمین"""
+    order_id, user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+    user = user or ()
+    
+    first_name = user[2] if len(user) > 2 else "کاربر"
+    username = user[1] if len(user) > 1 and user[1] else "ندارد"
+    phone = user[4] if len(user) > 4 and user[4] else "ندارد"
+    full_name = user[3] if len(user) > 3 and user[3] else "ندارد"
+    address = user[6] if len(user) > 6 and user[6] else "ندارد"
+    
+    text = f"📋 سفارش #{order_id}\n\n"
+    text += f"👤 {first_name} (@{username})\n"
+    text += f"📝 نام: {full_name}\n"
+    text += f"📞 {phone}\n"
+    text += f"📍 {address}\n\n"
+    
+    for item in items:
+        text += f"• {item['product']} ({item['pack']}) x{item['quantity']}\n"
+    
+    text += f"\n💰 {total_price:,.0f} تومان"
+    return text
+
+
+async def view_pending_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش صف سفارشات در انتظار تایید - یک پیام صفحه‌بندی شده"""
+    db = context.bot_data['db']
+    text, keyboard = await order_queue_page(db, 'pending')
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def browse_order_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """صفحه قبلی/بعدی یا بروزرسانی یک صف کاری ادمین"""
+    query = update.callback_query
+    await query.answer()
+    
+    if update.effective_user.id != ADMIN_ID:
+        return
+    
+    parts = query.data.split(":")
+    queue = parts[0][len("queue_"):]
+    db = context.bot_data['db']
+    
+    if parts[1] == "next":
+        text, keyboard = await order_queue_page(db, queue, int(parts[3]) + 1, after_id=int(parts[2]))
+    elif parts[1] == "prev":
+        text, keyboard = await order_queue_page(db, queue, int(parts[3]) - 1, before_id=int(parts[2]))
+    else:
+        text, keyboard = await order_queue_page(db, queue)
+    
+    # پیام عکس‌دار (رسید) را نمی‌شود به متن تبدیل کرد
+    if query.message.photo:
+        await query.message.reply_text(text, reply_markup=keyboard)
+    else:
+        await query.edit_message_text(text, reply_markup=keyboard)
+
+
+async def open_pending_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """نمایش کامل یک سفارش صف در همان پیام، با دکمه‌های تایید و رد"""
+    query = update.callback_query
+    
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer()
+        return
+    
+    order_id = int(query.data.split(":")[1])
+    db = context.bot_data['db']
+    order = await db.get_order(order_id)
+    
+    if not order or order[4] != 'pending':
+        await query.answer("این سفارش دیگر در صف نیست.", show_alert=True)
+        text, keyboard = await order_queue_page(db, 'pending')
+        await query.edit_message_text(text, reply_markup=keyboard)
+        return
+    await query.answer()
+    
+    items = await db.get_order_items(order_id)
+    user = await db.get_user(order[1])
+    await query.edit_message_text(
+        order_card_text(order, items, user),
+        reply_markup=order_confirmation_keyboard(order_id, from_queue=True)
+    )
 
 
 async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -98,10 +200,10 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = context.bot_data['db']
     
     # تغییر وضعیت به در انتظار پرداخت
-    db.update_order_status(order_id, 'waiting_payment')
+    await db.update_order_status(order_id, 'waiting_payment')
     
     # پیام به کاربر
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     total_price = order[3]
     
@@ -115,7 +217,8 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # ویرایش پیام ادمین
     await query.edit_message_text(
-        query.message.text + "\n\n✅ تایید شد - در انتظار پرداخت"
+        query.message.text + "\n\n✅ تایید شد - در انتظار پرداخت",
+        reply_markup=back_to_queue_keyboard('pending')
     )
 
 
@@ -126,14 +229,14 @@ async def reject_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     order_id = int(query.data.split(":")[1])
     db = context.bot_data['db']
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
         return
     
-    order_id_val, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-    items = json.loads(items_json)
+    order_id_val, user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+    items = await db.get_order_items(order_id_val)
     
     # نمایش لیست آیتم‌ها برای حذف
     from keyboards import order_items_removal_keyboard
@@ -162,35 +265,28 @@ async def remove_item_from_order(update: Update, context: ContextTypes.DEFAULT_T
     
     data = query.data.split(":")
     order_id = int(data[1])
-    item_index = int(data[2])
+    item_id = int(data[2])
     
     db = context.bot_data['db']
-    order = db.get_order(order_id)
+    items = await db.get_order_items(order_id)
     
-    if not order:
+    if not items:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
         return
     
-    order_id_val, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-    items = json.loads(items_json)
+    removed_item = next((item for item in items if item['id'] == item_id), None)
+    if not removed_item:
+        await query.answer("❌ آیتم یافت نشد!", show_alert=True)
+        return
     
     # بررسی اگر فقط یک آیتم مونده
     if len(items) <= 1:
         await query.answer("⚠️ نمی‌توانید آخرین آیتم را حذف کنید! از 'رد کامل سفارش' استفاده کنید.", show_alert=True)
         return
     
-    # حذف آیتم
-    removed_item = items.pop(item_index)
-    
-    # محاسبه مجدد قیمت کل
-    new_total = sum(item['price'] for item in items)
-    
-    # بروزرسانی سفارش در دیتابیس
-    db.cursor.execute(
-        "UPDATE orders SET items = ?, total_price = ? WHERE id = ?",
-        (json.dumps(items, ensure_ascii=False), new_total, order_id)
-    )
-    db.conn.commit()
+    # حذف آیتم - مبلغ کل در دیتابیس دوباره محاسبه می‌شود
+    new_total = await db.remove_order_item(order_id, item_id)
+    items.remove(removed_item)
     
     # نمایش لیست به‌روز شده
     from keyboards import order_items_removal_keyboard
@@ -222,10 +318,10 @@ async def reject_full_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = context.bot_data['db']
     
     # تغییر وضعیت
-    db.update_order_status(order_id, 'rejected')
+    await db.update_order_status(order_id, 'rejected')
     
     # پیام به کاربر
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     
     await context.bot.send_message(
@@ -236,7 +332,8 @@ async def reject_full_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # ویرایش پیام ادمین
     await query.edit_message_text(
-        query.message.text + "\n\n❌ رد شد (کامل)"
+        query.message.text + "\n\n❌ رد شد (کامل)",
+        reply_markup=back_to_queue_keyboard('pending')
     )
 
 
@@ -247,38 +344,18 @@ async def back_to_order_review(update: Update, context: ContextTypes.DEFAULT_TYP
     
     order_id = int(query.data.split(":")[1])
     db = context.bot_data['db']
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     
     if not order:
         await query.answer("❌ سفارش یافت نشد!", show_alert=True)
         return
     
     # نمایش دوباره سفارش با دکمه‌های تایید/رد
-    order_id_val, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-    items = json.loads(items_json)
-    user = db.get_user(user_id)
-    
-    first_name = user[2] if len(user) > 2 else "کاربر"
-    username = user[1] if len(user) > 1 and user[1] else "ندارد"
-    phone = user[4] if len(user) > 4 and user[4] else "ندارد"
-    full_name = user[3] if len(user) > 3 and user[3] else "ندارد"
-    address = user[6] if len(user) > 6 and user[6] else "ندارد"
-    
-    text = f"📋 سفارش #{order_id}\n\n"
-    text += f"👤 {first_name} (@{username})\n"
-    text += f"📝 نام: {full_name}\n"
-    text += f"📞 {phone}\n"
-    text += f"📍 {address}\n\n"
-    
-    for item in items:
-        text += f"• {item['product']} ({item['pack']}) x{item['quantity']}\n"
-    
-    text += f"\n💰 {total_price:,.0f} تومان"
-    
-    from keyboards import order_confirmation_keyboard
+    items = await db.get_order_items(order_id)
+    user = await db.get_user(order[1])
     
     await query.edit_message_text(
-        text,
+        order_card_text(order, items, user),
         reply_markup=order_confirmation_keyboard(order_id)
     )
 
@@ -292,13 +369,12 @@ async def confirm_modified_order(update: Update, context: ContextTypes.DEFAULT_T
     db = context.bot_data['db']
     
     # تغییر وضعیت به در انتظار پرداخت
-    db.update_order_status(order_id, 'waiting_payment')
+    await db.update_order_status(order_id, 'waiting_payment')
     
     # پیام به کاربر
-    order = db.get_order(order_id)
-    user_id = order[1]
-    order_id_val, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-    items = json.loads(items_json)
+    order = await db.get_order(order_id)
+    order_id_val, user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+    items = await db.get_order_items(order_id_val)
     
     message = "✅ **سفارش شما با تغییرات تایید شد!**\n"
     message += "⚠️ مدل‌های ناموجود از فاکتور شما حذف شدند.\n\n"
@@ -319,7 +395,8 @@ async def confirm_modified_order(update: Update, context: ContextTypes.DEFAULT_T
     
     # ویرایش پیام ادمین
     await query.edit_message_text(
-        query.message.text + "\n\n✅ تایید شد با تغییرات - در انتظار پرداخت"
+        query.message.text + "\n\n✅ تایید شد با تغییرات - در انتظار پرداخت",
+        reply_markup=back_to_queue_keyboard('pending')
     )
 
 
@@ -328,32 +405,63 @@ async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    # یافتن سفارش در انتظار پرداخت کاربر
-    orders = db.get_waiting_payment_orders()
-    user_order = None
-    
-    for order in orders:
-        if order[1] == user_id:
-            user_order = order
-            break
+    # سفارش‌های در انتظار پرداخت همین کاربر
+    orders = await db.get_payable_orders(user_id)
     
-    if not user_order:
+    if not orders:
         await update.message.reply_text("شما سفارش در انتظار پرداختی ندارید.")
         return
     
-    order_id = user_order[0]
     photo = update.message.photo[-1]
     
-    # ذخیره رسید
-    db.add_receipt(order_id, photo.file_id)
-    db.update_order_status(order_id, 'receipt_sent')
+    # چند سفارش پرداخت نشده - کاربر انتخاب می‌کند رسید برای کدام است
+    if len(orders) > 1:
+        context.user_data['pending_receipt'] = photo.file_id
+        await update.message.reply_text(
+            "🧾 شما چند سفارش در انتظار پرداخت دارید.\n\nاین رسید مربوط به کدام سفارش است؟",
+            reply_markup=receipt_order_keyboard(orders)
+        )
+        return
     
+    await submit_receipt(context, orders[0], photo.file_id)
     await update.message.reply_text(MESSAGES["receipt_received"])
+
+
+async def select_receipt_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب سفارش برای رسید ارسال شده"""
+    query = update.callback_query
+    await query.answer()
     
-    # ارسال به ادمین
-    order = db.get_order(order_id)
-    items = json.loads(order[2])
-    user = db.get_user(user_id)
+    order_id = int(query.data.split(":")[1])
+    user_id = update.effective_user.id
+    db = context.bot_data['db']
+    
+    photo_id = context.user_data.pop('pending_receipt', None)
+    if not photo_id:
+        await query.edit_message_text("❌ رسید پیدا نشد. لطفاً دوباره عکس رسید را ارسال کنید.")
+        return
+    
+    order = await db.get_order(order_id)
+    if not order or order[1] != user_id or order[4] != 'waiting_payment':
+        await query.edit_message_text("❌ این سفارش دیگر در انتظار پرداخت نیست.")
+        return
+    
+    await submit_receipt(context, order, photo_id)
+    await query.edit_message_text(f"🧾 رسید برای سفارش #{order_id}\n\n" + MESSAGES["receipt_received"])
+
+
+async def submit_receipt(context: ContextTypes.DEFAULT_TYPE, order, photo_id):
+    """ثبت رسید یک سفارش و ارسال آن به ادمین"""
+    db = context.bot_data['db']
+    order_id, user_id, total_price = order[0], order[1], order[3]
+    
+    # ذخیره رسید
+    # add_receipt وضعیت را هم receipt_sent می‌کند
+    await db.add_receipt(order_id, photo_id)
+    
+    # ارسال به ادمین - مبلغ سفارش با ثبت رسید تغییر نمی‌کند
+    items = await db.get_order_items(order_id)
+    user = await db.get_user(user_id)
     
     # دریافت امن اطلاعات کاربر
     first_name = user[2] if len(user) > 2 else "کاربر"
@@ -361,55 +469,63 @@ async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     text = f"💳 رسید سفارش #{order_id}\n\n"
     text += f"👤 {first_name} (@{username})\n"
-    text += f"💰 مبلغ: {order[3]:,.0f} تومان\n\n"
+    text += f"💰 مبلغ: {total_price:,.0f} تومان\n\n"
     
     for item in items:
         text += f"• {item['product']} ({item['pack']}) x{item['quantity']}\n"
     
     await context.bot.send_photo(
         ADMIN_ID,
-        photo.file_id,
+        photo_id,
         caption=text,
         reply_markup=payment_confirmation_keyboard(order_id)
     )
 
 
 async def view_payment_receipts(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش رسیدهای در انتظار تایید"""
+    """نمایش صف رسیدهای در انتظار تایید - یک پیام صفحه‌بندی شده"""
     db = context.bot_data['db']
+    text, keyboard = await order_queue_page(db, 'receipts')
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def open_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ارسال عکس رسید یک سفارش صف با دکمه‌های تایید و رد"""
+    query = update.callback_query
     
-    # یافتن سفارشات با رسید ارسال شده
-    query_result = db.cursor.execute(
-        "SELECT * FROM orders WHERE status = 'receipt_sent' ORDER BY created_at DESC"
-    ).fetchall()
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer()
+        return
+    
+    order_id = int(query.data.split(":")[1])
+    db = context.bot_data['db']
+    order = await db.get_order(order_id)
     
-    if not query_result:
-        await update.message.reply_text("هیچ رسیدی در انتظار تایید نیست.")
+    if not order or order[4] != 'receipt_sent' or not order[5]:
+        await query.answer("این رسید دیگر در صف نیست.", show_alert=True)
         return
+    await query.answer()
     
-    for order in query_result:
-        # تغییر: 8 فیلد به جای 7
-        order_id, user_id, items_json, total_price, status, receipt_photo, shipping_method, created_at = order
-        items = json.loads(items_json)
-        user = db.get_user(user_id)
-        
-        # دریافت امن اطلاعات کاربر
-        first_name = user[2] if len(user) > 2 else "کاربر"
-        username = user[1] if len(user) > 1 and user[1] else "ندارد"
-        
-        text = f"💳 رسید سفارش #{order_id}\n\n"
-        text += f"👤 {first_name} (@{username})\n"
-        text += f"💰 {total_price:,.0f} تومان\n\n"
-        
-        for item in items:
-            text += f"• {item['product']} ({item['pack']}) x{item['quantity']}\n"
-        
-        if receipt_photo:
-            await update.message.reply_photo(
-                receipt_photo,
-                caption=text,
-                reply_markup=payment_confirmation_keyboard(order_id)
-            )
+    order_id, user_id, _items, total_price, status, receipt_photo, shipping_method, created_at = order
+    items = await db.get_order_items(order_id)
+    user = await db.get_user(user_id) or ()
+    
+    # دریافت امن اطلاعات کاربر
+    first_name = user[2] if len(user) > 2 else "کاربر"
+    username = user[1] if len(user) > 1 and user[1] else "ندارد"
+    
+    text = f"💳 رسید سفارش #{order_id}\n\n"
+    text += f"👤 {first_name} (@{username})\n"
+    text += f"💰 {total_price:,.0f} تومان\n\n"
+    
+    for item in items:
+        text += f"• {item['product']} ({item['pack']}) x{item['quantity']}\n"
+    
+    await query.message.reply_photo(
+        receipt_photo,
+        caption=text,
+        reply_markup=payment_confirmation_keyboard(order_id)
+    )
 
 
 async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -421,10 +537,10 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = context.bot_data['db']
     
     # تغییر وضعیت به تایید پرداخت
-    db.update_order_status(order_id, 'payment_confirmed')
+    await db.update_order_status(order_id, 'payment_confirmed')
     
     # درخواست انتخاب نحوه ارسال از کاربر
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     
     from keyboards import shipping_method_keyboard
@@ -441,7 +557,8 @@ async def confirm_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # ویرایش پیام ادمین
     await query.edit_message_caption(
-        caption=query.message.caption + "\n\n✅ تایید شد - منتظر انتخاب نحوه ارسال"
+        caption=query.message.caption + "\n\n✅ تایید شد - منتظر انتخاب نحوه ارسال",
+        reply_markup=back_to_queue_keyboard('receipts')
     )
 
 
@@ -454,10 +571,10 @@ async def reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = context.bot_data['db']
     
     # بازگشت به وضعیت انتظار پرداخت
-    db.update_order_status(order_id, 'waiting_payment')
+    await db.update_order_status(order_id, 'waiting_payment')
     
     # پیام به کاربر
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     user_id = order[1]
     total_price = order[3]
     
@@ -472,5 +589,6 @@ async def reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # ویرایش پیام ادمین
     await query.edit_message_caption(
-        caption=query.message.caption + "\n\n❌ رد شد - منتظر رسید جدید"
+        caption=query.message.caption + "\n\n❌ رد شد - منتظر رسید جدید",
+        reply_markup=back_to_queue_keyboard('receipts')
     )
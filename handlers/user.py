@@ -1,10 +1,12 @@
 """
 هندلرهای مربوط به کاربران
 """
-import json
+import functools
+
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from config import MESSAGES
+from database import fetch_page
 from states import FULL_NAME, ADDRESS_TEXT, PHONE_NUMBER
 from keyboards import (
     user_main_keyboard,
@@ -12,9 +14,23 @@ from keyboards import (
     quantity_keyboard,
     cart_keyboard,
     view_cart_keyboard,
-    cancel_keyboard
+    cancel_keyboard,
+    order_history_keyboard,
+    order_detail_keyboard
 )
 
+# تعداد سفارش در هر صفحه تاریخچه سفارشات
+ORDERS_PAGE_SIZE = 5
+
+ORDER_STATUS_LABELS = {
+    'pending': '⏳ در انتظار تایید',
+    'waiting_payment': '💳 در انتظار پرداخت',
+    'receipt_sent': '📷 رسید ارسال شده',
+    'payment_confirmed': '✅ پرداخت تایید شده',
+    'confirmed': '✅ تایید شده',
+    'rejected': '❌ رد شده'
+}
+
 
 async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """پیام خوش‌آمدگویی به کاربر"""
@@ -22,7 +38,7 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = context.bot_data['db']
     
     # ثبت کاربر در دیتابیس
-    db.add_user(user.id, user.username, user.first_name)
+    await db.add_user(user.id, user.username, user.first_name)
     
     # بررسی اگر از لینک خاصی اومده
     if context.args:
@@ -39,12 +55,12 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             product_id = int(parts[1])
             pack_id = int(parts[3])
             
-            pack = db.get_pack(pack_id)
-            product = db.get_product(product_id)
+            pack = await db.get_pack(pack_id)
+            product = await db.get_product(product_id)
             
             if pack and product:
-                _, _, pack_name, quantity, price = pack
-                _, prod_name, *_ = product
+                pack_name, price = pack.name, pack.price
+                prod_name = product.name
                 
                 text = f"🏷 **{prod_name}**\n\n"
                 text += f"📦 {pack_name}\n"
@@ -73,14 +89,14 @@ async def user_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_product(update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
     """نمایش محصول به کاربر"""
     db = context.bot_data['db']
-    product = db.get_product(product_id)
+    product = await db.get_product(product_id)
     
     if not product:
         await update.message.reply_text("❌ محصول یافت نشد.")
         return
     
-    prod_id, name, desc, photo_id, *_ = product
-    packs = db.get_packs(product_id)
+    name, desc, photo_id = product.name, product.description, product.photo_id
+    packs = await db.get_packs(product_id)
     
     if not packs:
         await update.message.reply_text("❌ این محصول فعلاً موجود نیست.")
@@ -114,44 +130,27 @@ async def handle_pack_selection(update: Update, context: ContextTypes.DEFAULT_TY
     
     # ثبت کاربر اگه قبلاً ثبت نشده
     user = update.effective_user
-    db.add_user(user.id, user.username, user.first_name)
+    await db.add_user(user.id, user.username, user.first_name)
     
-    pack = db.get_pack(pack_id)
-    product = db.get_product(product_id)
+    pack = await db.get_pack(pack_id)
+    product = await db.get_product(product_id)
     
     if not pack or not product:
         await query.answer("❌ محصول یافت نشد!", show_alert=True)
         return
     
-    _, _, pack_name, pack_qty, price = pack
-    _, prod_name, *_ = product
-    
-    # افزودن 1 پک به سبد خرید
-    db.add_to_cart(user_id, product_id, pack_id, quantity=1)
+    pack_name = pack.name
     
-    # محاسبه تعداد کل این پک در سبد
-    cart = db.get_cart(user_id)
-    total_this_pack = 0
-    total_price_this_pack = 0
-    total_items = 0
-    total_price_all = 0
-    
-    for item in cart:
-        cart_id, p_name, pk_name, pk_qty, pk_price, qty = item
-        if pk_name == pack_name and p_name == prod_name:
-            total_this_pack += qty
-            total_price_this_pack += pk_price * qty
-        
-        total_items += pk_qty * qty
-        total_price_all += pk_price * qty
+    # افزودن 1 پک به سبد خرید - خلاصه سبد (بر اساس شناسه‌ها) در همان تراکنش برمی‌گردد
+    summary = await db.add_to_cart(user_id, product_id, pack_id, quantity=1)
     
     # نمایش Alert
     alert_text = f"✅ اضافه شد!\n\n"
     alert_text += f"📦 {pack_name}\n"
-    alert_text += f"🔢 تعداد در سبد: {total_this_pack} پک\n"
-    alert_text += f"💰 {total_price_this_pack:,.0f} تومان\n\n"
-    alert_text += f"📊 کل کالاها در سبد: {total_items} عدد\n"
-    alert_text += f"💳 جمع کل: {total_price_all:,.0f} تومان\n\n"
+    alert_text += f"🔢 تعداد در سبد: {summary['pack_count']} پک\n"
+    alert_text += f"💰 {summary['pack_price']:,.0f} تومان\n\n"
+    alert_text += f"📊 کل کالاها در سبد: {summary['total_items']} عدد\n"
+    alert_text += f"💳 جمع کل: {summary['total_price']:,.0f} تومان\n\n"
     alert_text += f"✅ درصورت تمام شدن روی سبد خرید کلیک کنید"
     
     await query.answer(alert_text, show_alert=True)
@@ -162,7 +161,7 @@ async def view_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    cart = db.get_cart(user_id)
+    cart = await db.get_cart(user_id)
     
     if not cart:
         message = "🛒 سبد خرید شما خالی است!"
@@ -207,7 +206,7 @@ async def remove_from_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     cart_id = int(query.data.split(":")[1])
     db = context.bot_data['db']
-    db.remove_from_cart(cart_id)
+    await db.remove_from_cart(cart_id)
     
     await view_cart(update, context)
     await query.message.delete()
@@ -220,7 +219,7 @@ async def clear_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = update.effective_user.id
     db = context.bot_data['db']
-    db.clear_cart(user_id)
+    await db.clear_cart(user_id)
     
     await query.message.edit_text("✅ سبد خرید شما خالی شد.")
 
@@ -232,7 +231,7 @@ async def finalize_order_start(update: Update, context: ContextTypes.DEFAULT_TYP
     
     user_id = update.effective_user.id
     db = context.bot_data['db']
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     # بررسی اطلاعات کاربر
     # user[3]=full_name, user[4]=phone, user[5]=landline, user[6]=address, user[7]=shop_name
@@ -325,7 +324,7 @@ async def phone_number_received(update: Update, context: ContextTypes.DEFAULT_TY
     phone = update.message.text
     
     # ذخیره اطلاعات در دیتابیس
-    db.update_user_info(
+    await db.update_user_info(
         user_id, 
         phone=phone, 
         address=address, 
@@ -436,27 +435,12 @@ async def create_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    cart = db.get_cart(user_id)
-    if not cart:
+    # آیتم‌ها و مبلغ کل مستقیماً از سبد خرید ساخته می‌شوند و سبد در همان تراکنش خالی می‌شود
+    order_id = await db.create_order(user_id)
+    if not order_id:
         await query.message.reply_text("سبد خرید شما خالی است!")
         return
     
-    items = []
-    total_price = 0
-    for item in cart:
-        cart_id, product_name, pack_name, pack_qty, price, quantity = item
-        item_total = price * quantity
-        total_price += item_total
-        items.append({
-            'product': product_name,
-            'pack': pack_name,
-            'quantity': quantity,
-            'price': item_total
-        })
-    
-    order_id = db.create_order(user_id, items, total_price)
-    db.clear_cart(user_id)
-    
     await query.message.reply_text(
         MESSAGES["order_received"],
         reply_markup=user_main_keyboard()
@@ -471,27 +455,12 @@ async def create_order_from_message(update: Update, context: ContextTypes.DEFAUL
     user_id = update.effective_user.id
     db = context.bot_data['db']
     
-    cart = db.get_cart(user_id)
-    if not cart:
+    # آیتم‌ها و مبلغ کل مستقیماً از سبد خرید ساخته می‌شوند و سبد در همان تراکنش خالی می‌شود
+    order_id = await db.create_order(user_id)
+    if not order_id:
         await update.message.reply_text("سبد خرید شما خالی است!")
         return
     
-    items = []
-    total_price = 0
-    for item in cart:
-        cart_id, product_name, pack_name, pack_qty, price, quantity = item
-        item_total = price * quantity
-        total_price += item_total
-        items.append({
-            'product': product_name,
-            'pack': pack_name,
-            'quantity': quantity,
-            'price': item_total
-        })
-    
-    order_id = db.create_order(user_id, items, total_price)
-    db.clear_cart(user_id)
-    
     await update.message.reply_text(
         MESSAGES["order_received"],
         reply_markup=user_main_keyboard()
@@ -529,7 +498,7 @@ async def handle_shipping_selection(update: Update, context: ContextTypes.DEFAUL
     }
     
     shipping_method = shipping_map.get(query.data, "نامشخص")
-    db.update_shipping_method(order_id, shipping_method)
+    await db.update_shipping_method(order_id, shipping_method)
     
     await show_final_invoice(update, context, order_id)
 
@@ -539,13 +508,13 @@ async def show_final_invoice(update, context, order_id):
     query = update.callback_query if hasattr(update, 'callback_query') else None
     db = context.bot_data['db']
     
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order:
         return
     
-    order_id_val, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-    items = json.loads(items_json)
-    user = db.get_user(user_id)
+    order_id_val, user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+    items = await db.get_order_items(order_id)
+    user = await db.get_user(user_id)
     
     invoice_text = "📋 **فاکتور نهایی سفارش**\n"
     invoice_text += "═" * 25 + "\n\n"
@@ -611,7 +580,7 @@ async def final_confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     db = context.bot_data['db']
-    db.update_order_status(order_id, 'confirmed')
+    await db.update_order_status(order_id, 'confirmed')
     
     user_id = update.effective_user.id
     context.bot_data.pop(f'pending_shipping_{user_id}', None)
@@ -653,7 +622,7 @@ async def view_my_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش آدرس ثبت شده"""
     user_id = update.effective_user.id
     db = context.bot_data['db']
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     
     if not user:
         await update.message.reply_text("❌ خطا! لطفاً /start کنید.")
@@ -706,44 +675,94 @@ async def edit_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return FULL_NAME
 
 
+async def order_history_page(db, user_id, page=1, after_id=None, before_id=None):
+    """
+    متن و کیبورد یک صفحه از تاریخچه سفارشات - فقط سفارش‌های همین صفحه خوانده می‌شوند
+    
+    خروجی: (متن, کیبورد) - کیبورد None یعنی کاربر سفارشی ندارد
+    """
+    orders, page, _has_prev, has_next = await fetch_page(
+        functools.partial(db.get_user_orders, user_id), ORDERS_PAGE_SIZE, page, after_id, before_id
+    )
+    if not orders:
+        return "📦 شما هنوز سفارشی نداده‌اید.", None
+    
+    text = f"📦 سفارشات من - صفحه {page}\n"
+    text += "═" * 25 + "\n\n"
+    for order in orders:
+        order_id, _user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+        text += f"📋 سفارش #{order_id}\n"
+        text += f"   📅 {created_at}\n"
+        text += f"   📊 {ORDER_STATUS_LABELS.get(status, status)}\n"
+        text += f"   💰 {total_price:,.0f} تومان\n\n"
+    text += "برای دیدن جزئیات روی سفارش مورد نظر بزنید 👇"
+    
+    return text, order_history_keyboard(orders, page, has_next)
+
+
 async def view_my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش سفارشات کاربر"""
+    """نمایش سفارشات کاربر - یک پیام صفحه‌بندی شده که در جا ویرایش می‌شود"""
     user_id = update.effective_user.id
     db = context.bot_data['db']
-    orders = db.get_user_orders(user_id)
     
-    if not orders:
-        await update.message.reply_text("📦 شما هنوز سفارشی نداده‌اید.")
+    context.user_data['orders_page'] = (1, None, None)
+    text, keyboard = await order_history_page(db, user_id)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def browse_my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """صفحه قبلی/بعدی تاریخچه سفارشات یا بازگشت از جزئیات یک سفارش"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = update.effective_user.id
+    db = context.bot_data['db']
+    parts = query.data.split(":")
+    
+    if parts[1] == "back":
+        # همان صفحه‌ای که کاربر از آن وارد جزئیات شد
+        page, after_id, before_id = context.user_data.get('orders_page', (1, None, None))
+    elif parts[1] == "next":
+        page, after_id, before_id = int(parts[3]) + 1, int(parts[2]), None
+    else:
+        page, after_id, before_id = int(parts[3]) - 1, None, int(parts[2])
+    
+    context.user_data['orders_page'] = (page, after_id, before_id)
+    text, keyboard = await order_history_page(db, user_id, page, after_id, before_id)
+    await query.edit_message_text(text, reply_markup=keyboard)
+
+
+async def view_my_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """جزئیات یک سفارش در همان پیام تاریخچه"""
+    query = update.callback_query
+    order_id = int(query.data.split(":")[1])
+    user_id = update.effective_user.id
+    db = context.bot_data['db']
+    
+    order = await db.get_order(order_id)
+    if not order or order[1] != user_id:
+        await query.answer("❌ سفارش یافت نشد.", show_alert=True)
         return
+    await query.answer()
     
-    status_map = {
-        'pending': '⏳ در انتظار تایید',
-        'waiting_payment': '💳 در انتظار پرداخت',
-        'receipt_sent': '📷 رسید ارسال شده',
-        'payment_confirmed': '✅ پرداخت تایید شده',
-        'confirmed': '✅ تایید شده',
-        'rejected': '❌ رد شده'
-    }
+    order_id, _user_id, _items, total_price, status, receipt, shipping_method, created_at = order
+    items = await db.get_order_items(order_id)
     
-    for order in orders:
-        order_id, user_id, items_json, total_price, status, receipt, shipping_method, created_at = order
-        items = json.loads(items_json)
-        
-        text = f"📋 **سفارش #{order_id}**\n\n"
-        text += f"📅 تاریخ: {created_at}\n"
-        text += f"📊 وضعیت: {status_map.get(status, status)}\n\n"
-        
-        text += "🛍 محصولات:\n"
-        for item in items:
-            text += f"▫️ {item['product']} - {item['pack']}\n"
-            text += f"   تعداد: {item['quantity']} پک\n"
-        
-        text += f"\n💰 مبلغ کل: {total_price:,.0f} تومان"
-        
-        if shipping_method:
-            text += f"\n📦 نحوه ارسال: {shipping_method}"
-        
-        await update.message.reply_text(text, parse_mode='Markdown')
+    text = f"📋 سفارش #{order_id}\n\n"
+    text += f"📅 تاریخ: {created_at}\n"
+    text += f"📊 وضعیت: {ORDER_STATUS_LABELS.get(status, status)}\n\n"
+    
+    text += "🛍 محصولات:\n"
+    for item in items:
+        text += f"▫️ {item['product']} - {item['pack']}\n"
+        text += f"   تعداد: {item['quantity']} پک\n"
+    
+    text += f"\n💰 مبلغ کل: {total_price:,.0f} تومان"
+    
+    if shipping_method:
+        text += f"\n📦 نحوه ارسال: {shipping_method}"
+    
+    await query.edit_message_text(text, reply_markup=order_detail_keyboard())
 
 
 async def contact_us(update: Update, context: ContextTypes.DEFAULT_TYPE):
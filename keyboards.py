@@ -9,7 +9,8 @@ def admin_main_keyboard():
     keyboard = [
         ["➕ افزودن محصول", "📦 لیست محصولات"],
         ["📋 سفارشات جدید", "💳 تایید پرداخت‌ها"],
-        ["📊 آمار"]
+        ["📊 آمار", "📈 گزارش فروش"],
+        ["📣 ارسال همگانی"]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
@@ -34,11 +35,10 @@ def product_inline_keyboard(product_id, packs):
     """دکمه‌های انتخاب پک برای محصول - برای کانال"""
     keyboard = []
     for pack in packs:
-        pack_id, prod_id, name, quantity, price, *_ = pack
-        button_text = f"📦 {name} - {price:,.0f} تومان"
+        button_text = f"📦 {pack.name} - {pack.price:,.0f} تومان"
         keyboard.append([InlineKeyboardButton(
             button_text, 
-            callback_data=f"select_pack:{product_id}:{pack_id}"
+            callback_data=f"select_pack:{product_id}:{pack.id}"
         )])
     return InlineKeyboardMarkup(keyboard)
 
@@ -65,7 +65,7 @@ def cart_keyboard(cart_items):
     return InlineKeyboardMarkup(keyboard)
 
 
-def order_confirmation_keyboard(order_id):
+def order_confirmation_keyboard(order_id, from_queue=False):
     """دکمه‌های تایید سفارش برای ادمین"""
     keyboard = [
         [
@@ -73,6 +73,33 @@ def order_confirmation_keyboard(order_id):
             InlineKeyboardButton("❌ رد", callback_data=f"reject_order:{order_id}")
         ]
     ]
+    if from_queue:
+        keyboard.append([InlineKeyboardButton("🔙 بازگشت به صف", callback_data="queue_pending:back")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def order_queue_keyboard(queue, orders, page, pages, has_next):
+    """دکمه‌های یک صفحه از صف کاری ادمین (pending یا receipts)"""
+    opener = "open_order" if queue == "pending" else "open_receipt"
+    keyboard = [
+        [InlineKeyboardButton(
+            f"🔍 سفارش #{order[0]} - {order[3]:,.0f} تومان",
+            callback_data=f"{opener}:{order[0]}"
+        )]
+        for order in orders
+    ]
+    if orders:
+        keyboard.append(page_navigation_row(
+            f"queue_{queue}", orders[0][0], orders[-1][0], page, pages, has_next
+        ))
+    keyboard.append([InlineKeyboardButton("🔄 بروزرسانی", callback_data=f"queue_{queue}:back")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def back_to_queue_keyboard(queue):
+    """دکمه بازگشت به صف کاری بعد از رسیدگی به یک سفارش"""
+    label = "📋 صف سفارشات" if queue == "pending" else "💳 صف رسیدها"
+    keyboard = [[InlineKeyboardButton(label, callback_data=f"queue_{queue}:back")]]
     return InlineKeyboardMarkup(keyboard)
 
 
@@ -87,7 +114,7 @@ def payment_confirmation_keyboard(order_id):
     return InlineKeyboardMarkup(keyboard)
 
 
-def product_management_keyboard(product_id):
+def product_management_keyboard(product_id, has_photo=False):
     """دکمه‌های مدیریت محصول"""
     keyboard = [
         [InlineKeyboardButton("➕ افزودن پک", callback_data=f"add_pack:{product_id}")],
@@ -95,6 +122,39 @@ def product_management_keyboard(product_id):
         [InlineKeyboardButton("📤 ارسال به کانال", callback_data=f"send_to_channel:{product_id}")],
         [InlineKeyboardButton("🗑 حذف محصول", callback_data=f"delete_product:{product_id}")],
     ]
+    if has_photo:
+        keyboard.append([InlineKeyboardButton("🖼 نمایش عکس", callback_data=f"product_photo:{product_id}")])
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت به لیست", callback_data="back_to_products")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def page_navigation_row(prefix, first_id, last_id, page, pages, has_next):
+    """
+    ردیف دکمه‌های قبلی/شماره صفحه/بعدی برای لیست‌های صفحه‌بندی شده
+    
+    callback ها: {prefix}:prev:{اولین شناسه}:{صفحه} و {prefix}:next:{آخرین شناسه}:{صفحه}
+    pages=None یعنی تعداد کل صفحه‌ها شمرده نشده است.
+    """
+    row = []
+    if page > 1:
+        row.append(InlineKeyboardButton("⬅️ قبلی", callback_data=f"{prefix}:prev:{first_id}:{page}"))
+    counter = f"📄 {page}" if pages is None else f"📄 {page} از {pages}"
+    row.append(InlineKeyboardButton(counter, callback_data="noop"))
+    if has_next:
+        row.append(InlineKeyboardButton("بعدی ➡️", callback_data=f"{prefix}:next:{last_id}:{page}"))
+    return row
+
+
+def product_browser_keyboard(products, page, pages, has_next):
+    """دکمه‌های یک صفحه از مرورگر محصولات ادمین"""
+    keyboard = [
+        [InlineKeyboardButton(f"⚙️ {product.name}", callback_data=f"manage_product:{product.id}")]
+        for product in products
+    ]
+    if products:
+        keyboard.append(page_navigation_row(
+            "products", products[0].id, products[-1].id, page, pages, has_next
+        ))
     return InlineKeyboardMarkup(keyboard)
 
 
@@ -104,6 +164,23 @@ def back_to_products_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 
+def broadcast_confirm_keyboard():
+    """دکمه‌های تایید یا لغو ارسال همگانی"""
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ ارسال", callback_data="broadcast_send"),
+            InlineKeyboardButton("❌ لغو", callback_data="broadcast_discard")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def broadcast_progress_keyboard(broadcast_id):
+    """دکمه توقف ارسال همگانی در حال اجرا"""
+    keyboard = [[InlineKeyboardButton("⏹ توقف ارسال", callback_data=f"broadcast_stop:{broadcast_id}")]]
+    return InlineKeyboardMarkup(keyboard)
+
+
 def view_cart_keyboard():
     """دکمه مشاهده سبد خرید"""
     keyboard = [[InlineKeyboardButton("🛍 مشاهده سبد خرید", callback_data="view_cart")]]
@@ -154,16 +231,48 @@ def confirm_info_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 
+def order_history_keyboard(orders, page, has_next):
+    """دکمه‌های یک صفحه از تاریخچه سفارشات کاربر"""
+    keyboard = [
+        [InlineKeyboardButton(
+            f"🧾 سفارش #{order[0]} - {order[3]:,.0f} تومان",
+            callback_data=f"my_order:{order[0]}"
+        )]
+        for order in orders
+    ]
+    if orders:
+        keyboard.append(page_navigation_row("my_orders", orders[0][0], orders[-1][0], page, None, has_next))
+    return InlineKeyboardMarkup(keyboard)
+
+
+def order_detail_keyboard():
+    """دکمه بازگشت از جزئیات سفارش به همان صفحه تاریخچه"""
+    keyboard = [[InlineKeyboardButton("🔙 بازگشت به سفارشات", callback_data="my_orders:back")]]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def receipt_order_keyboard(orders):
+    """دکمه‌های انتخاب سفارشی که رسید مربوط به آن است"""
+    keyboard = []
+    for order in orders:
+        order_id, total_price = order[0], order[3]
+        keyboard.append([InlineKeyboardButton(
+            f"🧾 سفارش #{order_id} - {total_price:,.0f} تومان",
+            callback_data=f"receipt_for:{order_id}"
+        )])
+    return InlineKeyboardMarkup(keyboard)
+
+
 def order_items_removal_keyboard(order_id, items):
     """دکمه‌های حذف آیتم‌های سفارش"""
     keyboard = []
-    for idx, item in enumerate(items):
+    for item in items:
         product_name = item.get('product', 'محصول')
         pack_name = item.get('pack', 'پک')
         button_text = f"❌ حذف: {product_name} - {pack_name}"
         keyboard.append([InlineKeyboardButton(
             button_text,
-            callback_data=f"remove_item:{order_id}:{idx}"
+            callback_data=f"remove_item:{order_id}:{item['id']}"
         )])
     
     # دکمه تایید با تغییرات
@@ -0,0 +1,99 @@
+"""
+مجموعه کاربران شناخته شده در حافظه
+
+add_user روی هر /start و هر کلیک دکمه کانال صدا زده می‌شود. برای کاربری که قبلاً
+ثبت شده هیچ نوشتنی لازم نیست؛ تغییر username یا first_name هم در صف می‌ماند و
+دسته‌ای نوشته می‌شود.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class KnownUsers:
+    """LRU محدود از user_id به (username, first_name) به همراه صف تغییر نام‌ها"""
+    
+    def __init__(self, limit, flush_size, flush_interval):
+        self.limit = limit
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._users = OrderedDict()
+        self._pending = {}
+        self._pending_since = None
+        self._lock = threading.Lock()
+        self.skipped = 0
+    
+    def __len__(self):
+        return len(self._users)
+    
+    def _remember(self, user_id, names):
+        self._users[user_id] = names
+        self._users.move_to_end(user_id)
+        if len(self._users) > self.limit:
+            self._users.popitem(last=False)
+    
+    def warm(self, rows):
+        """پر کردن اولیه از ردیف‌های (user_id, username, first_name) - قدیمی‌ترین اول"""
+        with self._lock:
+            for user_id, username, first_name in rows:
+                self._remember(user_id, (username, first_name))
+    
+    def remember(self, user_id, username, first_name):
+        """ثبت کاربری که همین الان در دیتابیس نوشته شد"""
+        with self._lock:
+            # نام نوشته شده از هر تغییر در صف جدیدتر است
+            self._pending.pop(user_id, None)
+            self._remember(user_id, (username, first_name))
+    
+    def forget(self, user_id):
+        """حذف کاربر - دیدن بعدی او دوباره به دیتابیس نوشته می‌شود"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._pending.pop(user_id, None)
+    
+    def seen(self, user_id, username, first_name):
+        """
+        ثبت دیدن کاربر
+        
+        خروجی: True اگر کاربر شناخته شده است و نیازی به نوشتن در دیتابیس نیست
+        """
+        names = (username, first_name)
+        with self._lock:
+            known = self._users.get(user_id)
+            if known is None:
+                return False
+            
+            self._users.move_to_end(user_id)
+            if known != names:
+                self._users[user_id] = names
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                self._pending[user_id] = names
+            self.skipped += 1
+            return True
+    
+    # ==================== صف تغییر نام‌ها ====================
+    
+    def flush_due(self):
+        """آیا صف به اندازه یا عمر لازم برای نوشتن رسیده است"""
+        with self._lock:
+            if not self._pending:
+                return False
+            return (len(self._pending) >= self.flush_size or
+                    time.monotonic() - self._pending_since >= self.flush_interval)
+    
+    def take_pending(self):
+        """برداشتن کل صف به صورت ردیف‌های (username, first_name, user_id)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_since = None
+        return [(username, first_name, user_id) for user_id, (username, first_name) in pending.items()]
+    
+    def restore(self, rows):
+        """برگرداندن ردیف‌هایی که نوشتنشان شکست خورد - تغییرات جدیدتر حفظ می‌شوند"""
+        with self._lock:
+            for username, first_name, user_id in rows:
+                if user_id not in self._pending:
+                    self._pending[user_id] = (username, first_name)
+            if self._pending and self._pending_since is None:
+                self._pending_since = time.monotonic()
@@ -2,6 +2,7 @@
 ربات فروشگاه مانتو تلگرام
 فایل اصلی - نسخه اصلاح شده
 """
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import (
@@ -10,16 +11,22 @@ from telegram.ext import (
     MessageHandler,
     CallbackQueryHandler,
     ConversationHandler,
+    TypeHandler,
     filters
 )
 
 # ایمپورت ماژول‌های پروژه
-from config import BOT_TOKEN, ADMIN_ID
-from database import Database
+from config import BOT_TOKEN, ADMIN_ID, CART_GROUP_COMMIT, CONCURRENT_UPDATES, UPDATE_MODE
+from database import Database, AsyncDatabase
+from outbox import OutboundScheduler
+from update_processor import KeyedUpdateProcessor
+from broadcast import resume_broadcasts, stop_broadcasts
+import unit_of_work
 from states import (
     PRODUCT_NAME, PRODUCT_DESC, PRODUCT_PHOTO,
     PACK_NAME, PACK_QUANTITY, PACK_PRICE,
-    FULL_NAME, ADDRESS_TEXT, PHONE_NUMBER
+    FULL_NAME, ADDRESS_TEXT, PHONE_NUMBER,
+    BROADCAST_MESSAGE
 )
 
 # تنظیم لاگینگ
@@ -50,7 +57,7 @@ async def handle_text_messages(update: Update, context):
     user_id = update.effective_user.id
     
     # Import توابع
-    from handlers.admin import add_product_start, list_products, show_statistics
+    from handlers.admin import add_product_start, list_products, show_statistics, sales_report
     from handlers.order import view_pending_orders, view_payment_receipts
     from handlers.user import view_cart, view_my_orders, view_my_address, contact_us
     
@@ -66,6 +73,8 @@ async def handle_text_messages(update: Update, context):
             return await view_payment_receipts(update, context)
         elif text == "📊 آمار":
             return await show_statistics(update, context)
+        elif text == "📈 گزارش فروش":
+            return await sales_report(update, context)
     
     # دستورات کاربر
     if text == "🛒 سبد خرید":
@@ -101,6 +110,17 @@ async def error_handler(update: Update, context):
     logger.error(f"خطا: {context.error}")
 
 
+async def flush_user_updates(context):
+    """job دوره‌ای: نوشتن تغییر نام‌های در صف کاربران حتی وقتی ربات ساکت است"""
+    await context.bot_data['db'].flush_user_updates()
+
+
+async def close_database(application):
+    """post_shutdown: نوشتن صف تغییر نام‌ها و بستن دیتابیس"""
+    # close منتظر تمام شدن کارهای ترد دیتابیس می‌ماند - حلقه رویداد را نگه نمی‌داریم
+    await asyncio.to_thread(application.bot_data['db'].close)
+
+
 def main():
     """تابع اصلی"""
     # Import توابع
@@ -108,7 +128,11 @@ def main():
         add_product_start, product_name_received, product_desc_received,
         product_photo_received, add_pack_start, pack_name_received,
         pack_quantity_received, pack_price_received, view_packs,
-        get_channel_link, delete_product, admin_start
+        get_channel_link, delete_product, admin_start, check_statistics,
+        sales_report, browse_products, back_to_products, manage_product,
+        jump_to_product, show_product_photo, noop_callback,
+        broadcast_start, broadcast_message_received, confirm_broadcast,
+        discard_broadcast, stop_broadcast
     )
     from handlers.user import (
         finalize_order_start, full_name_received, address_text_received, 
@@ -116,23 +140,43 @@ def main():
         use_new_address, handle_pack_selection, view_cart,
         remove_from_cart, clear_cart, handle_shipping_selection,
         final_confirm_order, final_edit_order, edit_address,
-        back_to_packs, user_start, confirm_user_info, edit_user_info_for_order
+        back_to_packs, user_start, confirm_user_info, edit_user_info_for_order,
+        browse_my_orders, view_my_order
     )
     from handlers.order import (
         confirm_order, reject_order, confirm_payment, reject_payment,
         remove_item_from_order, reject_full_order, back_to_order_review,
-        confirm_modified_order
+        confirm_modified_order, select_receipt_order,
+        browse_order_queue, open_pending_order, open_receipt
     )
     
-    # ایجاد دیتابیس
-    db = Database()
+    # ایجاد دیتابیس - هندلرها نسخه async را await می‌کنند
+    db = AsyncDatabase(Database(), group_commit=CART_GROUP_COMMIT)
     
     # ساخت اپلیکیشن
-    application = Application.builder().token(BOT_TOKEN).build()
+    # همه درخواست‌های Bot API از زمان‌بند خروجی رد می‌شوند، آپدیت‌های کاربرهای مختلف
+    # هم‌زمان پردازش می‌شوند و ارسال‌های همگانی نیمه‌تمام بعد از شروع ادامه پیدا می‌کنند
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(OutboundScheduler())
+        .concurrent_updates(KeyedUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(resume_broadcasts)
+        .post_stop(stop_broadcasts)
+        .post_shutdown(close_database)
+        .build()
+    )
     
     # ذخیره دیتابیس در bot_data
     application.bot_data['db'] = db
     
+    # تغییر نام کاربران شناخته شده بدون انتظار برای add_user بعدی نوشته می‌شود
+    flush_interval = db.db.known_users.flush_interval
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(flush_user_updates, interval=flush_interval, first=flush_interval)
+    else:
+        logger.warning("JobQueue نصب نیست - تغییر نام کاربران فقط با add_user بعدی و هنگام خاموشی نوشته می‌شود")
+    
     # ==================== ConversationHandler برای افزودن محصول ====================
     add_product_conv = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex("^➕ افزودن محصول$"), add_product_start)],
@@ -155,6 +199,18 @@ def main():
         fallbacks=[MessageHandler(filters.Regex("^❌ لغو$"), admin_start)],
     )
     
+    # ==================== ConversationHandler برای ارسال همگانی ====================
+    broadcast_conv = ConversationHandler(
+        entry_points=[
+            MessageHandler(filters.Regex("^📣 ارسال همگانی$"), broadcast_start),
+            CommandHandler("broadcast", broadcast_start),
+        ],
+        states={
+            BROADCAST_MESSAGE: [MessageHandler(~filters.COMMAND, broadcast_message_received)],
+        },
+        fallbacks=[MessageHandler(filters.Regex("^❌ لغو$"), admin_start)],
+    )
+    
     # ==================== ConversationHandler برای نهایی کردن سفارش ====================
     finalize_order_conv = ConversationHandler(
         entry_points=[CallbackQueryHandler(finalize_order_start, pattern="^finalize_order$")],
@@ -199,10 +255,19 @@ def main():
         fallbacks=[MessageHandler(filters.Regex("^❌ لغو$"), user_start)],
     )
     
+    # ==================== واحد کار هر آپدیت ====================
+    # گروه -1 قبل از همه هندلرها و گروه 99 بعد از همه اجرا می‌شود
+    application.add_handler(TypeHandler(Update, unit_of_work.begin_handler), group=-1)
+    application.add_handler(TypeHandler(Update, unit_of_work.end_handler), group=99)
+    
     # ==================== هندلرهای اصلی ====================
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("check_stats", check_statistics))
+    application.add_handler(CommandHandler("report", sales_report))
+    application.add_handler(CommandHandler("product", jump_to_product))
     application.add_handler(add_product_conv)
     application.add_handler(add_pack_conv)
+    application.add_handler(broadcast_conv)
     application.add_handler(finalize_order_conv)
     application.add_handler(edit_address_conv)
     application.add_handler(edit_user_info_conv)
@@ -220,12 +285,22 @@ def main():
     application.add_handler(CallbackQueryHandler(use_old_address, pattern="^use_old_address$"))
     application.add_handler(CallbackQueryHandler(use_new_address, pattern="^use_new_address$"))
     application.add_handler(CallbackQueryHandler(confirm_user_info, pattern="^confirm_user_info$"))
+    application.add_handler(CallbackQueryHandler(browse_my_orders, pattern="^my_orders:"))
+    application.add_handler(CallbackQueryHandler(view_my_order, pattern="^my_order:"))
     # این خط حذف شد چون الان ConversationHandler داره: application.add_handler(CallbackQueryHandler(edit_user_info_for_order, pattern="^edit_user_info$"))
     
     # هندلرهای مدیریت محصول
+    application.add_handler(CallbackQueryHandler(browse_products, pattern="^products:"))
+    application.add_handler(CallbackQueryHandler(back_to_products, pattern="^back_to_products$"))
+    application.add_handler(CallbackQueryHandler(manage_product, pattern="^manage_product:"))
+    application.add_handler(CallbackQueryHandler(show_product_photo, pattern="^product_photo:"))
+    application.add_handler(CallbackQueryHandler(noop_callback, pattern="^noop$"))
     application.add_handler(CallbackQueryHandler(view_packs, pattern="^view_packs:"))
     application.add_handler(CallbackQueryHandler(get_channel_link, pattern="^send_to_channel:"))
     application.add_handler(CallbackQueryHandler(delete_product, pattern="^delete_product:"))
+    application.add_handler(CallbackQueryHandler(confirm_broadcast, pattern="^broadcast_send$"))
+    application.add_handler(CallbackQueryHandler(discard_broadcast, pattern="^broadcast_discard$"))
+    application.add_handler(CallbackQueryHandler(stop_broadcast, pattern="^broadcast_stop:"))
     
     # هندلرهای سفارش
     application.add_handler(CallbackQueryHandler(confirm_order, pattern="^confirm_order:"))
@@ -236,17 +311,28 @@ def main():
     application.add_handler(CallbackQueryHandler(confirm_modified_order, pattern="^confirm_modified:"))
     application.add_handler(CallbackQueryHandler(confirm_payment, pattern="^confirm_payment:"))
     application.add_handler(CallbackQueryHandler(reject_payment, pattern="^reject_payment:"))
+    application.add_handler(CallbackQueryHandler(select_receipt_order, pattern="^receipt_for:"))
+    application.add_handler(CallbackQueryHandler(browse_order_queue, pattern="^queue_(pending|receipts):"))
+    application.add_handler(CallbackQueryHandler(open_pending_order, pattern="^open_order:"))
+    application.add_handler(CallbackQueryHandler(open_receipt, pattern="^open_receipt:"))
     
     # ==================== Message هندلرها ====================
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_messages))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photos))
     
+    # نام‌های آمار کوئری فقط از هندلرهای ثبت شده ساخته می‌شوند
+    unit_of_work.register_handlers(application)
+    
     # Error handler
     application.add_error_handler(error_handler)
     
     # شروع ربات
     logger.info("🤖 ربات شروع به کار کرد!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if UPDATE_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(application)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,273 @@
+"""
+زمان‌بند درخواست‌های خروجی ربات به Bot API
+
+به عنوان rate_limiter به Application داده می‌شود، پس هر ارسال، ویرایش و پاسخ
+callback در همه هندلرها (همه چیز به جز getUpdates) از اینجا رد می‌شود. سه نوع سطل
+توکن محدودیت‌های تلگرام را رعایت می‌کنند:
+
+- سراسری: حدود ۳۰ درخواست در ثانیه
+- هر چت خصوصی: حدود ۱ پیام در ثانیه با کمی burst
+- هر گروه یا کانال: ۲۰ پیام در دقیقه
+
+درخواست‌های منتظر به ترتیب اولویت و بعد زمان ورود آزاد می‌شوند؛ چتی که سطلش خالی
+است جلوی بقیه چت‌ها را نمی‌گیرد. در RetryAfter همه ارسال‌ها به اندازه retry_after
+متوقف می‌شوند و همان درخواست دوباره فرستاده می‌شود.
+
+اولویت یک ارسال با rate_limit_args تعیین می‌شود:
+    await context.bot.send_message(chat_id, text, rate_limit_args={'priority': PRIORITY_LOW})
+"""
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# کلاس‌های اولویت - عدد کمتر زودتر آزاد می‌شود
+PRIORITY_HIGH = 0    # پاسخ callback ها - کاربر منتظر بسته شدن ساعت دکمه است
+PRIORITY_NORMAL = 1  # پاسخ مستقیم به کاربر و پیام‌های ادمین
+PRIORITY_LOW = 2     # ارسال انبوه
+
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+# محدودیت‌ها: (درخواست در ثانیه, ظرفیت burst)
+GLOBAL_LIMIT = (30, 30)
+PRIVATE_CHAT_LIMIT = (1, 3)
+GROUP_CHAT_LIMIT = (20 / 60, 3)
+
+# تعداد تلاش دوباره بعد از RetryAfter قبل از برگرداندن خطا به هندلر
+MAX_RETRIES = 3
+
+# سطل چتی که این مدت استفاده نشده پر است و پاک می‌شود
+IDLE_BUCKET_SECONDS = 60
+
+# endpoint هایی که پیام تازه در چت می‌سازند - فقط این‌ها محدودیت هر چت را دارند
+CHAT_SEND_PREFIXES = ('send', 'copy', 'forward')
+
+
+class TokenBucket:
+    """سطل توکن با پر شدن پیوسته"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+    
+    def wait_time(self, now):
+        """ثانیه تا آماده شدن یک توکن - 0 یعنی همین الان"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self.tokens -= 1
+
+
+def chat_key(endpoint, data):
+    """
+    کلید سطل چت برای یک درخواست
+    
+    خروجی: (chat_id, گروه است) یا None برای درخواستی که فقط محدودیت سراسری دارد
+    """
+    if not endpoint.startswith(CHAT_SEND_PREFIXES):
+        return None
+    chat_id = data.get('chat_id')
+    if chat_id is None:
+        return None
+    # شناسه منفی یا @username یعنی گروه یا کانال
+    is_group = isinstance(chat_id, str) or chat_id < 0
+    return chat_id, is_group
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """rate limiter اولویت‌دار با سطل‌های سراسری، هر چت و هر کانال"""
+    
+    def __init__(self, global_limit=GLOBAL_LIMIT, private_limit=PRIVATE_CHAT_LIMIT,
+                 group_limit=GROUP_CHAT_LIMIT, max_retries=MAX_RETRIES):
+        self.private_limit = private_limit
+        self.group_limit = group_limit
+        self.max_retries = max_retries
+        self._global = TokenBucket(*global_limit, time.monotonic())
+        self._chats = {}
+        self._last_prune = time.monotonic()
+        self._paused_until = 0.0
+        
+        # لیست مرتب (اولویت, شماره ورود, کلید چت, future)
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._task = None
+        
+        # آمار
+        self.sent = dict.fromkeys(PRIORITY_NAMES, 0)
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.retries = 0
+        self.peak_waiting = 0
+    
+    # ==================== چرخه عمر ====================
+    
+    async def initialize(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch(), name="outbox_dispatcher")
+    
+    async def shutdown(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for _priority, _sequence, _key, future in self._waiting:
+            if not future.done():
+                future.cancel()
+        self._waiting = []
+    
+    # ==================== درخواست‌ها ====================
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        default = PRIORITY_HIGH if endpoint == 'answerCallbackQuery' else PRIORITY_NORMAL
+        priority = (rate_limit_args or {}).get('priority', default)
+        key = chat_key(endpoint, data)
+        
+        for attempt in itertools.count():
+            await self._acquire(priority, key)
+            self.sent[priority] = self.sent.get(priority, 0) + 1
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(f"RetryAfter روی {endpoint}: توقف ارسال‌ها برای {exc.retry_after} ثانیه")
+                self.pause(exc.retry_after)
+    
+    def pause(self, seconds):
+        """توقف همه ارسال‌ها برای چند ثانیه"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def _bucket(self, key, now):
+        if key is None:
+            return None
+        bucket = self._chats.get(key)
+        if bucket is None:
+            limit = self.group_limit if key[1] else self.private_limit
+            bucket = self._chats[key] = TokenBucket(*limit, now)
+        return bucket
+    
+    def _try_take(self, key, now):
+        """گرفتن توکن سراسری و توکن چت - خروجی: 0 در موفقیت وگرنه ثانیه تا تلاش بعدی"""
+        wait = self._global.wait_time(now)
+        if wait:
+            return wait
+        bucket = self._bucket(key, now)
+        if bucket is not None:
+            wait = bucket.wait_time(now)
+            if wait:
+                return wait
+            bucket.take()
+        self._global.take()
+        return 0
+    
+    async def _acquire(self, priority, key):
+        """صبر تا نوبت این درخواست"""
+        now = time.monotonic()
+        
+        # مسیر سریع: صف خالی و توکن آماده
+        if self._task is None or (not self._waiting and now >= self._paused_until and
+                                  not self._try_take(key, now)):
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        # شماره ورود یکتاست، پس مقایسه هیچ‌وقت به کلید چت و future نمی‌رسد
+        bisect.insort(self._waiting, (priority, next(self._sequence), key, future))
+        self.peak_waiting = max(self.peak_waiting, len(self._waiting))
+        self._wakeup.set()
+        
+        await future
+        self.delayed += 1
+        self.wait_total += time.monotonic() - now
+    
+    # ==================== آزاد کردن صف ====================
+    
+    def _release(self, now):
+        """
+        آزاد کردن درخواست‌هایی که الان مجازند
+        
+        خروجی: ثانیه تا بررسی بعدی یا None اگر صف خالی است
+        """
+        if not self._waiting:
+            return None
+        if now < self._paused_until:
+            return self._paused_until - now
+        
+        next_check = None
+        remaining = []
+        for index, entry in enumerate(self._waiting):
+            future = entry[3]
+            if future.done():
+                # فراخواننده منصرف شده است
+                continue
+            wait = self._try_take(entry[2], now)
+            if not wait:
+                future.set_result(None)
+                continue
+            
+            remaining.append(entry)
+            next_check = wait if next_check is None else min(next_check, wait)
+            if self._global.wait_time(now):
+                # سهم سراسری تمام شد - بقیه صف منتظر می‌ماند
+                remaining.extend(e for e in self._waiting[index + 1:] if not e[3].done())
+                break
+        
+        self._waiting = remaining
+        return next_check if remaining else None
+    
+    def _prune(self, now):
+        """پاک کردن سطل چت‌هایی که مدتی ارسالی نداشته‌اند"""
+        if now - self._last_prune < IDLE_BUCKET_SECONDS:
+            return
+        self._last_prune = now
+        waiting = {entry[2] for entry in self._waiting}
+        for key in [key for key, bucket in self._chats.items()
+                    if now - bucket.updated >= IDLE_BUCKET_SECONDS and key not in waiting]:
+            del self._chats[key]
+    
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            self._wakeup.clear()
+            delay = self._release(now)
+            self._prune(now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    # ==================== آمار ====================
+    
+    def stats(self):
+        """آمار زمان‌بند"""
+        return {
+            'sent': {PRIORITY_NAMES.get(p, str(p)): count for p, count in self.sent.items()},
+            'delayed': self.delayed,
+            'average_wait': self.wait_total / self.delayed if self.delayed else 0.0,
+            'retries': self.retries,
+            'waiting': len(self._waiting),
+            'peak_waiting': self.peak_waiting,
+            'chats': len(self._chats),
+        }
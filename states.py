@@ -8,3 +8,6 @@ PACK_NAME, PACK_QUANTITY, PACK_PRICE = range(3, 6)
 
 # State های اطلاعات کاربر
 FULL_NAME, ADDRESS_TEXT, PHONE_NUMBER = range(6, 9)
+
+# State ارسال همگانی (ادمین)
+BROADCAST_MESSAGE = 9
@@ -0,0 +1,146 @@
+"""
+ارتقای دیتابیس نسخه اولیه ربات (بدون user_version) تا آخرین مایگریشن
+"""
+import json
+import sqlite3
+
+from database import Database
+
+# جداول دیتابیس قبل از مایگریشن‌های نسخه‌دار - آیتم‌های سفارش JSON در ستون items
+BASELINE_SCHEMA = """
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        photo_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE packs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL
+    );
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        full_name TEXT,
+        phone TEXT,
+        landline_phone TEXT,
+        address TEXT,
+        shop_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE cart (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        product_id INTEGER,
+        pack_id INTEGER,
+        quantity INTEGER DEFAULT 1
+    );
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        items TEXT,
+        total_price REAL,
+        status TEXT DEFAULT 'pending',
+        receipt_photo TEXT,
+        shipping_method TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+CONFIRMED_ITEMS = [
+    {'product': 'Tea', 'pack': 'Small', 'quantity': 2, 'price': 200},
+    {'product': 'Tea', 'pack': 'Large', 'quantity': 1, 'price': 450},
+]
+
+
+def create_baseline(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO products (id, name) VALUES (1, 'Tea')")
+    conn.executemany(
+        "INSERT INTO packs (id, product_id, name, quantity, price) VALUES (?, 1, ?, ?, ?)",
+        [(1, 'Small', 10, 100), (2, 'Large', 50, 450)]
+    )
+    conn.executemany("INSERT INTO users (user_id, username) VALUES (?, ?)", [(1, 'a'), (2, 'b')])
+    # ردیف‌های تکراری سبد که نسخه اولیه می‌ساخت
+    conn.executemany(
+        "INSERT INTO cart (user_id, product_id, pack_id, quantity) VALUES (?, ?, ?, ?)",
+        [(1, 1, 1, 1), (1, 1, 1, 2), (2, 1, 2, 1)]
+    )
+    conn.executemany(
+        "INSERT INTO orders (id, user_id, items, total_price, status) VALUES (?, ?, ?, ?, ?)",
+        [
+            (1, 1, json.dumps(CONFIRMED_ITEMS), 650, 'confirmed'),
+            (2, 2, json.dumps([{'product': 'Gone', 'pack': 'Old', 'quantity': 1, 'price': 80}]), 80, 'pending'),
+            (3, 2, 'not json', 10, 'pending'),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_upgrades_to_latest(tmp_path):
+    path = str(tmp_path / "t.db")
+    create_baseline(path)
+    
+    db = Database(path)
+    try:
+        assert db.conn.execute("PRAGMA user_version").fetchone()[0] == 6
+        
+        # آیتم‌های JSON به order_items منتقل شده‌اند و شناسه‌ها از روی نام پیدا شده‌اند
+        items = db.get_order_items(1)
+        assert [(item['product_id'], item['pack_id'], item['quantity'], item['price']) for item in items] == [
+            (1, 1, 2, 200),
+            (1, 2, 1, 450),
+        ]
+        assert [(item['product_id'], item['product'], item['price']) for item in db.get_order_items(2)] == [
+            (None, 'Gone', 80),
+        ]
+        assert db.get_order_items(3) == []
+        
+        # ستون items دست نخورده می‌ماند، حتی برای JSON خراب
+        stored = dict(db.conn.execute("SELECT id, items FROM orders").fetchall())
+        assert json.loads(stored[1]) == CONFIRMED_ITEMS
+        assert stored[3] == 'not json'
+        
+        # ردیف‌های تکراری سبد ادغام شده‌اند
+        assert db.conn.execute("SELECT user_id, pack_id, quantity FROM cart ORDER BY user_id").fetchall() == [
+            (1, 1, 3),
+            (2, 2, 1),
+        ]
+        
+        assert db.get_user(1) is not None
+        assert db.conn.execute("SELECT COUNT(*) FROM users WHERE blocked = 0").fetchone()[0] == 2
+        
+        # شمارنده‌ها و rollup ها از داده‌های موجود مقداردهی شده‌اند
+        assert db.check_statistics() == {}
+        statistics = db.get_statistics()
+        assert statistics['total_orders'] == 3
+        assert statistics['pending_orders'] == 2
+        assert statistics['total_income'] == 650
+        assert db.conn.execute(
+            "SELECT product_name, pack_name, packs_sold, revenue FROM sales_by_pack ORDER BY pack_name"
+        ).fetchall() == [('Tea', 'Large', 1, 450), ('Tea', 'Small', 2, 200)]
+        
+        assert db.check_query_plans() == {}
+    finally:
+        db.close()
+
+
+def test_reopening_migrated_database_keeps_data(tmp_path):
+    path = str(tmp_path / "t.db")
+    create_baseline(path)
+    Database(path).close()
+    
+    db = Database(path)
+    try:
+        assert db.conn.execute("PRAGMA user_version").fetchone()[0] == 6
+        # مایگریشن آیتم‌ها دوباره اجرا نمی‌شود
+        assert len(db.get_order_items(1)) == 2
+    finally:
+        db.close()
@@ -0,0 +1,12 @@
+"""
+بررسی پلن کوئری‌های پرکاربرد روی دیتابیس تازه با همه migration ها
+"""
+from database import Database
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    db = Database(str(tmp_path / "t.db"))
+    try:
+        assert db.check_query_plans() == {}
+    finally:
+        db.close()
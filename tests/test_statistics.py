@@ -0,0 +1,103 @@
+"""
+سازگاری تریگرهای شمارنده آمار و rollup های فروش در جریان تایید، حذف آیتم و رد سفارش
+"""
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "t.db"))
+    yield db
+    db.close()
+
+
+def sales_rollups(db):
+    """محتوای rollup های فروش - برای مقایسه با ساخت دوباره از روی جداول اصلی"""
+    return (
+        db.conn.execute("SELECT day, orders, revenue, packs FROM sales_daily WHERE orders ORDER BY day").fetchall(),
+        db.conn.execute("""
+            SELECT product_name, pack_name, packs_sold, revenue FROM sales_by_pack
+            WHERE packs_sold ORDER BY product_name, pack_name
+        """).fetchall(),
+    )
+
+
+def assert_consistent(db):
+    assert db.check_statistics() == {}
+    stored = sales_rollups(db)
+    db.rebuild_statistics()
+    assert sales_rollups(db) == stored
+
+
+def place_order(db, user_id, packs):
+    """ثبت سفارش از سبد - packs لیست (محصول, پک, تعداد)"""
+    db.add_user(user_id, f"user{user_id}", "Test")
+    for product_id, pack_id, quantity in packs:
+        db.add_to_cart(user_id, product_id, pack_id, quantity)
+    return db.create_order(user_id)
+
+
+@pytest.fixture
+def catalog(db):
+    product_id = db.add_product("Tea", "", None)
+    small = db.add_pack(product_id, "Small", 10, 100)
+    large = db.add_pack(product_id, "Large", 50, 450)
+    return product_id, small, large
+
+
+def test_confirm_updates_counters_and_rollups(db, catalog):
+    product_id, small, large = catalog
+    order_id = place_order(db, 1, [(product_id, small, 2), (product_id, large, 1)])
+    assert_consistent(db)
+    assert db.get_statistics()['pending_orders'] == 1
+    
+    db.update_order_status(order_id, 'waiting_payment')
+    db.update_order_status(order_id, 'confirmed')
+    assert_consistent(db)
+    
+    statistics = db.get_statistics()
+    assert statistics['pending_orders'] == 0
+    assert statistics['total_income'] == 650
+    assert db.get_sales_report()['current_revenue'] == 650
+
+
+def test_remove_item_after_confirm(db, catalog):
+    product_id, small, large = catalog
+    order_id = place_order(db, 1, [(product_id, small, 2), (product_id, large, 1)])
+    db.update_order_status(order_id, 'confirmed')
+    
+    item = next(item for item in db.get_order_items(order_id) if item['pack_id'] == large)
+    assert db.remove_order_item(order_id, item['id']) == 200
+    assert_consistent(db)
+    assert db.get_statistics()['total_income'] == 200
+
+
+def test_remove_item_then_reject(db, catalog):
+    product_id, small, large = catalog
+    order_id = place_order(db, 1, [(product_id, small, 2), (product_id, large, 1)])
+    other_id = place_order(db, 2, [(product_id, large, 2)])
+    db.update_order_status(other_id, 'confirmed')
+    
+    item = next(item for item in db.get_order_items(order_id) if item['pack_id'] == small)
+    db.remove_order_item(order_id, item['id'])
+    assert_consistent(db)
+    
+    db.update_order_status(order_id, 'rejected')
+    assert_consistent(db)
+    
+    statistics = db.get_statistics()
+    assert statistics['total_orders'] == 2
+    assert statistics['pending_orders'] == 0
+    assert statistics['total_income'] == 900
+
+
+def test_reject_confirmed_order(db, catalog):
+    product_id, small, _large = catalog
+    order_id = place_order(db, 1, [(product_id, small, 3)])
+    db.update_order_status(order_id, 'confirmed')
+    db.update_order_status(order_id, 'rejected')
+    assert_consistent(db)
+    assert db.get_statistics()['total_income'] == 0
+    assert sales_rollups(db) == ([], [])
@@ -0,0 +1,86 @@
+"""
+تراکنش‌های تو در تو: SAVEPOINT برگشت خورده نوشتن‌ها و callback های بعد از commit خودش را دور می‌ریزد
+"""
+import pytest
+
+from database import Database
+
+
+class Boom(Exception):
+    pass
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "t.db"))
+    yield db
+    db.close()
+
+
+def product_names(db):
+    return [row[0] for row in db.conn.execute("SELECT name FROM products ORDER BY id")]
+
+
+def test_savepoint_rollback_discards_writes_and_callbacks(db):
+    calls = []
+    with db.transaction():
+        db.add_product("outer", "", None)
+        db._after_commit(lambda: calls.append("outer"))
+        
+        with pytest.raises(Boom):
+            with db.transaction():
+                db.add_product("inner", "", None)
+                db._after_commit(lambda: calls.append("inner"))
+                raise Boom
+        
+        db._after_commit(lambda: calls.append("after"))
+        # هنوز commit نشده
+        assert calls == []
+    
+    assert product_names(db) == ["outer"]
+    assert calls == ["outer", "after"]
+    # callback کش کاتالوگ محصول برگشت خورده هم اجرا نشده است
+    assert [product.name for product in db.get_all_products()] == ["outer"]
+
+
+def test_released_savepoint_keeps_callbacks(db):
+    calls = []
+    with db.transaction():
+        with db.transaction():
+            db.add_product("inner", "", None)
+            db._after_commit(lambda: calls.append("inner"))
+    
+    assert product_names(db) == ["inner"]
+    assert calls == ["inner"]
+
+
+def test_nested_savepoints_roll_back_only_their_level(db):
+    calls = []
+    with db.transaction():
+        with db.transaction():
+            db._after_commit(lambda: calls.append("level 2"))
+            with pytest.raises(Boom):
+                with db.transaction():
+                    db._after_commit(lambda: calls.append("level 3"))
+                    raise Boom
+            db._after_commit(lambda: calls.append("level 2 again"))
+    
+    assert calls == ["level 2", "level 2 again"]
+
+
+def test_outer_rollback_discards_everything(db):
+    calls = []
+    with pytest.raises(Boom):
+        with db.transaction():
+            db.add_product("outer", "", None)
+            with db.transaction():
+                db._after_commit(lambda: calls.append("inner"))
+            raise Boom
+    
+    assert product_names(db) == []
+    assert calls == []
+    
+    # تراکنش بعدی عادی کار می‌کند
+    with db.transaction():
+        db._after_commit(lambda: calls.append("next"))
+    assert calls == ["next"]
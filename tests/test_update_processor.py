@@ -0,0 +1,78 @@
+"""
+KeyedUpdateProcessor: آپدیت‌های یک کاربر به ترتیب رسیدن و کاربرهای مختلف هم‌زمان اجرا می‌شوند
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from update_processor import KeyedUpdateProcessor
+
+_update_ids = iter(range(1, 1_000_000))
+
+
+def text_update(user_id, text="hi"):
+    """آپدیت پیام متنی از یک کاربر در چت خصوصی خودش"""
+    user = User(user_id, f"user{user_id}", False)
+    message = Message(
+        next(_update_ids), datetime.now(timezone.utc), Chat(user_id, Chat.PRIVATE), from_user=user, text=text
+    )
+    return Update(next(_update_ids), message=message)
+
+
+def test_updates_of_one_user_run_in_arrival_order():
+    async def main():
+        processor = KeyedUpdateProcessor(workers=8)
+        log = []
+        
+        async def handle(user_id, number, delay):
+            log.append((user_id, number, 'start'))
+            await asyncio.sleep(delay)
+            log.append((user_id, number, 'end'))
+        
+        # آپدیت‌های اول کندترند - بدون قفل کلید، بعدی‌ها زودتر تمام می‌شدند
+        calls = []
+        for number in range(5):
+            for user_id in (1, 2):
+                delay = 0.01 * (5 - number)
+                calls.append(processor.process_update(text_update(user_id), handle(user_id, number, delay)))
+        await asyncio.gather(*calls)
+        return processor, log
+    
+    processor, log = asyncio.run(main())
+    
+    for user_id in (1, 2):
+        events = [(number, event) for uid, number, event in log if uid == user_id]
+        # هر آپدیت قبل از شروع بعدی تمام شده است
+        assert events == [(number, event) for number in range(5) for event in ('start', 'end')]
+    
+    stats = processor.stats()
+    assert stats['processed'] == 10
+    assert stats['serialized'] == 8
+    assert stats['keys'] == 0
+    # دو کاربر هم‌زمان اجرا شده‌اند
+    assert stats['peak_running'] == 2
+
+
+def test_failed_update_does_not_block_the_next_one():
+    async def main():
+        processor = KeyedUpdateProcessor(workers=2)
+        log = []
+        
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("handler error")
+        
+        async def record():
+            log.append('second')
+        
+        first = asyncio.ensure_future(processor.process_update(text_update(1), fail()))
+        second = asyncio.ensure_future(processor.process_update(text_update(1), record()))
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        return processor, log, results
+    
+    processor, log, results = asyncio.run(main())
+    assert isinstance(results[0], RuntimeError)
+    assert log == ['second']
+    assert processor.stats()['running'] == 0
+    assert processor.stats()['keys'] == 0
@@ -0,0 +1,144 @@
+"""
+واحد کار هر آپدیت: identity map ردیف‌های دیتابیس و شمارش کوئری‌ها
+
+یک هندلر در گروه اول برای هر آپدیت UnitOfWork جدید باز می‌کند و یک هندلر در
+گروه آخر آن را می‌بندد. AsyncDatabase تا وقتی واحد کار باز است سفارش‌ها، کاربرها
+و پک‌های خوانده شده را نگه می‌دارد، پس یک آپدیت هیچ ردیفی را دو بار نمی‌خواند.
+"""
+import contextvars
+import logging
+import re
+
+from telegram.ext import CallbackQueryHandler, CommandHandler, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# آپدیتی که بیشتر از این تعداد کوئری بزند در لاگ هشدار می‌گیرد
+QUERY_WARNING_THRESHOLD = 15
+
+_current = contextvars.ContextVar('unit_of_work', default=None)
+
+# آمار تجمعی هر نوع آپدیت: نام -> [تعداد آپدیت, مجموع کوئری, بیشترین کوئری]
+_query_stats = {}
+
+# نام‌های مجاز آمار از روی هندلرهای ثبت شده - دستور یا callback_data ناشناخته زیر
+# command:other و callback:other می‌رود تا ورودی کاربر کلید تازه نسازد
+_commands = set()
+_callback_patterns = []  # (regex, نام)
+
+
+class UnitOfWork:
+    """identity map و شمارنده کوئری یک آپدیت"""
+    
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.hits = 0
+        self._rows = {}
+    
+    def get(self, kind, key):
+        """ردیف از identity map - (True, ردیف) در hit و (False, None) در miss"""
+        try:
+            row = self._rows[kind, key]
+        except KeyError:
+            return False, None
+        self.hits += 1
+        return True, row
+    
+    def put(self, kind, key, row):
+        self._rows[kind, key] = row
+    
+    def forget(self, kind):
+        """حذف همه ردیف‌های یک نوع - بعد از نوشتنی که ممکن است آن‌ها را کهنه کرده باشد"""
+        for stored_kind, key in [k for k in self._rows if k[0] == kind]:
+            del self._rows[stored_kind, key]
+
+
+def current():
+    """واحد کار آپدیت فعلی - بیرون از آپدیت None"""
+    return _current.get()
+
+
+def _walk_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _walk_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _walk_handlers(state_handlers)
+            yield from _walk_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def register_handlers(application):
+    """ساخت لیست نام‌های مجاز آمار از دستورها و الگوهای callback ثبت شده در application"""
+    _commands.clear()
+    _callback_patterns.clear()
+    for group in application.handlers.values():
+        for handler in _walk_handlers(group):
+            if isinstance(handler, CommandHandler):
+                _commands.update(handler.commands)
+            elif isinstance(handler, CallbackQueryHandler) and isinstance(handler.pattern, re.Pattern):
+                # بخش ثابت ابتدای الگو: "^select_pack:" -> select_pack
+                name = re.match(r"\^?(\w*)", handler.pattern.pattern).group(1).rstrip("_") or "other"
+                _callback_patterns.append((handler.pattern, name))
+
+
+def describe(update):
+    """نام کوتاه آپدیت برای آمار - الگوی callback، دستور یا نوع پیام"""
+    query = getattr(update, 'callback_query', None)
+    if query and query.data:
+        for pattern, name in _callback_patterns:
+            if pattern.match(query.data):
+                return "callback:" + name
+        return "callback:other"
+    message = getattr(update, 'effective_message', None)
+    if message is None:
+        return "other"
+    if message.text and message.text.startswith("/"):
+        command = message.text.split()[0][1:].split("@")[0].lower()
+        return "command:/" + command if command in _commands else "command:other"
+    if message.photo:
+        return "photo"
+    return "message"
+
+
+def begin(update):
+    """شروع واحد کار جدید - واحد کار باز مانده از آپدیت قبلی کنار گذاشته می‌شود"""
+    _current.set(UnitOfWork(describe(update)))
+
+
+def end():
+    """بستن واحد کار فعلی و ثبت تعداد کوئری‌های آن"""
+    unit = _current.get()
+    if unit is None:
+        return
+    _current.set(None)
+    
+    stats = _query_stats.setdefault(unit.name, [0, 0, 0])
+    stats[0] += 1
+    stats[1] += unit.queries
+    stats[2] = max(stats[2], unit.queries)
+    
+    if unit.queries > QUERY_WARNING_THRESHOLD:
+        logger.warning(f"{unit.name}: {unit.queries} کوئری در یک آپدیت ({unit.hits} از identity map)")
+    else:
+        logger.debug(f"{unit.name}: {unit.queries} کوئری ({unit.hits} از identity map)")
+
+
+def query_stats():
+    """آمار کوئری هر نوع آپدیت: لیست (نام, تعداد آپدیت, میانگین کوئری, بیشترین کوئری)"""
+    return sorted(
+        ((name, count, total / count, peak) for name, (count, total, peak) in _query_stats.items()),
+        key=lambda row: -row[2]
+    )
+
+
+# ==================== هندلرهای شروع و پایان ====================
+
+async def begin_handler(update, context):
+    begin(update)
+
+
+async def end_handler(update, context):
+    end()
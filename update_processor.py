@@ -0,0 +1,252 @@
+"""
+پردازش هم‌زمان آپدیت‌ها با حفظ ترتیب آپدیت‌های هر کاربر و lane های اولویت
+
+به عنوان concurrent_updates به Application داده می‌شود. آپدیت‌های کاربرهای مختلف
+هم‌زمان روی حداکثر workers جایگاه اجرا می‌شوند، پس هندلر کند یک کاربر (مثل
+ارسال محصول به کانال یا لیست محصولات با عکس) بقیه را منتظر نمی‌گذارد. آپدیت‌های
+یک کاربر (یا یک چت، وقتی کاربر ندارد) پشت سر هم و به همان ترتیب رسیدن اجرا
+می‌شوند؛ ConversationHandler ها، user_data و تغییرات سبد خرید همان رفتار پردازش
+ترتیبی را می‌بینند.
+
+هر آپدیت در یک lane قرار می‌گیرد و جایگاه آزاد اول به lane بالاتر می‌رسد:
+
+- admin: هر آپدیت ادمین
+- payment: رسید، تایید/رد پرداخت، نهایی کردن سفارش و انتخاب نحوه ارسال
+- cart: کلیک پک‌ها و سبد خرید
+- info: منوها و بقیه آپدیت‌ها
+
+lane های مشتری (cart و info) روی هم حداکثر workers - RESERVED_SLOTS جایگاه
+می‌گیرند، پس وقتی صدها کلیک پک بعد از انتشار محصول می‌رسد همیشه جایی برای ادمین
+و پرداخت‌ها خالی است. آپدیتی که منتظر آپدیت قبلی همان کاربر است جایگاه اجرا
+نمی‌گیرد.
+"""
+import asyncio
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import ADMIN_ID
+
+# سقف آپدیت‌های پذیرفته شده - Application برای هر آپدیت در هر حال یک تسک می‌سازد؛
+# سقف بزرگ است تا آپدیت ادمین پشت صف FIFO خود PTB نماند و lane ها ترتیب را تعیین کنند
+MAX_PENDING_UPDATES = 10_000
+
+# lane ها به ترتیب اولویت
+LANES = ('admin', 'payment', 'cart', 'info')
+
+# lane هایی که جایگاه‌های رزرو شده را هم می‌گیرند
+RESERVED_LANES = ('admin', 'payment')
+
+# جایگاه‌هایی که lane های مشتری (cart و info) نمی‌گیرند
+RESERVED_SLOTS = 2
+
+# پیشوند callback_data هر lane - بقیه callback ها info هستند
+PAYMENT_CALLBACKS = (
+    'confirm_payment:', 'reject_payment:', 'receipt_for:', 'ship_',
+    'finalize_order', 'final_confirm', 'confirm_user_info',
+)
+CART_CALLBACKS = ('select_pack:', 'back_to_packs:', 'view_cart', 'remove_cart:', 'clear_cart')
+CART_TEXTS = ("🛒 سبد خرید",)
+
+
+def update_key(update):
+    """کلید ترتیب یک آپدیت - آپدیت‌های با کلید برابر پشت سر هم اجرا می‌شوند"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return 'user', update.effective_user.id
+        if update.effective_chat:
+            return 'chat', update.effective_chat.id
+    # آپدیت بدون کاربر و چت (مثل poll) محدودیت ترتیب ندارد
+    return None
+
+
+def update_lane(update):
+    """lane اولویت یک آپدیت"""
+    if not isinstance(update, Update):
+        return 'info'
+    user = update.effective_user
+    if user and user.id == ADMIN_ID:
+        return 'admin'
+    
+    query = update.callback_query
+    if query:
+        data = query.data or ""
+        if data.startswith(PAYMENT_CALLBACKS):
+            return 'payment'
+        if data.startswith(CART_CALLBACKS):
+            return 'cart'
+        return 'info'
+    
+    message = update.effective_message
+    if message:
+        # عکسی که کاربر می‌فرستد رسید پرداخت است
+        if message.photo:
+            return 'payment'
+        if message.text in CART_TEXTS:
+            return 'cart'
+    return 'info'
+
+
+class Lane:
+    """صف انتظار و آمار یک lane"""
+    __slots__ = ('name', 'order', 'reserved', 'waiting', 'running', 'processed',
+                 'peak_waiting', 'wait_total', 'wait_max')
+    
+    def __init__(self, name, order, reserved):
+        self.name = name
+        self.order = order
+        self.reserved = reserved
+        # future های منتظر جایگاه به ترتیب ورود
+        self.waiting = deque()
+        self.running = 0
+        self.processed = 0
+        self.peak_waiting = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    def stats(self):
+        return {
+            'waiting': len(self.waiting),
+            'peak_waiting': self.peak_waiting,
+            'running': self.running,
+            'processed': self.processed,
+            'average_wait': self.wait_total / self.processed if self.processed else 0.0,
+            'max_wait': self.wait_max,
+        }
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    پردازشگر آپدیت با سقف workers اجرای هم‌زمان، ترتیب ثابت برای هر کلید و lane های اولویت
+    
+    lane_of تابع انتخاب lane است؛ با lane_of=lambda update: 'info' و reserved=0 همه
+    آپدیت‌ها در یک صف FIFO می‌روند (رفتار بدون lane).
+    """
+    
+    def __init__(self, workers, max_pending=MAX_PENDING_UPDATES, lane_of=update_lane, reserved=RESERVED_SLOTS):
+        # سمافور خود PTB سقف آپدیت‌های پذیرفته شده است، نه آپدیت‌های در حال اجرا
+        super().__init__(max(max_pending, workers))
+        self.workers = workers
+        self.customer_workers = max(1, workers - reserved)
+        self.lane_of = lane_of
+        self.lanes = {name: Lane(name, order, name in RESERVED_LANES) for order, name in enumerate(LANES)}
+        self.running = 0
+        self.customer_running = 0
+        
+        # کلید -> [قفل, تعداد آپدیت‌های در حال اجرا یا منتظر]
+        self._keys = {}
+        
+        # آمار
+        self.processed = 0
+        self.peak_running = 0
+        self.serialized = 0
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    async def do_process_update(self, update, coroutine):
+        lane = self.lanes[self.lane_of(update)]
+        key = update_key(update)
+        if key is None:
+            await self._run(lane, coroutine)
+            return
+        
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = [asyncio.Lock(), 0]
+        else:
+            # آپدیت قبلی همین کلید هنوز تمام نشده است
+            self.serialized += 1
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(lane, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._keys[key]
+    
+    async def _run(self, lane, coroutine):
+        await self._acquire(lane)
+        try:
+            await coroutine
+        finally:
+            self._release(lane)
+    
+    # ==================== جایگاه‌های اجرا ====================
+    
+    def _can_start(self, lane):
+        if self.running >= self.workers:
+            return False
+        return lane.reserved or self.customer_running < self.customer_workers
+    
+    def _start(self, lane):
+        lane.running += 1
+        self.running += 1
+        if not lane.reserved:
+            self.customer_running += 1
+        self.peak_running = max(self.peak_running, self.running)
+    
+    def _release(self, lane):
+        lane.running -= 1
+        lane.processed += 1
+        self.running -= 1
+        self.processed += 1
+        if not lane.reserved:
+            self.customer_running -= 1
+        self._wake()
+    
+    def _wake(self):
+        """دادن جایگاه‌های آزاد به منتظرها - lane بالاتر اول"""
+        for lane in self.lanes.values():
+            while lane.waiting and self._can_start(lane):
+                future = lane.waiting.popleft()
+                if future.cancelled():
+                    continue
+                self._start(lane)
+                future.set_result(None)
+            if self.running >= self.workers:
+                return
+    
+    async def _acquire(self, lane):
+        """صبر تا گرفتن جایگاه اجرا در lane"""
+        start = time.perf_counter()
+        
+        # مسیر سریع: جایگاه آزاد و هیچ منتظری در همین lane یا lane های بالاتر
+        ahead = any(other.waiting for other in self.lanes.values() if other.order <= lane.order)
+        if not ahead and self._can_start(lane):
+            self._start(lane)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            lane.waiting.append(future)
+            lane.peak_waiting = max(lane.peak_waiting, len(lane.waiting))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # جایگاهی که هم‌زمان با لغو داده شده پس داده می‌شود
+                if future.done() and not future.cancelled():
+                    self._release(lane)
+                raise
+        
+        waited = time.perf_counter() - start
+        lane.wait_total += waited
+        lane.wait_max = max(lane.wait_max, waited)
+    
+    # ==================== آمار ====================
+    
+    def stats(self):
+        """آمار پردازش هم‌زمان و صف هر lane"""
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'running': self.running,
+            'peak_running': self.peak_running,
+            'serialized': self.serialized,
+            'keys': len(self._keys),
+            'lanes': {name: lane.stats() for name, lane in self.lanes.items()},
+        }
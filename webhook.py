@@ -0,0 +1,124 @@
+"""
+دریافت آپدیت‌ها با webhook به جای run_polling
+
+یک سرور aiohttp داخل همان حلقه رویداد ربات اجرا می‌شود:
+
+- POST {WEBHOOK_PATH}: آپدیت تلگرام - هدر X-Telegram-Bot-Api-Secret-Token باید با
+  توکن مخفی یکی باشد؛ آپدیت فقط در update_queue گذاشته می‌شود و پاسخ بلافاصله
+  برمی‌گردد، پس تلگرام منتظر اجرای هندلرها نمی‌ماند.
+- GET /health: وضعیت برای مانیتورینگ
+
+فقط یک نمونه ربات پشت این آدرس پشتیبانی می‌شود: کش کاتالوگ، کاربران شناخته شده،
+قفل‌های ترتیب هر کاربر در KeyedUpdateProcessor، user_data و وضعیت
+ConversationHandler ها، bot_data و فایل SQLite همه داخل یک پروسه یا روی یک ماشین
+هستند و نمونه دوم داده کهنه می‌بیند و گفتگوها را می‌شکند. TLS معمولاً روی reverse
+proxy (مثلاً nginx) انجام می‌شود.
+"""
+import asyncio
+import hmac
+import logging
+import re
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH = "/health"
+
+# کاراکترهای مجاز secret_token در set_webhook
+SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def webhook_secret(secret=WEBHOOK_SECRET):
+    """توکن مخفی webhook - در حالت webhook باید در config تنظیم شده باشد"""
+    if not secret:
+        raise ValueError("WEBHOOK_SECRET در config تنظیم نشده است")
+    if not SECRET_PATTERN.fullmatch(secret):
+        raise ValueError("WEBHOOK_SECRET فقط می‌تواند حروف انگلیسی، عدد، _ و - باشد (حداکثر ۲۵۶ کاراکتر)")
+    return secret
+
+
+def make_webhook_app(application, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    """ساخت اپلیکیشن aiohttp با مسیر آپدیت و مسیر سلامت"""
+    secret = webhook_secret(secret).encode()
+    
+    async def receive_update(request):
+        received = request.headers.get(SECRET_HEADER, "").encode()
+        if not hmac.compare_digest(received, secret):
+            logger.warning(f"درخواست webhook با توکن نامعتبر از {request.remote}")
+            return web.Response(status=403)
+        
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        
+        update = Update.de_json(data, application.bot)
+        if update is None:
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+    
+    async def health(request):
+        status = 200 if application.running else 503
+        return web.json_response({
+            'status': 'ok' if application.running else 'stopped',
+            'queued_updates': application.update_queue.qsize(),
+        }, status=status)
+    
+    app = web.Application()
+    app.router.add_post(path, receive_update)
+    app.router.add_get(HEALTH_PATH, health)
+    return app
+
+
+async def serve_webhook(application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, url=WEBHOOK_URL,
+                        path=WEBHOOK_PATH, stop_event=None, secret=WEBHOOK_SECRET):
+    """
+    اجرای ربات در حالت webhook تا رسیدن سیگنال توقف (یا set شدن stop_event)
+    
+    url خالی یعنی webhook از قبل تنظیم شده و set_webhook صدا زده نمی‌شود.
+    """
+    # بدون توکن مخفی قبل از بالا آمدن ربات متوقف می‌شویم
+    secret = webhook_secret(secret)
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    
+    runner = web.AppRunner(make_webhook_app(application, path, secret))
+    # hook های post_* فقط در run_polling و run_webhook خود PTB خودکار صدا زده می‌شوند
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        if url:
+            await application.bot.set_webhook(
+                url.rstrip("/") + path,
+                secret_token=secret,
+                allowed_updates=Update.ALL_TYPES
+            )
+        await application.start()
+        
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        logger.info(f"🌐 webhook روی {listen}:{port}{path}")
+        try:
+            await stop_event.wait()
+        finally:
+            await runner.cleanup()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+def run_webhook(application):
+    """نقطه شروع همگام - جایگزین application.run_polling"""
+    asyncio.run(serve_webhook(application))